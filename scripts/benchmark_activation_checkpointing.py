@@ -0,0 +1,102 @@
+"""
+Compare the activation memory and the training throughput of
+ConvolutionalVQVAE with and without activation checkpointing, for
+several batch sizes.
+
+The activation memory is the size of the tensors saved for the backward
+pass by autograd, except the parameters (on any device), and the peak
+memory allocated on cuda.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_activation_checkpointing.py
+"""
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import time
+import torch
+import yaml
+
+
+def training_step(model, inputs, speaker_id):
+    reconstructed_x, vq_output = model(inputs, None, speaker_id)
+    loss = vq_output.vq_loss + torch.mean(reconstructed_x ** 2)
+    loss.backward()
+
+def saved_activations_size(model, inputs, speaker_id):
+    parameters = set(parameter.untyped_storage().data_ptr() for parameter in model.parameters())
+    storages = dict()
+    def pack(tensor):
+        if tensor.untyped_storage().data_ptr() not in parameters:
+            storages[tensor.untyped_storage().data_ptr()] = tensor.untyped_storage().nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        reconstructed_x, vq_output = model(inputs, None, speaker_id)
+    return sum(storages.values())
+
+def peak_memory(model, inputs, speaker_id, device):
+    if not device.startswith('cuda'):
+        return float('nan')
+    torch.cuda.synchronize()
+    torch.cuda.reset_peak_memory_stats()
+    training_step(model, inputs, speaker_id)
+    torch.cuda.synchronize()
+    return torch.cuda.max_memory_allocated()
+
+def step_time(model, inputs, speaker_id, device, repetitions):
+    training_step(model, inputs, speaker_id) # Warm up
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        model.zero_grad(set_to_none=True)
+        training_step(model, inputs, speaker_id)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repetitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--configuration_path', type=str, default='../configurations/vctk_features.yaml')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[2, 8, 16])
+    parser.add_argument('--num_frames', type=int, default=160, help='Number of input feature frames')
+    parser.add_argument('--repetitions', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.configuration_path, 'r') as configuration_file:
+        configuration = yaml.safe_load(configuration_file)
+
+    ConsoleLogger.status('Training steps of {} frames on {}'.format(args.num_frames, args.device))
+    print('{:>10} | {:>13} | {:>16} | {:>14} | {:>14} | {:>9}'.format('batch_size', 'checkpointing',
+        'activations (MB)', 'peak (MB)', 'samples/sec', 'grad diff'))
+    for batch_size in args.batch_sizes:
+        expected_gradients = None
+        for use_activation_checkpointing in [False, True]:
+            configuration['use_activation_checkpointing'] = use_activation_checkpointing
+            torch.manual_seed(1234)
+            model = ConvolutionalVQVAE(configuration, args.device).to(args.device).train()
+            inputs = torch.randn(batch_size, args.num_frames, model.encoder.features_filters, device=args.device)
+            speaker_id = torch.zeros(batch_size, 1, dtype=torch.long, device=args.device)
+
+            activations_size = saved_activations_size(model, inputs, speaker_id)
+            peak = peak_memory(model, inputs, speaker_id, args.device)
+
+            # Same gradients of a single step, from the same initial state
+            torch.manual_seed(1234)
+            model = ConvolutionalVQVAE(configuration, args.device).to(args.device).train()
+            training_step(model, inputs, speaker_id)
+            gradients = [parameter.grad.clone() for parameter in model.parameters() if parameter.grad is not None]
+            if expected_gradients is None:
+                expected_gradients = gradients
+            difference = max((gradient - expected).abs().max().item()
+                for gradient, expected in zip(gradients, expected_gradients))
+
+            samples_per_second = batch_size / step_time(model, inputs, speaker_id, args.device, args.repetitions)
+            print('{:>10} | {:>13} | {:>16.1f} | {:>14.1f} | {:>14.1f} | {:>9.1e}'.format(batch_size,
+                str(use_activation_checkpointing), activations_size / 2**20, peak / 2**20, samples_per_second,
+                difference))
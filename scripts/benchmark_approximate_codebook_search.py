@@ -0,0 +1,70 @@
+"""
+Compare the encode time of the exhaustive codebook search against the
+inverted file one for bulk tokenization (VectorQuantizer in eval mode,
+without gradient), and report the recall@1 of the approximate search.
+
+The frames are sampled around the codebook vectors, as a trained codebook
+lies close to the encoded frames.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_approximate_codebook_search.py --device cpu
+"""
+
+from models.vector_quantizer import VectorQuantizer
+from modules.codebook_search import CodebookSearch, InvertedFileCodebookSearch
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import time
+import torch
+
+
+def encode_time(vq, inputs, device, repetitions):
+    with torch.no_grad():
+        vq(inputs) # Warm up (and build of the inverted file)
+        if device.startswith('cuda'):
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            vq(inputs)
+        if device.startswith('cuda'):
+            torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repetitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num_frames', type=int, default=16384, help='Number of frames (B x T) encoded at each call')
+    parser.add_argument('--embedding_dim', type=int, default=64)
+    parser.add_argument('--noise', type=float, default=0.5, help='Std of the frames around the codebook vectors')
+    parser.add_argument('--num_lists', type=int, nargs='+', default=[64])
+    parser.add_argument('--num_probes', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--repetitions', type=int, default=10)
+    parser.add_argument('--num_embeddings', type=int, nargs='+', default=[4096, 8192, 16384])
+    args = parser.parse_args()
+
+    ConsoleLogger.status('{} frames of dimension {} on {}'.format(args.num_frames, args.embedding_dim, args.device))
+    print('{:>6} | {:>24} | {:>16} | {:>9}'.format('K', 'search', 'encode time (ms)', 'recall@1'))
+    for num_embeddings in args.num_embeddings:
+        torch.manual_seed(1234)
+        vq = VectorQuantizer(num_embeddings, args.embedding_dim, 0.25, args.device).to(args.device).eval()
+        weight = vq._embedding.weight
+        with torch.no_grad():
+            weight.normal_()
+        flat_input = weight[torch.randint(0, num_embeddings, (args.num_frames,), device=args.device)].detach() \
+            + args.noise * torch.randn(args.num_frames, args.embedding_dim, device=args.device)
+        # (B, C, T) layout, such as the flattening of the quantizer gives back flat_input
+        inputs = flat_input.reshape(args.embedding_dim, args.num_frames, 1).permute(2, 0, 1)
+
+        vq._codebook_search = CodebookSearch()
+        print('{:>6} | {:>24} | {:>16.2f} | {:>9.4f}'.format(num_embeddings, 'exhaustive',
+            encode_time(vq, inputs, args.device, args.repetitions) * 1000, 1.0))
+
+        for num_lists in args.num_lists:
+            for num_probes in args.num_probes:
+                vq._codebook_search = InvertedFileCodebookSearch(num_lists=num_lists, num_probes=num_probes)
+                elapsed = encode_time(vq, inputs, args.device, args.repetitions)
+                recall = vq._codebook_search.recall_at_1(flat_input, weight)
+                print('{:>6} | {:>24} | {:>16.2f} | {:>9.4f}'.format(num_embeddings,
+                    'inverted_file ({}/{})'.format(num_probes, num_lists), elapsed * 1000, recall))
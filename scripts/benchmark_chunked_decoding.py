@@ -0,0 +1,78 @@
+"""
+Compare the peak memory and the throughput of DeconvolutionalDecoder when
+decoding a long sequence at once against the chunked decoding, per window size.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_chunked_decoding.py --device cpu
+"""
+
+from models.deconvolutional_decoder import DeconvolutionalDecoder
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import multiprocessing
+import resource
+import time
+import torch
+
+
+def measure(window_size, args, queue):
+    torch.manual_seed(1234)
+    decoder = DeconvolutionalDecoder(args.embedding_dim, 13, args.num_hiddens, 2, args.num_hiddens,
+        False, False, 0.12, False, args.device).to(args.device).eval()
+    inputs = torch.randn(1, args.embedding_dim, args.num_frames, device=args.device)
+
+    def decode():
+        with torch.no_grad():
+            if window_size is None:
+                return decoder(inputs, None, None)
+            return decoder.decode_chunked(inputs, None, None, window_size, args.windows_per_batch)
+
+    decode() # Warm up
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        baseline_memory = torch.cuda.memory_allocated()
+
+    start = time.perf_counter()
+    for _ in range(args.repetitions):
+        decode()
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+        peak_memory = torch.cuda.max_memory_allocated() - baseline_memory
+    else:
+        # ru_maxrss of a fresh process, so the warm up already reached the peak
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    decoding_time = (time.perf_counter() - start) / args.repetitions
+
+    queue.put((peak_memory, decoding_time))
+
+def measure_in_subprocess(*args):
+    # A fresh process per measure, so the peak memory of a run doesn't leak in the next one
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=measure, args=args + (queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num_frames', type=int, default=30000, help='Number of latent frames of the sequence')
+    parser.add_argument('--embedding_dim', type=int, default=64)
+    parser.add_argument('--num_hiddens', type=int, default=768)
+    parser.add_argument('--windows_per_batch', type=int, default=16)
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--window_sizes', type=int, nargs='+', default=[64, 256, 1024])
+    args = parser.parse_args()
+
+    memory_label = 'peak memory (MiB)' if args.device.startswith('cuda') else 'max RSS (MiB)'
+    ConsoleLogger.status('{} latent frames of dimension {} on {}'.format(args.num_frames, args.embedding_dim, args.device))
+    print('{:>8} | {:>20} | {:>16} | {:>18}'.format('window', memory_label, 'decoding (ms)', 'frames / s'))
+    for window_size in [None] + args.window_sizes:
+        peak_memory, decoding_time = measure_in_subprocess(window_size, args)
+        print('{:>8} | {:>20.1f} | {:>16.1f} | {:>18.0f}'.format('whole' if window_size is None else window_size,
+            peak_memory / 2**20, decoding_time * 1000, args.num_frames / decoding_time))
@@ -0,0 +1,87 @@
+"""
+Compare the number of epochs needed to reach a target perplexity with the
+random codebook initialization and with the k-means warm start, for
+VectorQuantizer (Adam) and VectorQuantizerEMA.
+
+The encoded frames are simulated by a mixture of gaussians, and each epoch
+is made of --batches_per_epoch batches of --frames_per_batch frames.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_codebook_initialization.py
+"""
+
+from models.vector_quantizer import VectorQuantizer
+from models.vector_quantizer_ema import VectorQuantizerEMA
+from modules.kmeans import KMeans
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import time
+import torch
+import torch.optim as optim
+
+
+def sample_batch(means, frames_per_batch, embedding_dim):
+    components = torch.randint(means.size(0), (frames_per_batch,))
+    flat_input = means[components] + 0.5 * torch.randn(frames_per_batch, embedding_dim)
+    # (B, C, T) layout, such as the flattening of the quantizers gives back flat_input
+    return flat_input.reshape(embedding_dim, frames_per_batch, 1).permute(2, 0, 1)
+
+def epochs_to_target(vq, means, args):
+    optimizer = optim.Adam(vq.parameters(), lr=args.learning_rate) if len(list(vq.parameters())) > 0 else None
+    for epoch in range(args.max_epochs):
+        usage = torch.zeros(args.num_embeddings)
+        for _ in range(args.batches_per_epoch):
+            inputs = sample_batch(means, args.frames_per_batch, args.embedding_dim)
+            vq_output = vq(inputs)
+            if optimizer is not None:
+                optimizer.zero_grad()
+                vq_output.vq_loss.backward()
+                optimizer.step()
+            usage += torch.bincount(vq_output.encoding_indices.view(-1), minlength=args.num_embeddings).float()
+        avg_probs = usage / usage.sum()
+        perplexity = torch.exp(-torch.sum(avg_probs * torch.log(avg_probs + 1e-10))).item()
+        if perplexity >= args.target_perplexity:
+            return epoch + 1, perplexity
+    return None, perplexity
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--num_embeddings', type=int, default=44)
+    parser.add_argument('--embedding_dim', type=int, default=64)
+    parser.add_argument('--num_components', type=int, default=64, help='Number of gaussians of the simulated frames')
+    parser.add_argument('--frames_per_batch', type=int, default=1024)
+    parser.add_argument('--batches_per_epoch', type=int, default=20)
+    parser.add_argument('--initialization_batches', type=int, default=20)
+    parser.add_argument('--target_perplexity', type=float, default=35.0)
+    parser.add_argument('--max_epochs', type=int, default=50)
+    parser.add_argument('--learning_rate', type=float, default=0.0002)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    ConsoleLogger.status('K={}, target perplexity {}, {} frames per epoch'.format(args.num_embeddings,
+        args.target_perplexity, args.frames_per_batch * args.batches_per_epoch))
+    print('{:>18} | {:>14} | {:>18} | {:>16} | {:>8}'.format('quantizer', 'initialization',
+        'epochs to target', 'last perplexity', 'init (s)'))
+    for vq_name in ['VectorQuantizer', 'VectorQuantizerEMA']:
+        for initialization in ['random', 'kmeans']:
+            torch.manual_seed(args.seed)
+            means = 2 * torch.randn(args.num_components, args.embedding_dim)
+            if vq_name == 'VectorQuantizer':
+                vq = VectorQuantizer(args.num_embeddings, args.embedding_dim, 0.25, 'cpu')
+            else:
+                vq = VectorQuantizerEMA(args.num_embeddings, args.embedding_dim, 0.25, 0.99, 'cpu')
+            vq.train()
+
+            start = time.perf_counter()
+            if initialization == 'kmeans':
+                samples = torch.cat([sample_batch(means, args.frames_per_batch, args.embedding_dim).permute(1, 2, 0).contiguous().view(
+                    -1, args.embedding_dim) for _ in range(args.initialization_batches)])
+                centers, cluster_sizes = KMeans.fit(samples, args.num_embeddings)
+                vq.load_codebook(centers, cluster_sizes / args.initialization_batches)
+            initialization_time = time.perf_counter() - start
+
+            epochs, perplexity = epochs_to_target(vq, means, args)
+            print('{:>18} | {:>14} | {:>18} | {:>16.2f} | {:>8.2f}'.format(vq_name, initialization,
+                '> {}'.format(args.max_epochs) if epochs is None else epochs, perplexity, initialization_time))
@@ -0,0 +1,82 @@
+"""
+Compare the peak memory and the step time of the exhaustive codebook search
+against the tiled one, for a training step (forward + backward) of VectorQuantizer.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_codebook_search.py --device cpu
+"""
+
+from models.vector_quantizer import VectorQuantizer
+from modules.codebook_search import CodebookSearch
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import multiprocessing
+import resource
+import time
+import torch
+
+
+def build_inputs(num_frames, embedding_dim, device):
+    # (B, C, T) layout, as outputted by the pre VQ convolution
+    return torch.randn(1, embedding_dim, num_frames, device=device, requires_grad=True)
+
+def run_step(vq, inputs):
+    vq_output = vq(inputs)
+    (vq_output.vq_loss + vq_output.quantized.sum()).backward()
+
+def measure(num_embeddings, tile_size, num_frames, embedding_dim, device, repetitions, queue):
+    torch.manual_seed(1234)
+    vq = VectorQuantizer(num_embeddings, embedding_dim, 0.25, device,
+        codebook_search=CodebookSearch(tile_size=tile_size)).to(device)
+    inputs = build_inputs(num_frames, embedding_dim, device)
+    run_step(vq, inputs) # Warm up
+
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        baseline_memory = torch.cuda.memory_allocated()
+
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        run_step(vq, inputs)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+        peak_memory = torch.cuda.max_memory_allocated() - baseline_memory
+    else:
+        # ru_maxrss of a fresh process, so the warm up step already reached the peak
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    step_time = (time.perf_counter() - start) / repetitions
+
+    queue.put((peak_memory, step_time))
+
+def measure_in_subprocess(*args):
+    # A fresh process per measure, so the peak memory of a run doesn't leak in the next one
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=measure, args=args + (queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num_frames', type=int, default=16384, help='Number of frames (B x T) quantized at each step')
+    parser.add_argument('--embedding_dim', type=int, default=64)
+    parser.add_argument('--tile_size', type=int, default=1024)
+    parser.add_argument('--repetitions', type=int, default=10)
+    parser.add_argument('--num_embeddings', type=int, nargs='+', default=[29, 44, 512, 4096])
+    args = parser.parse_args()
+
+    memory_label = 'peak memory (MiB)' if args.device.startswith('cuda') else 'max RSS (MiB)'
+    ConsoleLogger.status('{} frames of dimension {} on {}'.format(args.num_frames, args.embedding_dim, args.device))
+    print('{:>6} | {:>10} | {:>20} | {:>14}'.format('K', 'search', memory_label, 'step time (ms)'))
+    for num_embeddings in args.num_embeddings:
+        for search_name, tile_size in [('exhaustive', None), ('tiled', args.tile_size)]:
+            peak_memory, step_time = measure_in_subprocess(num_embeddings, tile_size, args.num_frames,
+                args.embedding_dim, args.device, args.repetitions)
+            print('{:>6} | {:>10} | {:>20.1f} | {:>14.2f}'.format(num_embeddings, search_name,
+                peak_memory / 2**20, step_time * 1000))
@@ -0,0 +1,95 @@
+"""
+Measure the throughput (items/sec) of the features export of FeaturesExporter
+for an increasing number of worker processes, against the serial export of a
+single process computing the input and the output features of each item,
+with the features of --features_name (computed by batches of --batch_size
+items by the workers with the torch features). The
+items are synthetic utterances in the format of VCTKDataset, so the benchmark
+measures the features computation and the writes, without the audio decoding.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_features_export.py --workers_numbers 1 2 4 8 16 32
+    PYTHONPATH=. python3 ../scripts/benchmark_features_export.py --features_name torch_mfcc --batch_size 16
+"""
+
+from dataset.features_exporter import FeaturesExporter
+from speech_utils.speech_features import SpeechFeatures
+from error_handling.console_logger import ConsoleLogger
+
+from torch.utils.data import Dataset
+from torch.utils.data.dataloader import default_collate
+from multiprocessing import cpu_count
+import argparse
+import numpy as np
+import os
+import pickle
+import tempfile
+import time
+
+
+class SyntheticSpeechDataset(Dataset):
+
+    def __init__(self, items_number, length=7681):
+        self._items_number = items_number
+        self._length = length
+
+    def __len__(self):
+        return self._items_number
+
+    def __getitem__(self, index):
+        audio = np.random.RandomState(index).randn(self._length).astype(np.float32)
+        return audio.reshape(1, self._length, 1), np.array([]), np.array(index % 109), np.array([]), \
+            'p{}_{:03d}.wav'.format(225 + index % 109, index), 16000, 0.0, 0, self._length - 1, 20
+
+def serial_items_per_second(dataset, features_name):
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        for index in range(len(dataset)):
+            # As the previous export loop, in the main process, computing the input and the output features
+            (preprocessed_audio, one_hot, speaker_id, quantized, wav_filename, sampling_rate, shifting_time,
+                random_starting_index, preprocessed_length, top_db) = default_collate([dataset[index]])
+            output = {
+                'preprocessed_audio': preprocessed_audio,
+                'wav_filename': wav_filename,
+                'input_features': SpeechFeatures.features_from_name(features_name, preprocessed_audio, 16000, 13),
+                'one_hot': np.array([]),
+                'quantized': np.array([]),
+                'speaker_id': speaker_id,
+                'output_features': SpeechFeatures.features_from_name(features_name, preprocessed_audio, 16000, 13),
+                'shifting_time': shifting_time,
+                'random_starting_index': random_starting_index,
+                'preprocessed_length': preprocessed_length,
+                'sampling_rate': sampling_rate,
+                'top_db': top_db
+            }
+            with open(output_dir + os.sep + str(index) + '.pickle', 'wb') as file:
+                pickle.dump(output, file)
+        return len(dataset) / (time.perf_counter() - start)
+
+def export_items_per_second(dataset, workers_number, features_name, batch_size):
+    with tempfile.TemporaryDirectory() as output_dir:
+        exporter = FeaturesExporter(dataset, output_dir, features_name, features_name, 16000, 13, 13, (47, 39), True,
+            False, workers_number=workers_number, batch_size=batch_size, report_interval=float('inf'))
+        start = time.perf_counter()
+        exporter.export()
+        return len(dataset) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--items_number', type=int, default=2000)
+    parser.add_argument('--workers_numbers', type=int, nargs='+', default=[1, 2, 4, cpu_count()])
+    parser.add_argument('--features_name', type=str, default='mfcc')
+    parser.add_argument('--batch_size', type=int, default=1)
+    args = parser.parse_args()
+
+    dataset = SyntheticSpeechDataset(args.items_number)
+    results = [('serial', serial_items_per_second(dataset, args.features_name))]
+    for workers_number in args.workers_numbers:
+        results.append(('{} workers'.format(workers_number), export_items_per_second(dataset, workers_number,
+            args.features_name, args.batch_size)))
+
+    ConsoleLogger.status('{} items on {} CPUs'.format(args.items_number, cpu_count()))
+    print('{:>12} | {:>10} | {:>8}'.format('export', 'items/sec', 'speedup'))
+    for name, items_per_second in results:
+        print('{:>12} | {:>10.1f} | {:>8.2f}'.format(name, items_per_second, items_per_second / results[0][1]))
@@ -0,0 +1,102 @@
+"""
+Compare the loading throughput (items/sec) of the pickle features dataset
+(a pickle file per utterance) against the memory mapped store, through a
+DataLoader with 0 to 8 workers. The items are synthetic, with the fields and
+the shapes of the exported VCTK features.
+
+The pages of the files are evicted from the page cache (posix_fadvise) before
+each epoch when possible, to approximate reads from a cold cache or a network
+file system.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_features_store.py
+"""
+
+from dataset.features_store import FeaturesStoreWriter
+from dataset.vctk_features_dataset import VCTKFeaturesDataset
+from dataset.vctk_features_memmap_dataset import VCTKFeaturesMemmapDataset
+from error_handling.console_logger import ConsoleLogger
+
+from torch.utils.data import DataLoader
+import argparse
+import numpy as np
+import os
+import pickle
+import tempfile
+import time
+
+
+def export_pickles(path, items_number, audio_length):
+    os.makedirs(path)
+    rng = np.random.RandomState(1234)
+    for i in range(items_number):
+        item = {
+            'preprocessed_audio': rng.randn(audio_length).astype(np.float32),
+            'wav_filename': 'p{}_{:03d}.wav'.format(225 + i % 109, i),
+            'input_features': rng.randn(47, 39),
+            'one_hot': np.array([]),
+            'quantized': np.array([]),
+            'speaker_id': i % 109,
+            'output_features': rng.randn(47, 39),
+            'shifting_time': 0.0,
+            'random_starting_index': 0,
+            'preprocessed_length': audio_length,
+            'sampling_rate': 16000,
+            'top_db': 20
+        }
+        with open(path + os.sep + str(i) + '.pickle', 'wb') as file:
+            pickle.dump(item, file)
+
+def evict_from_page_cache(path):
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            fd = os.open(os.path.join(root, filename), os.O_RDONLY)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            os.close(fd)
+
+def items_per_second(dataset, path, num_workers, batch_size, epochs):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+    duration = 0
+    for _ in range(epochs):
+        evict_from_page_cache(path)
+        start = time.perf_counter()
+        for _ in loader:
+            pass
+        duration += time.perf_counter() - start
+    return epochs * len(dataset) / duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--items_number', type=int, default=4000)
+    parser.add_argument('--audio_length', type=int, default=7680, help='Number of samples of the preprocessed audio of an item')
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--num_workers', type=int, nargs='+', default=[0, 1, 2, 4, 8])
+    parser.add_argument('--fields', type=str, nargs='+', default=None, help='Fields read by the datasets (all of them if not specified)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as vctk_path:
+        features_path = vctk_path + os.sep + 'features'
+        ConsoleLogger.status('Exporting {} pickle items...'.format(args.items_number))
+        export_pickles(features_path + os.sep + 'train', args.items_number, args.audio_length)
+        ConsoleLogger.status('Converting them to a memory mapped store...')
+        FeaturesStoreWriter.convert(features_path + os.sep + 'train', VCTKFeaturesMemmapDataset.store_path(vctk_path, 'train'))
+
+        datasets = [
+            ('pickle', VCTKFeaturesDataset(vctk_path, 'train'), features_path + os.sep + 'train'),
+            ('memmap', VCTKFeaturesMemmapDataset(vctk_path, 'train'), VCTKFeaturesMemmapDataset.store_path(vctk_path, 'train'))
+        ]
+
+        for _, dataset, _ in datasets:
+            dataset.fields = args.fields
+
+        ConsoleLogger.status('{} CPUs, batches of {} items, fields: {}'.format(os.cpu_count(), args.batch_size,
+            'all' if args.fields is None else ', '.join(args.fields)))
+        print('{:>7} | {:>7} | {:>11}'.format('workers', 'store', 'items/sec'))
+        for num_workers in args.num_workers:
+            for name, dataset, path in datasets:
+                print('{:>7} | {:>7} | {:>11.1f}'.format(num_workers, name,
+                    items_per_second(dataset, path, num_workers, args.batch_size, args.epochs)))
@@ -0,0 +1,56 @@
+"""
+Compare the CPU inference time of ConvolutionalVQVAE in eval mode against
+the same model after prepare_for_inference() (folded weight norms, in
+place ReLUs and residual additions, inference mode).
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_inference_preparation.py
+"""
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import time
+import torch
+import yaml
+
+
+def inference_time(model, inputs, speaker_id, repetitions):
+    with torch.no_grad():
+        model(inputs, None, speaker_id) # Warm up
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            model(inputs, None, speaker_id)
+    return (time.perf_counter() - start) / repetitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--configuration_path', type=str, default='../configurations/vctk_features.yaml')
+    parser.add_argument('--batch_size', type=int, default=1)
+    parser.add_argument('--num_frames', type=int, default=160, help='Number of input feature frames')
+    parser.add_argument('--repetitions', type=int, default=30)
+    args = parser.parse_args()
+
+    with open(args.configuration_path, 'r') as configuration_file:
+        configuration = yaml.safe_load(configuration_file)
+
+    ConsoleLogger.status('Batches of {} x {} frames on cpu'.format(args.batch_size, args.num_frames))
+    print('{:>18} | {:>20} | {:>20} | {:>8}'.format('use_kaiming_normal', 'eval (ms)', 'prepared (ms)', 'max diff'))
+    for use_kaiming_normal in [False, True]:
+        configuration['use_kaiming_normal'] = use_kaiming_normal
+        torch.manual_seed(1234)
+        model = ConvolutionalVQVAE(configuration, 'cpu').eval()
+        inputs = torch.randn(args.batch_size, args.num_frames, model.encoder.features_filters)
+        speaker_id = torch.zeros(args.batch_size, 1, dtype=torch.long)
+
+        eval_time = inference_time(model, inputs, speaker_id, args.repetitions)
+        with torch.no_grad():
+            expected = model(inputs, None, speaker_id)[0]
+        model.prepare_for_inference()
+        prepared_time = inference_time(model, inputs, speaker_id, args.repetitions)
+        difference = (model(inputs, None, speaker_id)[0] - expected).abs().max().item()
+
+        print('{:>18} | {:>20.1f} | {:>20.1f} | {:>8.1e}'.format(str(use_kaiming_normal), eval_time * 1000,
+            prepared_time * 1000, difference))
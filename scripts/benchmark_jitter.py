@@ -0,0 +1,70 @@
+"""
+Compare the time of the vectorized Jitter against the previous loop over
+the timesteps, for a (B, C, T) batch of quantized latents.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_jitter.py --device cpu
+"""
+
+from modules.jitter import Jitter
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import numpy as np
+import time
+import torch
+
+
+class LoopJitter(Jitter):
+    """
+    Previous implementation: a Python loop over the timesteps, with a
+    replacement shared across the batch.
+    """
+
+    def forward(self, quantized):
+        original_quantized = quantized.detach().clone()
+        length = original_quantized.size(2)
+        for i in range(length):
+            replace = [True, False][np.random.choice([1, 0], p=[self._probability, 1 - self._probability])]
+            if replace:
+                if i == 0:
+                    neighbor_index = i + 1
+                elif i == length - 1:
+                    neighbor_index = i - 1
+                else:
+                    neighbor_index = i + np.random.choice([-1, 1], p=[0.5, 0.5])
+                quantized[:, :, i] = original_quantized[:, :, neighbor_index]
+
+        return quantized
+
+def jitter_time(jitter, batch_size, channels, length, device, repetitions):
+    inputs = torch.randn(batch_size, channels, length, device=device)
+    jitter(inputs) # Warm up
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        jitter(inputs)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repetitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batch_size', type=int, default=52)
+    parser.add_argument('--embedding_dim', type=int, default=64)
+    parser.add_argument('--repetitions', type=int, default=10)
+    parser.add_argument('--lengths', type=int, nargs='+', default=[480, 10000])
+    args = parser.parse_args()
+
+    ConsoleLogger.status('Batches of {} x {} latents on {}'.format(args.batch_size, args.embedding_dim, args.device))
+    print('{:>8} | {:>12} | {:>17} | {:>8}'.format('T', 'loop (ms)', 'vectorized (ms)', 'speedup'))
+    for length in args.lengths:
+        loop_time = jitter_time(LoopJitter(0.12), args.batch_size, args.embedding_dim, length,
+            args.device, args.repetitions)
+        vectorized_time = jitter_time(Jitter(0.12), args.batch_size, args.embedding_dim, length,
+            args.device, args.repetitions)
+        print('{:>8} | {:>12.2f} | {:>17.3f} | {:>7.0f}x'.format(length, loop_time * 1000,
+            vectorized_time * 1000, loop_time / vectorized_time))
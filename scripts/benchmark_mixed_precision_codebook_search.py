@@ -0,0 +1,64 @@
+"""
+Compare the throughput of a VectorQuantizer training step (forward + backward)
+in float32 against bfloat16 autocast, and report the agreement of the
+encoding indices with the float32 ones.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_mixed_precision_codebook_search.py --device cpu
+"""
+
+from models.vector_quantizer import VectorQuantizer
+from modules.codebook_search import CodebookSearch
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import time
+import torch
+
+
+def run_step(vq, inputs, device, dtype):
+    with torch.autocast(torch.device(device).type, dtype=dtype, enabled=dtype != torch.float32):
+        vq_output = vq(inputs)
+    (vq_output.vq_loss + vq_output.quantized.sum()).backward()
+    return vq_output.encoding_indices
+
+def throughput(vq, inputs, device, dtype, repetitions):
+    run_step(vq, inputs, device, dtype) # Warm up
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        run_step(vq, inputs, device, dtype)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return inputs.size(2) * repetitions / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--num_frames', type=int, default=16384, help='Number of frames (B x T) quantized at each step')
+    parser.add_argument('--embedding_dim', type=int, default=64)
+    parser.add_argument('--tile_size', type=int, default=None)
+    parser.add_argument('--noise', type=float, default=1.0, help='Std of the frames around the codebook vectors')
+    parser.add_argument('--repetitions', type=int, default=10)
+    parser.add_argument('--num_embeddings', type=int, nargs='+', default=[44, 512, 4096])
+    args = parser.parse_args()
+
+    ConsoleLogger.status('{} frames of dimension {} on {}'.format(args.num_frames, args.embedding_dim, args.device))
+    print('{:>6} | {:>9} | {:>16} | {:>15}'.format('K', 'dtype', 'frames / second', 'index agreement'))
+    for num_embeddings in args.num_embeddings:
+        torch.manual_seed(1234)
+        vq = VectorQuantizer(num_embeddings, args.embedding_dim, 0.25, args.device,
+            codebook_search=CodebookSearch(tile_size=args.tile_size)).to(args.device).train()
+        vq.embedding.weight.data.normal_()
+        flat_input = vq.embedding.weight.data[torch.randint(0, num_embeddings, (args.num_frames,), device=args.device)] \
+            + args.noise * torch.randn(args.num_frames, args.embedding_dim, device=args.device)
+        # (B, C, T) layout, such as the flattening of the quantizer gives back flat_input
+        inputs = flat_input.reshape(args.embedding_dim, args.num_frames, 1).permute(2, 0, 1).requires_grad_()
+
+        reference_indices = run_step(vq, inputs, args.device, torch.float32)
+        for dtype in [torch.float32, torch.bfloat16]:
+            agreement = (run_step(vq, inputs, args.device, dtype) == reference_indices).float().mean().item()
+            print('{:>6} | {:>9} | {:>16.0f} | {:>15.4f}'.format(num_embeddings, str(dtype).split('.')[-1],
+                throughput(vq, inputs, args.device, dtype, args.repetitions), agreement))
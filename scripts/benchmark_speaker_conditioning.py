@@ -0,0 +1,72 @@
+"""
+Compare the training step time (forward + backward) of DeconvolutionalDecoder
+with the learned speaker conditioning folded into _conv_1, against the
+previous conditioning, which built a new embedding at each step and
+concatenated it, expanded over the time, to the inputs.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_speaker_conditioning.py --device cpu
+"""
+
+from models.deconvolutional_decoder import DeconvolutionalDecoder
+from speech_utils.global_conditioning import GlobalConditioning
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import time
+import torch
+
+
+class ConcatenatedConditioningDecoder(DeconvolutionalDecoder):
+    """
+    Previous speaker conditioning: a new random embedding at each step,
+    concatenated to the inputs of the 40 extra input channels of _conv_1.
+    """
+
+    def __init__(self, in_channels, *args, **kwargs):
+        super(ConcatenatedConditioningDecoder, self).__init__(in_channels + 40, *args, **kwargs)
+
+    def forward(self, inputs, speaker_dic, speaker_id):
+        speaker_embedding = GlobalConditioning.compute(speaker_dic, speaker_id, inputs,
+            device=self._device, gin_channels=40, expand=True)
+        return self._decode(torch.cat([inputs, speaker_embedding], dim=1).to(self._device), None)
+
+def step_time(decoder_class, args):
+    torch.manual_seed(1234)
+    decoder = decoder_class(args.embedding_dim, 13, args.num_hiddens, 2, args.num_hiddens, False, False, 0.12,
+        decoder_class is DeconvolutionalDecoder, args.device).to(args.device).train()
+    speaker_dic = {speaker: i for i, speaker in enumerate(range(109))}
+    inputs = torch.randn(args.batch_size, args.embedding_dim, args.num_frames, device=args.device)
+    speaker_id = torch.randint(0, 109, (args.batch_size, 1), device=args.device)
+
+    def run_step():
+        decoder(inputs, speaker_dic, speaker_id).sum().backward()
+
+    run_step() # Warm up
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(args.repetitions):
+        run_step()
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / args.repetitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batch_size', type=int, default=52)
+    parser.add_argument('--num_frames', type=int, default=81, help='Number of latent frames per utterance')
+    parser.add_argument('--embedding_dim', type=int, default=64)
+    parser.add_argument('--num_hiddens', type=int, default=768)
+    parser.add_argument('--repetitions', type=int, default=10)
+    args = parser.parse_args()
+
+    ConsoleLogger.status('Batches of {} x {} x {} latents on {}'.format(args.batch_size, args.embedding_dim,
+        args.num_frames, args.device))
+    concatenated_time = step_time(ConcatenatedConditioningDecoder, args)
+    folded_time = step_time(DeconvolutionalDecoder, args)
+    print('{:>28} | {:>14}'.format('speaker conditioning', 'step time (ms)'))
+    print('{:>28} | {:>14.2f}'.format('concatenated, rebuilt', concatenated_time * 1000))
+    print('{:>28} | {:>14.2f}'.format('learned, folded in _conv_1', folded_time * 1000))
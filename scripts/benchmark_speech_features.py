@@ -0,0 +1,51 @@
+"""
+Compare the throughput (utterances/sec) of the MFCC and log filterbank
+features (with their deltas) of python_speech_features, computed one
+utterance at a time, against the batched torch implementation of
+TorchSpeechFeatures, with a single thread and with all the threads.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_speech_features.py
+"""
+
+from speech_utils.speech_features import SpeechFeatures
+from speech_utils.torch_speech_features import TorchSpeechFeatures
+from error_handling.console_logger import ConsoleLogger
+
+from multiprocessing import cpu_count
+import argparse
+import numpy as np
+import time
+import torch
+
+
+def utterances_per_second(compute, signals, repetitions):
+    compute(signals) # Warm up
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        compute(signals)
+    return repetitions * len(signals) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--length', type=int, default=7681, help='Number of samples of an utterance')
+    parser.add_argument('--repetitions', type=int, default=5)
+    args = parser.parse_args()
+
+    signals = np.random.RandomState(1234).randn(args.batch_size, args.length).astype(np.float32)
+    torch_signals = torch.from_numpy(signals)
+
+    ConsoleLogger.status('{} utterances of {} samples, {} CPUs'.format(args.batch_size, args.length, cpu_count()))
+    print('{:>9} | {:>26} | {:>15}'.format('features', 'implementation', 'utterances/sec'))
+    for name in ['mfcc', 'logfbank']:
+        results = [('python_speech_features', utterances_per_second(
+            lambda signals: [getattr(SpeechFeatures, name)(signal, 16000, 13) for signal in signals],
+            signals, args.repetitions))]
+        for threads in sorted(set([1, cpu_count()])):
+            torch.set_num_threads(threads)
+            results.append(('torch ({} thread{})'.format(threads, 's' if threads > 1 else ''), utterances_per_second(
+                lambda signals: getattr(TorchSpeechFeatures, name)(signals, 16000, 13), torch_signals, args.repetitions)))
+        for implementation, throughput in results:
+            print('{:>9} | {:>26} | {:>15.1f}'.format(name, implementation, throughput))
@@ -0,0 +1,73 @@
+"""
+Compare the step time of the in-place EMA codebook update of VectorQuantizerEMA
+against the previous update, which allocated new parameters at each step.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_vector_quantizer_ema.py --device cpu
+"""
+
+from models.vector_quantizer_ema import VectorQuantizerEMA
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import time
+import torch
+import torch.nn as nn
+
+
+class OutOfPlaceVectorQuantizerEMA(VectorQuantizerEMA):
+    """
+    Previous EMA update, with new tensors and parameters at each step.
+    """
+
+    def _update_ema(self, flat_input, encoding_indices, encodings_counts):
+        self._ema_cluster_size = self._ema_cluster_size * self._decay + \
+            (1 - self._decay) * encodings_counts.float()
+
+        n = torch.sum(self._ema_cluster_size.data)
+        self._ema_cluster_size = (
+            (self._ema_cluster_size + self._epsilon)
+            / (n + self._num_embeddings * self._epsilon) * n
+        )
+
+        dw = torch.zeros_like(self._ema_w).index_add_(0, encoding_indices, flat_input.detach())
+        self._ema_w = self._ema_w * self._decay + (1 - self._decay) * dw
+
+        self._embedding.weight = nn.Parameter(self._ema_w / self._ema_cluster_size.unsqueeze(1))
+
+def step_time(vq_class, num_embeddings, num_frames, embedding_dim, device, repetitions):
+    torch.manual_seed(1234)
+    vq = vq_class(num_embeddings, embedding_dim, 0.25, 0.99, device).to(device).train()
+    inputs = torch.randn(1, embedding_dim, num_frames, device=device, requires_grad=True)
+
+    def run_step():
+        vq_output = vq(inputs)
+        (vq_output.vq_loss + vq_output.quantized.sum()).backward()
+
+    run_step() # Warm up
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        run_step()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repetitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num_frames', type=int, default=16384, help='Number of frames (B x T) quantized at each step')
+    parser.add_argument('--embedding_dim', type=int, default=64)
+    parser.add_argument('--repetitions', type=int, default=50)
+    parser.add_argument('--num_embeddings', type=int, nargs='+', default=[29, 44, 512, 4096])
+    args = parser.parse_args()
+
+    ConsoleLogger.status('{} frames of dimension {} on {}'.format(args.num_frames, args.embedding_dim, args.device))
+    print('{:>6} | {:>12} | {:>14}'.format('K', 'update', 'step time (ms)'))
+    for num_embeddings in args.num_embeddings:
+        for update_name, vq_class in [('out-of-place', OutOfPlaceVectorQuantizerEMA), ('in-place', VectorQuantizerEMA)]:
+            elapsed = step_time(vq_class, num_embeddings, args.num_frames, args.embedding_dim,
+                args.device, args.repetitions)
+            print('{:>6} | {:>12} | {:>14.2f}'.format(num_embeddings, update_name, elapsed * 1000))
@@ -0,0 +1,97 @@
+"""
+Profile a training step of ConvolutionalVQVAE, and of its quantizer alone,
+with the legacy and the channels first layouts of the quantizer (vq_layout),
+and report the number of layout copies (behind the contiguous(), clone() and
+reshape() calls) and the bytes they move, the bytes moved by all the tensor
+copies (aten::copy_, including e.g. the initialization of the outputs of
+baddbmm), and the duration of the step.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_vq_layout.py
+"""
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import math
+import time
+import torch
+import yaml
+
+
+def training_step(model, inputs, speaker_id):
+    reconstructed_x, vq_output = model(inputs, None, speaker_id)
+    loss = vq_output.vq_loss + torch.mean(reconstructed_x ** 2)
+    loss.backward()
+
+def quantizer_training_step(quantizer, inputs, speaker_id):
+    vq_output = quantizer(inputs)
+    (vq_output.vq_loss + torch.mean(vq_output.quantized ** 2)).backward()
+
+def copies(step, model, inputs, speaker_id):
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True) as profiler:
+        step(model, inputs, speaker_id)
+
+    def size(event):
+        # The first input of a copy is its destination, of the same size as its source (float32)
+        return 4 * math.prod(event.input_shapes[0]) if event.input_shapes else 0
+
+    def is_layout_copy(event):
+        parent = event.cpu_parent
+        while parent is not None:
+            if parent.name in ['aten::contiguous', 'aten::clone', 'aten::reshape']:
+                return True
+            parent = parent.cpu_parent
+        return False
+
+    events = [event for event in profiler.events() if event.name == 'aten::copy_']
+    layout_copies = [event for event in events if is_layout_copy(event)]
+    return len(layout_copies), sum(size(event) for event in layout_copies), sum(size(event) for event in events)
+
+def step_time(step, model, inputs, speaker_id, repetitions):
+    step(model, inputs, speaker_id) # Warm up
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        model.zero_grad(set_to_none=True)
+        step(model, inputs, speaker_id)
+    return (time.perf_counter() - start) / repetitions
+
+def report(name, step, model, inputs, speaker_id, repetitions):
+    number_of_layout_copies, layout_copied_bytes, copied_bytes = copies(step, model, inputs, speaker_id)
+    duration = step_time(step, model, inputs, speaker_id, repetitions)
+    print('{:>36} | {:>13} | {:>18.2f} | {:>15.2f} | {:>10.1f}'.format(name, number_of_layout_copies,
+        layout_copied_bytes / 2**20, copied_bytes / 2**20, duration * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--configuration_path', type=str, default='../configurations/vctk_features.yaml')
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--num_frames', type=int, default=160, help='Number of input feature frames')
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--quantizer_num_frames', type=int, default=4096,
+        help='Number of latent frames per sample of the quantizer alone')
+    args = parser.parse_args()
+
+    with open(args.configuration_path, 'r') as configuration_file:
+        configuration = yaml.safe_load(configuration_file)
+
+    ConsoleLogger.status('Training steps of {} x {} frames on cpu (quantizer alone: {} x {} latent frames)'.format(
+        args.batch_size, args.num_frames, args.batch_size, args.quantizer_num_frames))
+    print('{:>36} | {:>13} | {:>18} | {:>15} | {:>10}'.format('step', 'layout copies', 'layout copies (MB)',
+        'all copies (MB)', 'step (ms)'))
+    for decay in [0.0, 0.99]:
+        for vq_layout in ['legacy', 'channels_first']:
+            configuration.update({'vq_layout': vq_layout, 'decay': decay})
+            torch.manual_seed(1234)
+            model = ConvolutionalVQVAE(configuration, 'cpu').train()
+            inputs = torch.randn(args.batch_size, args.num_frames, model.encoder.features_filters)
+            speaker_id = torch.zeros(args.batch_size, 1, dtype=torch.long)
+            report('model {} decay={}'.format(vq_layout, decay), training_step, model, inputs, speaker_id,
+                args.repetitions)
+
+            latents = torch.randn(args.batch_size, configuration['embedding_dim'], args.quantizer_num_frames,
+                requires_grad=True)
+            report('quantizer {} decay={}'.format(vq_layout, decay), quantizer_training_step, model.vq, latents,
+                None, args.repetitions)
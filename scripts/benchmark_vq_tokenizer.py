@@ -0,0 +1,115 @@
+"""
+Compare the cold start time and the per utterance latency of the exported
+VQTokenizer against the full model loaded with PipelineFactory.
+
+If --experiment_name is specified, the full model is loaded with
+PipelineFactory.load() (it requires the experiment checkpoints and the
+dataset). Otherwise, a model is built from --configuration_path, and the
+cold start of the full model is measured as the import of the pipeline
+modules, the construction of ConvolutionalVQVAE and the loading of its
+state dict.
+
+Usage (from the src directory):
+    PYTHONPATH=. python3 ../scripts/benchmark_vq_tokenizer.py
+"""
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from models.vq_tokenizer import VQTokenizer
+from error_handling.console_logger import ConsoleLogger
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import torch
+import yaml
+
+
+FULL_MODEL_COLD_START = '''
+from experiments.pipeline_factory import PipelineFactory
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+import torch, yaml
+configuration = yaml.load(open({configuration_path!r}), Loader=yaml.FullLoader)
+model = ConvolutionalVQVAE(configuration, 'cpu')
+model.load_state_dict(torch.load({model_path!r}, map_location='cpu'))
+'''
+
+PIPELINE_COLD_START = '''
+from experiments.pipeline_factory import PipelineFactory
+PipelineFactory.load({experiments_path!r}, {experiment_name!r}, {results_path!r})
+'''
+
+TOKENIZER_COLD_START = '''
+from models.vq_tokenizer import VQTokenizer
+VQTokenizer.load({tokenizer_path!r})
+'''
+
+def cold_start_time(code, repetitions):
+    # Fresh interpreters, so the imports are part of the measure
+    elapsed = list()
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, env=dict(os.environ, PYTHONPATH='.'),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+def latency(function, features, repetitions):
+    with torch.no_grad():
+        function(features) # Warm up
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            function(features)
+    return (time.perf_counter() - start) / repetitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--configuration_path', type=str, default='..' + os.sep + 'configurations' + os.sep + 'vctk_features.yaml')
+    parser.add_argument('--experiments_path', type=str, default='..' + os.sep + 'experiments')
+    parser.add_argument('--results_path', type=str, default='..' + os.sep + 'results')
+    parser.add_argument('--experiment_name', type=str, default=None)
+    parser.add_argument('--utterance_frames', type=int, nargs='+', default=[100, 300, 1000], help='Number of feature frames of an utterance')
+    parser.add_argument('--cold_start_repetitions', type=int, default=3)
+    parser.add_argument('--repetitions', type=int, default=20)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    temporary_directory = tempfile.mkdtemp()
+    tokenizer_path = temporary_directory + os.sep + 'vq-tokenizer.pt'
+
+    if args.experiment_name is None:
+        with open(args.configuration_path, 'r') as configuration_file:
+            configuration = yaml.load(configuration_file, Loader=yaml.FullLoader)
+        model = ConvolutionalVQVAE(configuration, 'cpu').eval()
+        model_path = temporary_directory + os.sep + 'model.pth'
+        torch.save(model.state_dict(), model_path)
+        full_model_code = FULL_MODEL_COLD_START.format(configuration_path=args.configuration_path, model_path=model_path)
+    else:
+        from experiments.pipeline_factory import PipelineFactory
+        _, evaluator, _, _ = PipelineFactory.load(args.experiments_path, args.experiment_name, args.results_path)
+        model = evaluator.model.cpu().eval()
+        full_model_code = PIPELINE_COLD_START.format(experiments_path=args.experiments_path,
+            experiment_name=args.experiment_name, results_path=args.results_path)
+
+    VQTokenizer.export(model, tokenizer_path)
+    tokenizer, _ = VQTokenizer.load(tokenizer_path)
+    ConsoleLogger.status('Tokenizer artifact: {:.1f} MiB'.format(os.path.getsize(tokenizer_path) / 2**20))
+
+    print('{:>22} | {:>14}'.format('cold start', 'time (s)'))
+    print('{:>22} | {:>14.3f}'.format('full model', cold_start_time(full_model_code, args.cold_start_repetitions)))
+    print('{:>22} | {:>14.3f}'.format('tokenizer', cold_start_time(
+        TOKENIZER_COLD_START.format(tokenizer_path=tokenizer_path), args.cold_start_repetitions)))
+
+    def full_model_tokenize(features):
+        z = model.pre_vq_conv(model.encoder(features.permute(0, 2, 1).contiguous().float()))
+        return model.vq(z).encoding_indices.view(features.size(0), -1)
+
+    print('{:>22} | {:>14} | {:>14}'.format('utterance frames', 'full (ms)', 'tokenizer (ms)'))
+    for utterance_frames in args.utterance_frames:
+        features = torch.randn(1, utterance_frames, model.encoder.features_filters)
+        print('{:>22} | {:>14.2f} | {:>14.2f}'.format(utterance_frames,
+            latency(full_model_tokenize, features, args.repetitions) * 1000,
+            latency(tokenizer, features, args.repetitions) * 1000))
@@ -1,11 +1,12 @@
 from error_handling.console_logger import ConsoleLogger
 from experiments.device_configuration import DeviceConfiguration
 from dataset.vctk_features_stream import VCTKFeaturesStream
+from dataset.vctk_metadata_index import VCTKMetadataIndex
 
 import librosa
 import numpy as np
 import os
-import textgrid
+import sys
 import torch
 import yaml
 from tqdm import tqdm
@@ -22,7 +23,7 @@ def set_deterministic_on(seed):
     torch.backends.cudnn.deterministic = True
 
 def load_wav(filename, sampling_rate, res_type, top_db):
-    raw_audio, _ = librosa.load(filename, sampling_rate, res_type=res_type)
+    raw_audio, _ = librosa.load(filename, sr=sampling_rate, res_type=res_type)
     trimmed_audio, trimming_indices = librosa.effects.trim(raw_audio, top_db=top_db)
     trimmed_audio /= np.abs(trimmed_audio).max()
     trimmed_audio = trimmed_audio.astype(np.float32)
@@ -38,6 +39,11 @@ if __name__ == "__main__":
         configuration = yaml.load(configuration_file, Loader=yaml.FullLoader)
     device_configuration = DeviceConfiguration.load_from_configuration(configuration)
     data_stream = VCTKFeaturesStream('../data/vctk', configuration, device_configuration.gpu_ids, device_configuration.use_cuda)
+    metadata_index = VCTKMetadataIndex.load_from_configuration(configuration)
+    if metadata_index is None:
+        ConsoleLogger.error("No metadata index found at '{}'. Build it with: python3 main.py --build_metadata_index".format(
+            configuration.get('metadata_index_path', None)))
+        sys.exit(1)
 
     res_type = 'kaiser_fast'
     top_db = 20
@@ -55,24 +61,17 @@ if __name__ == "__main__":
             sampling_rate = features['sampling_rate'].item()
             random_starting_index = features['random_starting_index'].item()
 
-            raw_audio, trimmed_audio, trimming_indices = load_wav(audio_filename, sampling_rate, res_type, top_db)
-
-            beginning_trimmed_time = trimming_indices[0] / sampling_rate
-
-            groundtruth_alignment_path = '../data/vctk/raw/VCTK-Corpus/phonemes' + os.sep + \
-                os.sep.join(audio_filename.split(os.sep)[-2:]).replace('.wav', '.TextGrid')
-
-            if not os.path.isfile(groundtruth_alignment_path):
-                #ConsoleLogger.error('{} file not found'.format(groundtruth_alignment_path))
+            detected_sil_duration = metadata_index.leading_silence(audio_filename)
+            if detected_sil_duration is None:
+                # No phonemes alignment (or not indexed)
                 continue
 
-            tg = textgrid.TextGrid()
-            tg.read(groundtruth_alignment_path)
-            detected_sil_duration = 0.0
-            for interval in tg.tiers[1]:
-                if interval.mark != 'sil':
-                    break
-                detected_sil_duration += float(interval.maxTime) - float(interval.minTime)
+            trimming_indices = metadata_index.trimming_indices(audio_filename, top_db, sampling_rate, res_type)
+            if trimming_indices is None:
+                # Not indexed at this top_db
+                _, _, trimming_indices = load_wav(audio_filename, sampling_rate, res_type, top_db)
+
+            beginning_trimmed_time = trimming_indices[0] / sampling_rate
 
             sil_duration_gap = abs(detected_sil_duration - \
                 (shifting_time - (0 if random_starting_index == 0 \
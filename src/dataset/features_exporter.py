@@ -0,0 +1,329 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+from speech_utils.speech_features import SpeechFeatures
+from error_handling.console_logger import ConsoleLogger
+from error_handling.logger_factory import LoggerFactory
+from . import LOG_PATH
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import cpu_count
+from torch.utils.data.dataloader import default_collate
+from tqdm import tqdm
+import numpy as np
+import os
+import pickle
+import random
+import time
+import traceback
+
+
+# State of a worker process, set once by _initialize_worker() instead of being sent with each item
+_worker_state = None
+
+def _initialize_worker(dataset, settings):
+    global _worker_state
+    _worker_state = (dataset, settings)
+
+def _export_items(indices):
+    """
+    Compute the features of the items indices of the dataset of the worker.
+    The features of the items are computed in a batch (see
+    SpeechFeatures.batch_features_from_name()).
+
+    Returns:
+        list of (index, status, output, pid, duration), with status 'saved',
+        'invalid' (features of an unexpected shape) or 'failed', and output
+        the dictionary of the features if it's not saved by the worker itself
+        (it's then appended to the store by the main process), or the
+        traceback of a failed item.
+    """
+
+    dataset, settings = _worker_state
+    results = list()
+    items = list()
+    for index in indices:
+        start = time.perf_counter()
+        try:
+            # Same random trimming of an item whatever the worker computing it
+            random.seed(index)
+            # Batch of a single item, as the items of the loader the features were exported from
+            items.append((index, default_collate([dataset[index]]), time.perf_counter() - start))
+        except Exception:
+            results.append((index, 'failed', traceback.format_exc(), os.getpid(), time.perf_counter() - start))
+
+    if len(items) == 0:
+        return results
+
+    start = time.perf_counter()
+    try:
+        input_features = SpeechFeatures.batch_features_from_name(
+            name=settings['input_features_name'],
+            signals=[item[0] for _, item, _ in items],
+            rate=settings['rate'],
+            filters_number=settings['input_filters_number']
+        )
+        valid = [input_features[i].shape[0] == settings['input_target_shape'][0] and \
+            input_features[i].shape[1] == settings['input_target_shape'][1] for i in range(len(items))]
+
+        if settings['input_features_name'] == settings['output_features_name'] and \
+            settings['input_filters_number'] == settings['output_filters_number'] and \
+            settings['augment_output_features']:
+            # The input features are augmented, so they're the output ones
+            output_features = input_features
+        else:
+            valid_output_features = iter(SpeechFeatures.batch_features_from_name(
+                name=settings['output_features_name'],
+                signals=[item[0] for (_, item, _), is_valid in zip(items, valid) if is_valid],
+                rate=settings['rate'],
+                filters_number=settings['output_filters_number'],
+                augmented=settings['augment_output_features']
+            ))
+            output_features = [next(valid_output_features) if is_valid else None for is_valid in valid]
+    except Exception:
+        if len(items) == 1:
+            index, _, loading_duration = items[0]
+            return results + [(index, 'failed', traceback.format_exc(), os.getpid(),
+                loading_duration + time.perf_counter() - start)]
+        # Compute the items one by one, so only the failing ones fail
+        return results + [result for index, _, _ in items for result in _export_items([index])]
+    # The features computation time is shared by the items of the batch
+    features_duration = (time.perf_counter() - start) / len(items)
+
+    for i, (index, item, loading_duration) in enumerate(items):
+        start = time.perf_counter()
+        (preprocessed_audio, one_hot, speaker_id, quantized, wav_filename, sampling_rate, shifting_time,
+            random_starting_index, preprocessed_length, top_db) = item
+
+        if not valid[i]:
+            results.append((index, 'invalid', input_features[i].shape, os.getpid(),
+                loading_duration + features_duration))
+            continue
+
+        output = {
+            'preprocessed_audio': preprocessed_audio,
+            'wav_filename': wav_filename,
+            'input_features': input_features[i],
+            'one_hot': one_hot if settings['export_one_hot_features'] else np.array([]),
+            'quantized': np.array([]),
+            'speaker_id': speaker_id,
+            'output_features': output_features[i],
+            'shifting_time': shifting_time,
+            'random_starting_index': random_starting_index,
+            'preprocessed_length': preprocessed_length,
+            'sampling_rate': sampling_rate,
+            'top_db': top_db
+        }
+
+        if settings['output_dir'] is None:
+            results.append((index, 'saved', output, os.getpid(),
+                loading_duration + features_duration + time.perf_counter() - start))
+            continue
+
+        # Write then rename, so an interrupted export never leaves a truncated file
+        output_path = settings['output_dir'] + os.sep + str(index) + '.pickle'
+        temporary_path = output_path + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(output, file)
+        os.replace(temporary_path, output_path)
+
+        results.append((index, 'saved', None, os.getpid(),
+            loading_duration + features_duration + time.perf_counter() - start))
+
+    return results
+
+
+class FeaturesExporter(object):
+    """
+    Export the features of the items of a VCTKDataset with a pool of
+    processes, in <output_dir>/<index>.pickle files, or in a features store
+    if a FeaturesStoreWriter is specified.
+
+    The items are sent to the workers by batches of batch_size items, whose
+    features are computed together (in a single call with the torch
+    implementations of the features). At most window batches are in flight
+    at the same time, so the memory of the pending results stays bounded.
+    Each processed item is appended to
+    a manifest (<output_dir>/manifest.txt), so that a rerun skips the items
+    already saved or invalid without checking their output files. A failed
+    item isn't recorded, and is computed again by the next run. The files
+    keep the indices of the dataset, so the invalid and failed items leave
+    holes in their numbering (VCTKFeaturesDataset only reads the saved ones).
+    """
+
+    MANIFEST_FILENAME = 'manifest.txt'
+
+    # The loggers of the failed items, per log path. Each LoggerFactory.create() adds a
+    # file handler to the logger of the module, so they're only created once
+    _loggers = dict()
+
+    def __init__(self, dataset, output_dir, input_features_name, output_features_name, rate,
+        input_filters_number, output_filters_number, input_target_shape, augment_output_features,
+        export_one_hot_features, writer=None, workers_number=0, window=None, batch_size=1,
+        report_interval=60, log_path=LOG_PATH):
+
+        self._dataset = dataset
+        self._output_dir = output_dir
+        self._writer = writer
+        self._workers_number = workers_number if workers_number > 0 else cpu_count()
+        self._window = window if window is not None else 4 * self._workers_number
+        self._batch_size = batch_size
+        self._report_interval = report_interval
+        self._settings = {
+            'output_dir': None if writer is not None else output_dir,
+            'input_features_name': input_features_name,
+            'output_features_name': output_features_name,
+            'rate': rate,
+            'input_filters_number': input_filters_number,
+            'output_filters_number': output_filters_number,
+            'input_target_shape': input_target_shape,
+            'augment_output_features': augment_output_features,
+            'export_one_hot_features': export_one_hot_features
+        }
+        self._log_path = log_path
+
+    @property
+    def logger(self):
+        if self._log_path not in FeaturesExporter._loggers:
+            FeaturesExporter._loggers[self._log_path] = LoggerFactory.create(self._log_path, __name__)
+        return FeaturesExporter._loggers[self._log_path]
+
+    @property
+    def manifest_path(self):
+        return self._output_dir + os.sep + self.MANIFEST_FILENAME
+
+    def load_manifest(self):
+        """
+        Returns:
+            Dictionary of the status of the items already processed.
+        """
+
+        manifest = dict()
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path, 'r') as file:
+                for line in file:
+                    fields = line.split()
+                    # The last line may be incomplete if the previous export was killed
+                    if len(fields) == 2:
+                        manifest[int(fields[0])] = fields[1]
+        if self._writer is not None:
+            # The saved items are those of the store, which drops the items written after its last index
+            manifest = {index: status for index, status in manifest.items() if status != 'saved' or index in self._writer}
+        return manifest
+
+    def export(self):
+        """
+        Returns:
+            Dictionary of the numbers of 'saved', 'invalid', 'failed' and
+            'skipped' (already processed) items.
+        """
+
+        manifest = self.load_manifest()
+        indices = [index for index in range(len(self._dataset)) if index not in manifest]
+        counts = {'saved': 0, 'invalid': 0, 'failed': 0, 'skipped': len(self._dataset) - len(indices)}
+        if len(indices) == 0:
+            ConsoleLogger.status('All the {} items of {} are already exported'.format(len(self._dataset), self._output_dir))
+            return counts
+
+        ConsoleLogger.status('Exporting {} items ({} already exported) with {} workers'.format(
+            len(indices), counts['skipped'], self._workers_number))
+        workers = dict()
+        start = time.perf_counter()
+        last_report = start
+
+        with open(self.manifest_path, 'a') as manifest_file, \
+            ProcessPoolExecutor(max_workers=self._workers_number, initializer=_initialize_worker,
+                initargs=(self._dataset, self._settings)) as executor, \
+            tqdm(total=len(indices)) as bar:
+
+            pending = dict()
+            next_position = 0
+            try:
+                while next_position < len(indices) or len(pending) > 0:
+                    while next_position < len(indices) and len(pending) < self._window:
+                        batch_indices = indices[next_position:next_position + self._batch_size]
+                        pending[executor.submit(_export_items, batch_indices)] = batch_indices
+                        next_position += len(batch_indices)
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch_indices = pending.pop(future)
+                        try:
+                            results = future.result()
+                        except Exception:
+                            error_message = 'Failed to export the items {} of {}'.format(batch_indices, self._output_dir)
+                            self.logger.exception(error_message)
+                            ConsoleLogger.error(error_message)
+                            counts['failed'] += len(batch_indices)
+                            bar.update(len(batch_indices))
+                            continue
+
+                        for index, status, output, pid, duration in results:
+                            self._record(index, status, output, pid, duration, manifest_file, counts, workers)
+                        bar.update(len(results))
+
+                    if time.perf_counter() - last_report >= self._report_interval:
+                        self._report_workers(workers, time.perf_counter() - start)
+                        last_report = time.perf_counter()
+            except KeyboardInterrupt:
+                # The pending items aren't in the manifest, so they'll be computed by the next run
+                for future in pending:
+                    future.cancel()
+                ConsoleLogger.warn('Keyboard interrupt detected. Leaving the export...')
+                raise
+
+        self._report_workers(workers, time.perf_counter() - start)
+        return counts
+
+    def _record(self, index, status, output, pid, duration, manifest_file, counts, workers):
+        if status == 'failed':
+            # A failed item isn't recorded in the manifest
+            error_message = 'Failed to export the item {} of {}'.format(index, self._output_dir)
+            self.logger.error(error_message + '\n' + output)
+            ConsoleLogger.error(error_message)
+            counts['failed'] += 1
+            return
+
+        if status == 'invalid':
+            ConsoleLogger.warn('Raw features number {} with invalid dimension {} will not be saved. Target shape: {}'.format(
+                index, output, self._settings['input_target_shape']))
+        elif self._writer is not None:
+            self._writer.write(index, output)
+
+        manifest_file.write('{} {}\n'.format(index, status))
+        manifest_file.flush()
+        counts[status] += 1
+
+        items, busy_time = workers.get(pid, (0, 0.0))
+        workers[pid] = (items + 1, busy_time + duration)
+
+    def _report_workers(self, workers, elapsed_time):
+        for pid, (items, busy_time) in sorted(workers.items()):
+            ConsoleLogger.status('Worker {}: {} items, {:.2f} items/sec ({:.0f}% busy)'.format(
+                pid, items, items / elapsed_time, 100 * busy_time / elapsed_time))
+        total_items = sum(items for items, _ in workers.values())
+        ConsoleLogger.status('{} items in {:.1f}s: {:.2f} items/sec'.format(total_items, elapsed_time,
+            total_items / elapsed_time))
@@ -0,0 +1,257 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import numpy as np
+import torch
+import os
+import pickle
+
+
+class FeaturesStoreWriter(object):
+    """
+    Writer of a memory mapped features store: the arrays of each field of
+    the items are appended to a single contiguous file per field
+    (<field>.bin), and their dtypes, offsets and shapes are recorded in an
+    index (index.pickle), along with a small metadata table holding the
+    non-array values of each item (filenames, speaker ids, ...).
+
+    The index is written when the writer is closed. Opening the writer on an
+    existing store resumes it: the bytes appended after its last index
+    write (e.g. by an interrupted export) are dropped.
+    """
+
+    INDEX_FILENAME = 'index.pickle'
+
+    def __init__(self, path):
+        self._path = path
+        os.makedirs(self._path, exist_ok=True)
+        self._keys = list()
+        self._metadata = list()
+        self._fields = dict()
+        self._files = dict()
+
+        index_path = self._path + os.sep + self.INDEX_FILENAME
+        if os.path.isfile(index_path):
+            with open(index_path, 'rb') as file:
+                index = pickle.load(file)
+            self._keys = index['keys']
+            self._metadata = index['metadata']
+            self._fields = index['fields']
+            for name, field in self._fields.items():
+                with open(self._field_path(name), 'ab') as file:
+                    file.truncate(field['offsets'][-1] * np.dtype(field['dtype']).itemsize)
+        self._written_keys = set(self._keys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._written_keys
+
+    def write(self, key, dic):
+        """
+        Append an item to the store.
+
+        Args:
+            key: Identifier of the item (e.g. its index in the exported
+                subset), used to skip it when the export is resumed.
+            dic: Dictionary of the item. Its numpy arrays and tensors are
+                stored in the field files, its other values in the metadata
+                table.
+        """
+
+        if key in self._written_keys:
+            raise ValueError("Item '{}' already written in the store at '{}'".format(key, self._path))
+
+        metadata = dict()
+        arrays = dict()
+        for name, value in dic.items():
+            if torch.is_tensor(value):
+                value = value.detach().cpu().numpy()
+            if isinstance(value, np.ndarray):
+                arrays[name] = value
+            else:
+                metadata[name] = value
+
+        for name, array in arrays.items():
+            if name not in self._fields:
+                # A field first seen after some items is missing (None shape) from them
+                self._fields[name] = {
+                    'dtype': array.dtype.str,
+                    'offsets': [0] * (len(self._keys) + 1),
+                    'shapes': [None] * len(self._keys)
+                }
+            field = self._fields[name]
+            array = np.ascontiguousarray(array, dtype=np.dtype(field['dtype']))
+            self._file(name).write(array.tobytes())
+            field['offsets'].append(field['offsets'][-1] + array.size)
+            field['shapes'].append(array.shape)
+
+        for name, field in self._fields.items():
+            if name not in arrays:
+                field['offsets'].append(field['offsets'][-1])
+                field['shapes'].append(None)
+
+        self._keys.append(key)
+        self._written_keys.add(key)
+        self._metadata.append(metadata)
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files = dict()
+
+        index = {
+            'keys': self._keys,
+            'metadata': self._metadata,
+            'fields': self._fields
+        }
+        # Write then rename, so an interrupted write doesn't leave a truncated index
+        index_path = self._path + os.sep + self.INDEX_FILENAME
+        with open(index_path + '.tmp', 'wb') as file:
+            pickle.dump(index, file)
+        os.replace(index_path + '.tmp', index_path)
+
+    @staticmethod
+    def convert(pickles_path, store_path):
+        """
+        Convert a directory of per item pickle files (<index>.pickle, as
+        exported by VCTKSpeechStream.export_to_features()) into a store.
+        The items are written in the order of their indices, so the item i
+        of the store is the file i.pickle if none of them is missing.
+
+        Returns:
+            The number of items of the store.
+        """
+
+        indices = sorted(int(filename.split('.')[0]) for filename in os.listdir(pickles_path)
+            if filename.endswith('.pickle'))
+        with FeaturesStoreWriter(store_path) as writer:
+            for index in indices:
+                if index in writer:
+                    continue
+                path = pickles_path + os.sep + str(index) + '.pickle'
+                if os.path.getsize(path) == 0:
+                    continue
+                with open(path, 'rb') as file:
+                    writer.write(index, pickle.load(file))
+            return len(writer)
+
+    def _field_path(self, name):
+        return self._path + os.sep + name + '.bin'
+
+    def _file(self, name):
+        if name not in self._files:
+            self._files[name] = open(self._field_path(name), 'ab')
+        return self._files[name]
+
+
+class FeaturesStore(object):
+    """
+    Reader of a store written by FeaturesStoreWriter. The arrays of an item
+    are views of the memory mapped field files: reading an item only maps
+    its pages, without deserialization nor copy.
+
+    A field file is mapped on the first access to the field, so each
+    DataLoader worker maps them in its own process, and the files of the
+    fields that are never requested are never read.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        index_path = self._path + os.sep + FeaturesStoreWriter.INDEX_FILENAME
+        if not os.path.isfile(index_path):
+            raise OSError("No features store index '{}'".format(index_path))
+
+        with open(index_path, 'rb') as file:
+            index = pickle.load(file)
+        self._keys = index['keys']
+        self._metadata = index['metadata']
+        self._fields = index['fields']
+        self._arrays = dict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __getstate__(self):
+        # The workers spawned by a DataLoader map the files again, instead of receiving a copy of the mapped arrays
+        state = self.__dict__.copy()
+        state['_arrays'] = dict()
+        return state
+
+    def __getitem__(self, position):
+        return self.get(position)
+
+    def get(self, position, fields=None):
+        """
+        Args:
+            position: Position of the item in the store.
+            fields: Names of the fields (arrays or metadata) to read, or None
+                for all of them.
+
+        Returns:
+            A dictionary of the requested fields of the item.
+        """
+
+        metadata = self._metadata[position]
+        if fields is None:
+            dic = dict(metadata)
+            fields = self._fields.keys()
+        else:
+            dic = {name: metadata[name] for name in fields if name in metadata}
+
+        for name in fields:
+            field = self._fields.get(name, None)
+            if field is None or field['shapes'][position] is None:
+                continue
+            if name not in self._arrays:
+                self._arrays[name] = self._map(name, field)
+            offsets = field['offsets']
+            dic[name] = self._arrays[name][offsets[position]:offsets[position + 1]].reshape(field['shapes'][position])
+        return dic
+
+    @property
+    def keys(self):
+        return self._keys
+
+    @property
+    def fields(self):
+        return list(self._fields.keys())
+
+    def _map(self, name, field):
+        if field['offsets'][-1] == 0:
+            # An empty file can't be mapped
+            return np.empty(0, dtype=np.dtype(field['dtype']))
+        # Copy on write mapping, so the views are writable (as expected by torch.as_tensor())
+        # without ever modifying the store
+        return np.memmap(self._path + os.sep + name + '.bin', dtype=np.dtype(field['dtype']), mode='c',
+            shape=(field['offsets'][-1],))
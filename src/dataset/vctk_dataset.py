@@ -25,6 +25,7 @@
  #####################################################################################
 
 from dataset.vctk import VCTK
+from dataset.vctk_metadata_index import VCTKMetadataIndex
 from speech_utils.mu_law import MuLaw
 
 from torch.utils.data import Dataset
@@ -47,8 +48,10 @@ class VCTKDataset(Dataset):
         self._top_db = configuration['top_db']
         self._length = None if configuration['length'] is None else configuration['length'] + 1
         self._quantize = configuration['quantize']
+        self._metadata_index = VCTKMetadataIndex.load_from_configuration(configuration)
 
     def _preprocessing(self, audio, quantized):
+        start_trimming = None
         if self._length is not None:
             if len(audio) <= self._length :
                 # padding
@@ -58,7 +61,6 @@ class VCTKDataset(Dataset):
                 quantized = np.concatenate(
                     (quantized, self._quantize // 2 * np.ones(pad)))
                 quantized = quantized.astype(np.long)
-                start_trimming = None
             else:
                 # trimming
                 start_trimming = random.randint(0, len(audio) - self._length - 1)
@@ -106,7 +108,12 @@ class VCTKDataset(Dataset):
         split_path = wav_filename.split(os.sep)
         groundtruth_alignment_path = os.sep.join(split_path[:-3]) + os.sep + 'phonemes' + os.sep + split_path[-2] + os.sep + split_path[-1].replace('.wav', '.TextGrid')
         detected_sil_duration = 0.0
-        if os.path.isfile(groundtruth_alignment_path):
+        trimming_indices = None
+        if self._metadata_index is not None and wav_filename in self._metadata_index:
+            detected_sil_duration = self._metadata_index.leading_silence(wav_filename) or 0.0
+            trimming_indices = self._metadata_index.trimming_indices(wav_filename, self._top_db,
+                self._sampling_rate, self._res_type)
+        elif os.path.isfile(groundtruth_alignment_path):
             tg = textgrid.TextGrid()
             tg.read(groundtruth_alignment_path)
             for interval in tg.tiers[1]:
@@ -119,7 +126,8 @@ class VCTKDataset(Dataset):
             self._sampling_rate,
             self._res_type,
             self._top_db,
-            trimming_duration=detected_sil_duration if detected_sil_duration != 0.0 else None
+            trimming_duration=detected_sil_duration if detected_sil_duration != 0.0 else None,
+            trimming_indices=trimming_indices
         )
 
         quantized = MuLaw.encode(audio)
@@ -133,15 +141,19 @@ class VCTKDataset(Dataset):
         shifting_time = trimming_time + (0 if start_trimming is None else start_trimming / self._sampling_rate)
 
         return preprocessed_audio, one_hot, speaker_id, quantized, wav_filename, self._sampling_rate, \
-            shifting_time, 0 if start_trimming is None else start_trimming, self._length - 1, self._top_db
+            shifting_time, 0 if start_trimming is None else start_trimming, quantized.shape[0], self._top_db
 
     def __len__(self):
         return len(self._audios)
 
-    def _load_wav(self, filename, sampling_rate, res_type, top_db, trimming_duration=None):
-        raw, _ = librosa.load(filename, sampling_rate, res_type=res_type)
+    def _load_wav(self, filename, sampling_rate, res_type, top_db, trimming_duration=None, trimming_indices=None):
+        raw, _ = librosa.load(filename, sr=sampling_rate, res_type=res_type)
         if trimming_duration is None:
-            trimmed_audio, trimming_indices = librosa.effects.trim(raw, top_db=top_db)
+            if trimming_indices is None:
+                trimmed_audio, trimming_indices = librosa.effects.trim(raw, top_db=top_db)
+            else:
+                # Indexed trimming indices (see VCTKMetadataIndex)
+                trimmed_audio = raw[trimming_indices[0]:trimming_indices[1]]
             trimming_time = trimming_indices[0] / sampling_rate
         else:
             trimmed_audio = raw[int(trimming_duration * sampling_rate):]
@@ -37,12 +37,48 @@ class VCTKFeaturesDataset(Dataset):
         self._subdirectory = subdirectory
         features_path = self._vctk_path + os.sep + features_path
         self._sub_features_path = features_path + os.sep + self._subdirectory
-        self._files_number = len(os.listdir(self._sub_features_path))
+        # Without the export manifest and the temporary files of an interrupted export. The
+        # numbering of the files has holes where the export skipped invalid or failed items
+        self._file_indices = sorted(int(filename[:-len('.pickle')]) for filename in os.listdir(self._sub_features_path)
+            if filename.endswith('.pickle'))
+        self._files_number = len(self._file_indices)
         self._normalizer = normalizer
+        self._fields = None
 
     def __getitem__(self, index):
+        dic = self._load(index, self._fields)
+
+        if self._normalizer:
+            for key in ['input_features', 'output_features']:
+                if key in dic:
+                    dic[key] = (dic[key] - self._normalizer['train_mean']) / self._normalizer['train_std']
+
+        for key in ['quantized', 'one_hot']:
+            if self._fields is None or key in self._fields:
+                dic[key] = np.array([]) if dic.get(key) is None else dic[key]
+        dic['index'] = index
+
+        return dic
+
+    def __len__(self):
+        return self._files_number
+
+    @property
+    def fields(self):
+        """
+        The fields of the items, or None for all of them. The other fields
+        are dropped before the collate of the batches ('index' is always kept).
+        """
+
+        return self._fields
+
+    @fields.setter
+    def fields(self, fields):
+        self._fields = None if fields is None else list(fields)
+
+    def _load(self, index, fields=None):
         dic = None
-        path = self._sub_features_path + os.sep + str(index) + '.pickle'
+        path = self._sub_features_path + os.sep + str(self._file_indices[index]) + '.pickle'
 
         if not os.path.isfile(path):
             raise OSError("No such file '{}'".format(path))
@@ -53,15 +89,8 @@ class VCTKFeaturesDataset(Dataset):
         with open(path, 'rb') as file:
             dic = pickle.load(file)
 
-        if self._normalizer:
-            dic['input_features'] = (dic['input_features'] - self._normalizer['train_mean']) / self._normalizer['train_std']
-            dic['output_features'] = (dic['output_features'] - self._normalizer['train_mean']) / self._normalizer['train_std']
-
-        dic['quantized'] = np.array([]) if dic['quantized'] is None else dic['quantized']
-        dic['one_hot'] = np.array([]) if dic['one_hot'] is None else dic['one_hot']
-        dic['index'] = index
+        # A pickle file is deserialized as a whole, so the projection only saves the collate
+        if fields is not None:
+            dic = {key: dic[key] for key in fields if key in dic}
 
         return dic
-
-    def __len__(self):
-        return self._files_number
@@ -0,0 +1,54 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+from dataset.vctk_features_dataset import VCTKFeaturesDataset
+from dataset.features_store import FeaturesStore
+
+import os
+
+
+class VCTKFeaturesMemmapDataset(VCTKFeaturesDataset):
+    """
+    VCTKFeaturesDataset reading the features of a memory mapped store
+    (<features_path>/<subdirectory>.memmap, see FeaturesStoreWriter),
+    instead of a pickle file per utterance.
+    """
+
+    def __init__(self, vctk_path, subdirectory, normalizer=None, features_path='features'):
+        self._vctk_path = vctk_path
+        self._subdirectory = subdirectory
+        self._store = FeaturesStore(VCTKFeaturesMemmapDataset.store_path(vctk_path, subdirectory, features_path))
+        self._files_number = len(self._store)
+        self._normalizer = normalizer
+        self._fields = None
+
+    @staticmethod
+    def store_path(vctk_path, subdirectory, features_path='features'):
+        return vctk_path + os.sep + features_path + os.sep + subdirectory + '.memmap'
+
+    def _load(self, index, fields=None):
+        # Only the files of the requested fields are mapped and read
+        return self._store.get(index, fields)
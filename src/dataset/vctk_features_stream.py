@@ -25,11 +25,14 @@
  #####################################################################################
 
 from dataset.vctk_features_dataset import VCTKFeaturesDataset
+from dataset.vctk_features_memmap_dataset import VCTKFeaturesMemmapDataset
 from error_handling.console_logger import ConsoleLogger
 from error_handling.logger_factory import LoggerFactory
 from . import LOG_PATH
 
 from torch.utils.data import DataLoader
+from torch.utils.data.dataloader import default_collate
+import torch
 import numpy as np
 import pathlib
 import os
@@ -46,26 +49,38 @@ class VCTKFeaturesStream(object):
             with open(configuration['normalizer_path'], 'rb') as file:
                 self._normalizer = pickle.load(file)
 
-        self._training_data = VCTKFeaturesDataset(vctk_path, 'train', self._normalizer, features_path=configuration['features_path'])
-        self._validation_data = VCTKFeaturesDataset(vctk_path, 'val', self._normalizer, features_path=configuration['features_path'])
+        features_store = configuration.get('features_store', 'pickle')
+        if features_store == 'pickle':
+            dataset_type = VCTKFeaturesDataset
+        elif features_store == 'memmap':
+            dataset_type = VCTKFeaturesMemmapDataset
+        else:
+            raise NotImplementedError("Features store '{}' isn't implemented for now".format(features_store))
+
+        self._training_data = dataset_type(vctk_path, 'train', self._normalizer, features_path=configuration['features_path'])
+        self._validation_data = dataset_type(vctk_path, 'val', self._normalizer, features_path=configuration['features_path'])
         factor = 1 if len(gpu_ids) == 0 else len(gpu_ids)
 
         factor = 1 # FIXME
         self._training_batch_size = configuration['batch_size']
         self._validation_batch_size = 1
 
+        collate_fn = self.pad_collate if configuration.get('pad_variable_lengths', False) else None
+
         self._training_loader = DataLoader(
             self._training_data,
             batch_size=self._training_batch_size,
             shuffle=True,
             num_workers=configuration['num_workers'],
-            pin_memory=use_cuda
+            pin_memory=use_cuda,
+            collate_fn=collate_fn
         )
         self._validation_loader = DataLoader(
             self._validation_data,
             batch_size=self._validation_batch_size,
             num_workers=configuration['num_workers'],
-            pin_memory=use_cuda
+            pin_memory=use_cuda,
+            collate_fn=collate_fn
         )
         self._speaker_dic = self._make_speaker_dic(vctk_path + os.sep + 'raw' + os.sep + 'VCTK-Corpus')
         self._vctk_path = vctk_path
@@ -104,6 +119,46 @@ class VCTKFeaturesStream(object):
     def normalizer(self):
         return self._normalizer
 
+    def select_fields(self, fields):
+        """
+        Restrict the items of the training and validation data to the
+        specified fields (e.g. the DATA_FIELDS declared by a trainer), so
+        that the other fields are neither read (when the store allows it)
+        nor collated.
+
+        Args:
+            fields: Names of the fields, or None for all of them.
+        """
+
+        self._training_data.fields = fields
+        self._validation_data.fields = fields
+
+    @staticmethod
+    def pad_collate(batch):
+        """
+        Collate the features of utterances of different lengths, by zero
+        padding the arrays of each key to the largest shape of the batch.
+
+        Returns:
+            The collated batch, with the number of input features frames of
+            each utterance in 'features_lengths', used to mask the padding
+            frames in the model and in the reconstruction loss.
+        """
+
+        collated = dict()
+        for key in batch[0]:
+            values = [sample[key] for sample in batch]
+            if isinstance(values[0], np.ndarray) and len(set(value.shape for value in values)) > 1 \
+                and len(set(value.ndim for value in values)) == 1:
+                shape = np.max([value.shape for value in values], axis=0)
+                values = [np.pad(value, [(0, size - value_size) for size, value_size in zip(shape, value.shape)])
+                    for value in values]
+            collated[key] = default_collate(values)
+
+        if 'input_features' in batch[0]:
+            collated['features_lengths'] = torch.tensor([len(sample['input_features']) for sample in batch])
+        return collated
+
     def _make_speaker_dic(self, root):
         speakers = [
             str(speaker.name) for speaker in pathlib.Path(root).glob('wav48/*/')]
@@ -0,0 +1,223 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+from tqdm import tqdm
+import librosa
+import soundfile
+import textgrid
+import pathlib
+import pickle
+import os
+
+
+def _utterance_metadata(wav_filename, speaker_id, sampling_rate, res_type, top_dbs):
+    raw_length = soundfile.info(wav_filename).frames
+    audio, _ = librosa.load(wav_filename, sr=sampling_rate, res_type=res_type)
+    trimming_indices = dict()
+    for top_db in top_dbs:
+        _, indices = librosa.effects.trim(audio, top_db=top_db)
+        trimming_indices[top_db] = (int(indices[0]), int(indices[1]))
+
+    phonemes_alignment_path = VCTKMetadataIndex.phonemes_alignment_path(wav_filename)
+    phonemes = VCTKMetadataIndex.read_phonemes(phonemes_alignment_path) \
+        if os.path.isfile(phonemes_alignment_path) else None
+
+    return {
+        'speaker_id': speaker_id,
+        'raw_length': raw_length,
+        'resampled_length': len(audio),
+        'trimming_indices': trimming_indices,
+        'leading_silence_duration': None if phonemes is None else VCTKMetadataIndex.leading_silence_duration(phonemes),
+        'phonemes': phonemes
+    }
+
+
+class VCTKMetadataIndex(object):
+    """
+    Metadata of the VCTK utterances, computed once over the corpus and
+    saved in a single pickle file, so that the datasets, the evaluation and
+    the scripts don't parse the TextGrid files nor trim the waveforms again:
+    for each utterance (identified by the name of its wav file, e.g.
+    'p225_001'), its speaker id, its raw and resampled lengths, its trimming
+    indices at each top_db, and if its phonemes alignment is available, the
+    (mark, min time, max time) of the phonemes of its alignment and the
+    duration of its leading silence.
+
+    An index is loaded once per process (see load()).
+    """
+
+    _loaded_indices = dict()
+
+    def __init__(self, sampling_rate, res_type, utterances):
+        self._sampling_rate = sampling_rate
+        self._res_type = res_type
+        self._utterances = utterances
+
+    @staticmethod
+    def build(wav_filenames, speaker_dic, sampling_rate, res_type, top_dbs, workers_number=0):
+        """
+        Args:
+            wav_filenames: Paths of the wav files of the corpus (e.g. VCTK.audios).
+            speaker_dic: Dictionary of the speaker ids.
+            sampling_rate: Sampling rate of the resampled waveforms.
+            res_type: Resampling algorithm, as the one of VCTKDataset.
+            top_dbs: Thresholds (in decibels) of the trimming indices.
+            workers_number: Number of processes (0: one per CPU).
+        """
+
+        workers_number = workers_number if workers_number > 0 else cpu_count()
+        utterances = dict()
+        with ProcessPoolExecutor(max_workers=workers_number) as executor:
+            futures = {
+                VCTKMetadataIndex.utterance_key(wav_filename): executor.submit(_utterance_metadata,
+                    wav_filename, speaker_dic[pathlib.Path(wav_filename).parent.name], sampling_rate,
+                    res_type, sorted(set(top_dbs)))
+                for wav_filename in wav_filenames
+            }
+            for utterance_key, future in tqdm(futures.items()):
+                utterances[utterance_key] = future.result()
+
+        return VCTKMetadataIndex(sampling_rate, res_type, utterances)
+
+    @staticmethod
+    def load(path):
+        """
+        Returns:
+            The index saved at path, read from the file only on the first load of the process.
+        """
+
+        path = os.path.abspath(path)
+        if path not in VCTKMetadataIndex._loaded_indices:
+            with open(path, 'rb') as file:
+                index = pickle.load(file)
+            VCTKMetadataIndex._loaded_indices[path] = VCTKMetadataIndex(index['sampling_rate'], index['res_type'],
+                index['utterances'])
+        return VCTKMetadataIndex._loaded_indices[path]
+
+    @staticmethod
+    def load_from_configuration(configuration):
+        """
+        Returns:
+            The index of the 'metadata_index_path' of the configuration, or None if
+            it isn't specified or built (the metadata are then computed on the fly).
+        """
+
+        path = configuration.get('metadata_index_path', None)
+        if path is None or not os.path.isfile(path):
+            return None
+        return VCTKMetadataIndex.load(path)
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            pickle.dump({
+                'sampling_rate': self._sampling_rate,
+                'res_type': self._res_type,
+                'utterances': self._utterances
+            }, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __len__(self):
+        return len(self._utterances)
+
+    def __contains__(self, wav_filename):
+        return VCTKMetadataIndex.utterance_key(wav_filename) in self._utterances
+
+    def get(self, wav_filename):
+        """
+        Returns:
+            The metadata of the utterance of the wav file, or None if it isn't in the index.
+        """
+
+        return self._utterances.get(VCTKMetadataIndex.utterance_key(wav_filename), None)
+
+    def leading_silence(self, wav_filename):
+        """
+        Returns:
+            The duration of the leading silence of the phonemes alignment of the
+            utterance, or None if the utterance has no alignment or isn't indexed.
+        """
+
+        metadata = self.get(wav_filename)
+        return None if metadata is None else metadata['leading_silence_duration']
+
+    def trimming_indices(self, wav_filename, top_db, sampling_rate, res_type):
+        """
+        Returns:
+            The (start, end) trimming indices of the utterance waveform resampled at
+            sampling_rate with res_type, or None if they aren't indexed.
+        """
+
+        metadata = self.get(wav_filename)
+        if metadata is None or sampling_rate != self._sampling_rate or res_type != self._res_type:
+            return None
+        return metadata['trimming_indices'].get(top_db, None)
+
+    def phonemes_intervals(self, wav_filename):
+        """
+        Returns:
+            The phonemes of the alignment of the utterance as textgrid.Interval, or
+            None if the utterance has no alignment or isn't indexed.
+        """
+
+        metadata = self.get(wav_filename)
+        if metadata is None or metadata['phonemes'] is None:
+            return None
+        return [textgrid.Interval(min_time, max_time, mark) for mark, min_time, max_time in metadata['phonemes']]
+
+    @property
+    def sampling_rate(self):
+        return self._sampling_rate
+
+    @staticmethod
+    def utterance_key(wav_filename):
+        return os.path.basename(wav_filename).replace('.wav', '')
+
+    @staticmethod
+    def phonemes_alignment_path(wav_filename):
+        split_path = wav_filename.split(os.sep)
+        return os.sep.join(split_path[:-3]) + os.sep + 'phonemes' + os.sep + split_path[-2] + os.sep + \
+            split_path[-1].replace('.wav', '.TextGrid')
+
+    @staticmethod
+    def read_phonemes(phonemes_alignment_path):
+        """
+        Returns:
+            The (mark, min time, max time) of the intervals of the phonemes tier of the TextGrid file.
+        """
+
+        tg = textgrid.TextGrid()
+        tg.read(phonemes_alignment_path)
+        return [(interval.mark, float(interval.minTime), float(interval.maxTime)) for interval in tg.tiers[1]]
+
+    @staticmethod
+    def leading_silence_duration(phonemes):
+        duration = 0.0
+        for mark, min_time, max_time in phonemes:
+            if mark != 'sil':
+                break
+            duration += max_time - min_time
+        return duration
@@ -26,16 +26,17 @@
 
 from dataset.vctk_dataset import VCTKDataset
 from dataset.vctk import VCTK
-from speech_utils.speech_features import SpeechFeatures
+from dataset.features_store import FeaturesStoreWriter
+from dataset.features_exporter import FeaturesExporter
+from dataset.vctk_features_memmap_dataset import VCTKFeaturesMemmapDataset
 from error_handling.console_logger import ConsoleLogger
 from error_handling.logger_factory import LoggerFactory
 from . import LOG_PATH
 
 from torch.utils.data import DataLoader
 import numpy as np
-from tqdm import tqdm
 import os
-import pickle
+import contextlib
 
 
 class VCTKSpeechStream(object):
@@ -116,98 +117,10 @@ class VCTKSpeechStream(object):
         else:
             ConsoleLogger.status('Val features directory already created at path: {}'.format(val_features_path))
 
-        def process(loader, output_dir, input_features_name, output_features_name,
-            rate, input_filters_number, output_filters_number, input_target_shape,
-            augment_output_features, export_one_hot_features):
-
-            initial_index = 0
-            attempts = 10
-            current_attempt = 0
-            total_length = len(loader)
-
-            while current_attempt < attempts:
-                try:
-                    i = initial_index
-                    bar = tqdm(loader, initial=initial_index)
-                    for data in bar:
-                        (preprocessed_audio, one_hot, speaker_id, quantized, wav_filename, sampling_rate, shifting_time, random_starting_index, preprocessed_length, top_db) = data
-
-                        output_path = output_dir + os.sep + str(i) + '.pickle'
-                        if os.path.isfile(output_path):
-                            if os.path.getsize(output_path) == 0:
-                                bar.set_description('{} already exists but is empty. Computing it again...'.format(output_path))
-                                os.remove(output_path)
-                            else:
-                                bar.set_description('{} already exists'.format(output_path))
-                            i += 1
-                            continue
-
-                        input_features = SpeechFeatures.features_from_name(
-                            name=input_features_name,
-                            signal=preprocessed_audio,
-                            rate=rate,
-                            filters_number=input_filters_number
-                        )
-
-                        if input_features.shape[0] != input_target_shape[0] or input_features.shape[1] != input_target_shape[1]:
-                            ConsoleLogger.warn("Raw features number {} with invalid dimension {} will not be saved. Target shape: {}".format(i, input_features.shape, input_target_shape))
-                            i += 1
-                            continue
-
-                        output_features = SpeechFeatures.features_from_name(
-                            name=output_features_name,
-                            signal=preprocessed_audio,
-                            rate=rate,
-                            filters_number=output_filters_number,
-                            augmented=augment_output_features
-                        )
-
-                        # TODO: add an option in configuration to save quantized/one_hot or not
-                        output = {
-                            'preprocessed_audio': preprocessed_audio,
-                            'wav_filename': wav_filename,
-                            'input_features': input_features,
-                            'one_hot': one_hot if export_one_hot_features else np.array([]),
-                            'quantized': np.array([]),
-                            'speaker_id': speaker_id,
-                            'output_features': output_features,
-                            'shifting_time': shifting_time,
-                            'random_starting_index': random_starting_index,
-                            'preprocessed_length': preprocessed_length,
-                            'sampling_rate': sampling_rate,
-                            'top_db': top_db
-                        }
-
-                        with open(output_path, 'wb') as file:
-                            pickle.dump(output, file)
-
-                        bar.set_description('{} saved'.format(output_path))
-
-                        i += 1
-
-                        if i == total_length:
-                            bar.update(total_length)
-                            break
-
-                    bar.close()
-                    break
-                except KeyboardInterrupt:
-                    bar.close()
-                    ConsoleLogger.warn('Keyboard interrupt detected. Leaving the function...')
-                    return
-                except:
-                    error_message = 'An error occured in the data loader at {}/{}. Current attempt: {}/{}'.format(output_dir, i, current_attempt+1, attempts)
-                    self._logger.exception(error_message)
-                    ConsoleLogger.error(error_message)
-                    initial_index = i
-                    current_attempt += 1
-                    continue
-
-        try:
-            ConsoleLogger.status('Processing training part')
-            process(
-                loader=self._training_loader,
-                output_dir=train_features_path,
+        def process(dataset, output_dir, writer):
+            return FeaturesExporter(
+                dataset=dataset,
+                output_dir=output_dir,
                 input_features_name=configuration['input_features_type'],
                 output_features_name=configuration['output_features_type'],
                 rate=configuration['sampling_rate'],
@@ -215,26 +128,47 @@ class VCTKSpeechStream(object):
                 output_filters_number=configuration['output_features_filters'],
                 input_target_shape=(configuration['input_features_dim'], configuration['input_features_filters'] * 3),
                 augment_output_features=configuration['augment_output_features'],
-                export_one_hot_features=configuration['export_one_hot_features']
-            )
-            ConsoleLogger.success('Training part processed')
+                export_one_hot_features=configuration['export_one_hot_features'],
+                writer=writer,
+                workers_number=configuration.get('export_workers', 0),
+                batch_size=configuration.get('export_batch_size', 16)
+            ).export()
+
+        try:
+            ConsoleLogger.status('Processing training part')
+            with self._features_writer(vctk_path, 'train', configuration) as writer:
+                counts = process(self._training_data, train_features_path, writer)
+            ConsoleLogger.success('Training part processed: {}'.format(counts))
+        except KeyboardInterrupt:
+            return
         except:
+            self._logger.exception('An error occured during training features generation')
             ConsoleLogger.error('An error occured during training features generation')
 
         try:
             ConsoleLogger.status('Processing validation part')
-            process(
-                loader=self._validation_loader,
-                output_dir=val_features_path,
-                input_features_name=configuration['input_features_type'],
-                output_features_name=configuration['output_features_type'],
-                rate=configuration['sampling_rate'],
-                input_filters_number=configuration['input_features_filters'],
-                output_filters_number=configuration['output_features_filters'],
-                input_target_shape=(configuration['input_features_dim'], configuration['input_features_filters'] * 3),
-                augment_output_features=configuration['augment_output_features'],
-                export_one_hot_features=configuration['export_one_hot_features']
-            )
-            ConsoleLogger.success('Validation part processed')
+            with self._features_writer(vctk_path, 'val', configuration) as writer:
+                counts = process(self._validation_data, val_features_path, writer)
+            ConsoleLogger.success('Validation part processed: {}'.format(counts))
+        except KeyboardInterrupt:
+            return
         except:
+            self._logger.exception('An error occured during validation features generation')
             ConsoleLogger.error('An error occured during validation features generation')
+
+    @staticmethod
+    def _features_writer(vctk_path, subset, configuration):
+        """
+        Returns:
+            A FeaturesStoreWriter of the memory mapped store of the subset if the
+            'features_store' of the configuration is 'memmap', or a context manager
+            of None if the features are saved in a pickle file per utterance.
+        """
+
+        features_store = configuration.get('features_store', 'pickle')
+        if features_store == 'memmap':
+            return FeaturesStoreWriter(VCTKFeaturesMemmapDataset.store_path(vctk_path, subset,
+                configuration['features_path']))
+        elif features_store == 'pickle':
+            return contextlib.nullcontext()
+        raise NotImplementedError("Features store '{}' isn't implemented for now".format(features_store))
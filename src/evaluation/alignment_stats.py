@@ -25,6 +25,7 @@
  #####################################################################################
 
 from error_handling.console_logger import ConsoleLogger
+from dataset.vctk_metadata_index import VCTKMetadataIndex
 
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1 import make_axes_locatable
@@ -52,9 +53,25 @@ class AlignmentStats(object):
         self._results_path = results_path
         self._experiment_name = experiment_name
         self._alignment_subset = alignment_subset
+        self._metadata_index = VCTKMetadataIndex.load_from_configuration(configuration)
 
         self._model.eval()
 
+    def _phonemes_intervals(self, wav_filename, phonemes_alignment_path):
+        """
+        Returns:
+            The phonemes intervals of the alignment of the utterance, from the
+            metadata index if the utterance is indexed, or None if it has no alignment.
+        """
+
+        if self._metadata_index is not None and wav_filename in self._metadata_index:
+            return self._metadata_index.phonemes_intervals(wav_filename)
+        if not os.path.isfile(phonemes_alignment_path):
+            return None
+        tg = textgrid.TextGrid()
+        tg.read(phonemes_alignment_path)
+        return tg.tiers[1]
+
     def compute_groundtruth_alignments(self):
         ConsoleLogger.status('Computing groundtruth alignments of VCTK val dataset...')
 
@@ -85,7 +102,8 @@ class AlignmentStats(object):
                     utterence_key = wav_filename.split('/')[-1].replace('.wav', '')
                     phonemes_alignment_path = os.sep.join(wav_filename.split('/')[:-3]) + os.sep + 'phonemes' + os.sep + utterence_key.split('_')[0] + os.sep \
                         + utterence_key + '.TextGrid'
-                    if not os.path.isfile(phonemes_alignment_path):
+                    phonemes_intervals = self._phonemes_intervals(wav_filename, phonemes_alignment_path)
+                    if phonemes_intervals is None:
                         # TODO: log this warn instead of print it
                         #ConsoleLogger.warn('File {} not found'.format(phonemes_alignment_path))
                         break
@@ -93,25 +111,23 @@ class AlignmentStats(object):
                     shifting_time = shifting_times[i].detach().cpu().item()
                     target_time_scale = np.arange((data_length / desired_time_interval) + 1) * desired_time_interval + shifting_time
                     shifted_indices = np.where(target_time_scale >= shifting_time)
-                    tg = textgrid.TextGrid()
-                    tg.read(phonemes_alignment_path)
-                    """if target_time_scale[-1] > tg.tiers[1][-1].maxTime:
+                    """if target_time_scale[-1] > phonemes_intervals[-1].maxTime:
                         ConsoleLogger.error('Shifting time error at {}.pickle: shifting_time:{}' \
-                            ' target_time_scale[-1]:{} > tg.tiers[1][-1].maxTime:{}\n'
+                            ' target_time_scale[-1]:{} > phonemes_intervals[-1].maxTime:{}\n'
                             'wav filename:{} phonemes alignment path:{}'.format(
                             loader_indices[i].detach().cpu().item(),
                             shifting_time,
                             target_time_scale[-1],
-                            tg.tiers[1][-1].maxTime,
+                            phonemes_intervals[-1].maxTime,
                             wav_filename, phonemes_alignment_path))
                         continue"""
 
                     phonemes = list()
                     current_target_time_index = 0
-                    for interval in tg.tiers[1]:
+                    for interval in phonemes_intervals:
                         if interval.mark in ['', '-', "'"]:
-                            if interval == tg.tiers[1][-1] and len(phonemes) != int(data_length / desired_time_interval):
-                                previous_interval = tg.tiers[1][-2]
+                            if interval == phonemes_intervals[-1] and len(phonemes) != int(data_length / desired_time_interval):
+                                previous_interval = phonemes_intervals[-2]
                                 ConsoleLogger.warn("{}/{} phonemes aligned. Add the last valid phoneme '{}' in the list to have the correct number.\n"
                                     "Sanity checks to find the possible cause:\n"
                                     "current_target_time_index < (data_length / desired_time_interval): {}\n"
@@ -142,7 +158,7 @@ class AlignmentStats(object):
                         if len(phonemes) == int(data_length / desired_time_interval):
                             break
                     if len(phonemes) != int(data_length / desired_time_interval):
-                        intervals = ['min:{} max:{} mark:{}'.format(interval.minTime, interval.maxTime, interval.mark) for interval in tg.tiers[1]]
+                        intervals = ['min:{} max:{} mark:{}'.format(interval.minTime, interval.maxTime, interval.mark) for interval in phonemes_intervals]
                         ConsoleLogger.error('Error - min:{} max:{} shifting:{} target_time_scale: {} intervals: {}\n'
                             '#phonemes:{} phonemes:{}\n'
                             'wav filename:{} phonemes alignment path:{}'.format(
@@ -293,13 +309,12 @@ class AlignmentStats(object):
 
                 z = self._model.encoder(valid_originals)
                 z = self._model.pre_vq_conv(z)
-                _, quantized, _, encodings, _, encoding_indices, _, \
-                    _, _, _, _ = self._model.vq(z, compute_distances_if_possible=False)
-                valid_reconstructions = self._model.decoder(quantized, self._data_stream.speaker_dic, speaker_ids)
+                vq_output = self._model.vq(z)
+                valid_reconstructions = self._model.decoder(vq_output.quantized, self._data_stream.speaker_dic, speaker_ids)
                 B = valid_reconstructions.size(0)
-                T = encoding_indices.size(0)
+                T = vq_output.encoding_indices.size(0)
 
-                encoding_indices = encoding_indices.view(B, -1).detach().cpu().numpy()
+                encoding_indices = vq_output.encoding_indices.view(B, -1).detach().cpu().numpy()
                 extended_time_scale = np.arange(T) * (data_length / T)
                 min_time = 0.0
 
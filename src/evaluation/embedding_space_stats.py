@@ -115,7 +115,7 @@ class EmbeddingSpaceStats(object):
 
     @staticmethod
     def compute_quantized_embedding_space_state(evaluation_entry, embedding, batch_size):
-        concatenated_quantized = evaluation_entry['concatenated_quantized'].detach().cpu().numpy()
+        concatenated_quantized = evaluation_entry['vq_output'].concatenated_quantized.detach().cpu().numpy()
         embedding = embedding.weight.data.cpu().detach().numpy()
         n_embedding = embedding.shape[0]
         encoding_indices = evaluation_entry['encoding_indices'].detach().cpu().numpy()
@@ -34,6 +34,9 @@ import pickle
 
 class BaseTrainer(object):
 
+    # Fields of the data items used by iterate() and initialize(), or None for all of them
+    DATA_FIELDS = None
+
     def __init__(self, device, data_stream, configuration, experiments_path, experiment_name, iterations_to_record=10):
         self._device = device
         self._data_stream = data_stream
@@ -46,6 +49,18 @@ class BaseTrainer(object):
         ConsoleLogger.status('start epoch: {}'.format(self._configuration['start_epoch']))
         ConsoleLogger.status('num epoch: {}'.format(self._configuration['num_epochs']))
 
+        self._data_stream.select_fields(self.DATA_FIELDS)
+
+        metrics = self.metrics
+        metrics.flush_interval = self._configuration.get('metrics_flush_interval', 100)
+
+        if self._configuration['start_epoch'] == 0:
+            self.initialize()
+
+        # Number of epochs needed to reach the target perplexity (if specified), to compare the initializations
+        target_perplexity = self._configuration.get('target_perplexity', None)
+        epochs_to_target_perplexity = None
+
         for epoch in range(self._configuration['start_epoch'], self._configuration['num_epochs']):
 
             with tqdm(self._data_stream.training_loader) as train_bar:
@@ -56,28 +71,51 @@ class BaseTrainer(object):
                 max_iterations_number = len(train_bar)
                 iterations = list(np.arange(max_iterations_number, step=(max_iterations_number / self._iterations_to_record) - 1, dtype=int))
 
+                metrics.reset()
                 for data in train_bar:
-                    losses, perplexity_value = self.iterate(data, epoch, iteration, iterations, train_bar)
-                    if losses is None or perplexity_value is None:
+                    losses, perplexity = self.iterate(data, epoch, iteration, iterations, train_bar)
+                    if losses is None or perplexity is None:
                         continue
-                    train_res_recon_error.append(losses)
-                    train_res_perplexity.append(perplexity_value)
+                    # The metrics stay on the device, and are only copied to the host by the flushes
+                    metrics.record(losses, perplexity)
+                    if metrics.should_flush():
+                        self._flush_metrics(metrics, epoch, train_bar, train_res_recon_error, train_res_perplexity)
                     iteration += 1
 
-                self.save(epoch, **{'train_res_recon_error': train_res_recon_error, 'train_res_perplexity': train_res_perplexity})
+                self._flush_metrics(metrics, epoch, train_bar, train_res_recon_error, train_res_perplexity)
+                summary = metrics.summary()
+                ConsoleLogger.status('Epoch {}: perplexity {:.3f} dead codes {}/{}'.format(
+                    epoch + 1, summary['epoch_perplexity'], summary['dead_codes'], len(summary['usage'])))
+                if target_perplexity and epochs_to_target_perplexity is None and summary['epoch_perplexity'] >= target_perplexity:
+                    epochs_to_target_perplexity = epoch + 1
+                    ConsoleLogger.success('Target perplexity {} reached after {} epoch(s)'.format(
+                        target_perplexity, epochs_to_target_perplexity))
+
+                self.save(epoch, **{'train_res_recon_error': train_res_recon_error, 'train_res_perplexity': train_res_perplexity,
+                    'train_res_codebook_usage': summary['usage'], 'train_res_dead_codes': summary['dead_codes'],
+                    'train_res_epoch_perplexity': summary['epoch_perplexity'],
+                    'train_res_epochs_to_target_perplexity': epochs_to_target_perplexity})
+
+    def _flush_metrics(self, metrics, epoch, train_bar, train_res_recon_error, train_res_perplexity):
+        losses, perplexities = metrics.flush()
+        if len(losses) == 0:
+            return
+        train_res_recon_error.extend(losses)
+        train_res_perplexity.extend(perplexities)
+        train_bar.set_description('Epoch {}: loss {:.4f} perplexity {:.3f}'.format(
+            epoch + 1, metrics.last['loss'], metrics.last['perplexity']))
 
-    def _record_codebook_stats(self, iteration, iterations, vq,
-        concatenated_quantized, encoding_indices, speaker_id, epoch):
+    def _record_codebook_stats(self, iteration, iterations, vq, vq_output, speaker_id, epoch):
 
         if not self._configuration['record_codebook_stats'] or iteration not in iterations:
             return
 
         embedding = vq.embedding.weight.data.cpu().detach().numpy()
         codebook_stats_entry = {
-            'concatenated_quantized': concatenated_quantized.detach().cpu().numpy(),
+            'concatenated_quantized': vq_output.concatenated_quantized.detach().cpu().numpy(),
             'embedding': embedding,
             'n_embedding': embedding.shape[0],
-            'encoding_indices': encoding_indices.detach().cpu().numpy(),
+            'encoding_indices': vq_output.encoding_indices.detach().cpu().numpy(),
             'speaker_ids': speaker_id.to(self._device).detach().cpu().numpy(),
             'batch_size': self._data_stream.training_batch_size
         }
@@ -101,7 +139,30 @@ class BaseTrainer(object):
         with open(gradient_stats_entry_path, 'wb') as file:
             pickle.dump(gradient_stats_entry, file)
 
+    def initialize(self):
+        """
+        Called before the first epoch of a new training (e.g. to initialize the codebook).
+        """
+
+        pass
+
+    @property
+    def metrics(self):
+        """
+        CodebookMetrics accumulating the outputs of iterate().
+        """
+
+        raise NotImplementedError
+
     def iterate(self, data, epoch, iteration, iterations, train_bar):
+        """
+        Train on a batch.
+
+        Returns:
+            losses: dict of scalar tensors, with at least the 'loss' key.
+            perplexity: scalar tensor.
+        """
+
         raise NotImplementedError
 
     def save(self, epoch, **kwargs):
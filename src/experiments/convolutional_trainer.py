@@ -25,6 +25,9 @@
  #####################################################################################
 
 from experiments.base_trainer import BaseTrainer
+from modules.kmeans import KMeans
+from modules.padding_mask import PaddingMask
+from error_handling.console_logger import ConsoleLogger
 
 import torch
 from torch import nn
@@ -33,6 +36,8 @@ import os
 
 class ConvolutionalTrainer(BaseTrainer):
 
+    DATA_FIELDS = ['input_features', 'output_features', 'speaker_id']
+
     def __init__(self, device, data_stream, configuration, experiments_path, experiment_name, **kwargs):
         super().__init__(device, data_stream, configuration, experiments_path, experiment_name)
 
@@ -41,37 +46,110 @@ class ConvolutionalTrainer(BaseTrainer):
         self._optimizer = kwargs.get('optimizer',
             optim.Adam(self._model.parameters(), lr=configuration['learning_rate'], amsgrad=True))
 
+        # Mixed precision: the forward pass runs under autocast, and the float16 gradients are scaled
+        self._use_mixed_precision = configuration.get('use_mixed_precision', False)
+        self._autocast_dtype = getattr(torch, configuration.get('mixed_precision_dtype', 'bfloat16'))
+        self._device_type = torch.device(device).type
+        self._scaler = torch.amp.GradScaler(self._device_type,
+            enabled=self._use_mixed_precision and self._autocast_dtype == torch.float16)
+
+    def initialize(self):
+        """
+        Warm start of the codebook(s) with k-means over the encoded frames
+        of the first codebook_initialization_batches training batches.
+        """
+
+        if self._configuration.get('codebook_initialization', 'random') != 'kmeans':
+            return
+
+        num_batches = self._configuration.get('codebook_initialization_batches', 50)
+        ConsoleLogger.status('Initializing the codebook with k-means over {} batches'.format(num_batches))
+
+        latents = list()
+        with torch.no_grad():
+            for data in self._data_stream.training_loader:
+                if len(latents) == num_batches:
+                    break
+                source = data['input_features'].to(self._device).permute(0, 2, 1).contiguous().float()
+                lengths = data['features_lengths'].to(self._device) if 'features_lengths' in data else None
+                z = self._model.pre_vq_conv(self._model.encoder(source, lengths))
+                mask = None if lengths is None else PaddingMask.from_lengths(
+                    self._model.encoder.output_lengths(lengths), z.size(2))
+                latents.append((z, mask))
+
+        vq = self._model.vq
+        quantizers = vq.quantizers if hasattr(vq, 'quantizers') else [vq]
+        group_dim = latents[0][0].size(1) // len(quantizers)
+        codebooks = list()
+        cluster_sizes = list()
+        for group, quantizer in enumerate(quantizers):
+            # Same flattening as in the quantizers, without the rows of padding frames
+            samples = list()
+            for z, mask in latents:
+                flat_z = quantizer.flatten(z[:, group * group_dim:(group + 1) * group_dim])
+                _, valid_rows = PaddingMask.quantizer_masks(mask, group_dim, quantizer.channels_first)
+                samples.append(flat_z if valid_rows is None else flat_z[valid_rows])
+            samples = torch.cat(samples)
+            centers, sizes = KMeans.fit(samples, quantizer.embedding.weight.size(0),
+                iterations=self._configuration.get('codebook_initialization_iterations', 100),
+                batch_size=self._configuration.get('codebook_initialization_batch_size', 4096))
+            codebooks.append(centers)
+            # Expected number of frames per batch, as the EMA cluster sizes
+            cluster_sizes.append(sizes / len(latents))
+
+        if len(quantizers) > 1:
+            vq.load_codebook(torch.stack(codebooks), torch.stack(cluster_sizes))
+        else:
+            vq.load_codebook(codebooks[0], cluster_sizes[0])
+
     def iterate(self, data, epoch, iteration, iterations, train_bar):
         source = data['input_features'].to(self._device)
         speaker_id = data['speaker_id'].to(self._device)
-        target = data['output_features'].to(self._device).permute(0, 2, 1).contiguous().float()
+        target = data['output_features'].to(self._device).permute(0, 2, 1).float()
+        # Lengths of the inputs of the padded batches (see VCTKFeaturesStream.pad_collate())
+        lengths = data['features_lengths'].to(self._device) if 'features_lengths' in data else None
 
         self._optimizer.zero_grad()
 
-        reconstructed_x, vq_loss, losses, perplexity, encoding_indices, concatenated_quantized = \
-            self._model(source, self._data_stream.speaker_dic, speaker_id)
-
-        reconstruction_loss = self._criterion(reconstructed_x, target)
-
-        loss = vq_loss + reconstruction_loss
-        losses['reconstruction_loss'] = reconstruction_loss.item()
-        losses['loss'] = loss.item()
+        with torch.autocast(self._device_type, dtype=self._autocast_dtype, enabled=self._use_mixed_precision):
+            reconstructed_x, vq_output = self._model(source, self._data_stream.speaker_dic, speaker_id, lengths)
+
+        if lengths is None:
+            reconstruction_loss = self._criterion(reconstructed_x.float(), target)
+        else:
+            """
+            The padding frames are zeroed in both the reconstruction and the target,
+            and the loss is rescaled from the mean over all the frames to the mean
+            over the valid ones (for the criterions averaging over the elements,
+            such as nn.MSELoss and nn.L1Loss).
+            """
+            mask = PaddingMask.from_lengths(lengths, target.size(2))
+            reconstruction_loss = self._criterion(PaddingMask.apply(reconstructed_x.float(), mask),
+                PaddingMask.apply(target, mask)) * mask.numel() / torch.clamp(torch.sum(mask), min=1)
+
+        loss = vq_output.vq_loss + reconstruction_loss
+        losses = vq_output.losses
+        losses['reconstruction_loss'] = reconstruction_loss.detach()
+        losses['loss'] = loss.detach()
 
         self._record_codebook_stats(iteration, iterations, self._model.vq,
-            concatenated_quantized, encoding_indices, data['speaker_id'], epoch)
+            vq_output, data['speaker_id'], epoch)
 
-        loss.backward()
+        self._scaler.scale(loss).backward()
 
+        # The gradient stats are recorded on the unscaled gradients (step() doesn't unscale them again)
+        self._scaler.unscale_(self._optimizer)
         self._record_gradient_stats({'model': self._model, 'encoder': self._model.encoder,
             'vq': self._model.vq, 'decoder': self._model.decoder}, iteration, iterations, epoch)
 
-        self._optimizer.step()
+        self._scaler.step(self._optimizer)
+        self._scaler.update()
 
-        perplexity_value = perplexity.item()
-        train_bar.set_description('Epoch {}: loss {:.4f} perplexity {:.3f}'.format(
-            epoch + 1, losses['loss'], perplexity_value))
+        return losses, vq_output.perplexity
 
-        return losses, perplexity_value
+    @property
+    def metrics(self):
+        return self._model.vq.metrics
 
     def save(self, epoch, **kwargs):
         torch.save({
@@ -80,7 +158,11 @@ class ConvolutionalTrainer(BaseTrainer):
             'model': self._model.state_dict(),
             'optimizer': self._optimizer.state_dict(),
             'train_res_recon_error': kwargs.get('train_res_recon_error', -1),
-            'train_res_perplexity': kwargs.get('train_res_perplexity', -1)},
+            'train_res_perplexity': kwargs.get('train_res_perplexity', -1),
+            'train_res_codebook_usage': kwargs.get('train_res_codebook_usage', None),
+            'train_res_dead_codes': kwargs.get('train_res_dead_codes', -1),
+            'train_res_epoch_perplexity': kwargs.get('train_res_epoch_perplexity', -1),
+            'train_res_epochs_to_target_perplexity': kwargs.get('train_res_epochs_to_target_perplexity', None)},
             os.path.join(self._experiments_path, '{}_{}_checkpoint.pth'.format(
                 self._experiment_name, epoch + 1))
         )
@@ -31,6 +31,7 @@ from evaluation.alignment_stats import AlignmentStats
 from evaluation.embedding_space_stats import EmbeddingSpaceStats
 
 import matplotlib.pyplot as plt
+import torch
 import torch.nn.functional as F
 import os
 import numpy as np
@@ -43,6 +44,10 @@ import pickle
 
 class Evaluator(object):
 
+    # Fields of the data items used by the evaluations (and by AlignmentStats)
+    DATA_FIELDS = ['preprocessed_audio', 'input_features', 'output_features', 'speaker_id', 'wav_filename',
+        'shifting_time', 'preprocessed_length']
+
     def __init__(self, device, model, data_stream, configuration, results_path, experiment_name):
         self._device = device
         self._model = model
@@ -52,8 +57,17 @@ class Evaluator(object):
         self._results_path = results_path
         self._experiment_name = experiment_name
 
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def data_stream(self):
+        return self._data_stream
+
     def evaluate(self, evaluation_options):
         self._model.eval()
+        self._data_stream.select_fields(self.DATA_FIELDS)
 
         if evaluation_options['plot_comparaison_plot'] or \
             evaluation_options['plot_quantized_embedding_spaces'] or \
@@ -72,6 +86,10 @@ class Evaluator(object):
         if evaluation_options['plot_distances_histogram']:
             self._plot_distances_histogram(evaluation_entry)
 
+        if evaluation_options['plot_validation_distances_histogram']:
+            self._plot_distances_histogram(self._compute_validation_distances(),
+                output_suffix='_validation-distances-histogram-plot.png')
+
         #self._test_denormalization(evaluation_entry)
 
         if evaluation_options['compute_many_to_one_mapping']:
@@ -137,10 +155,8 @@ class Evaluator(object):
 
         z = self._model.encoder(valid_originals)
         z = self._model.pre_vq_conv(z)
-        _, quantized, _, encodings, distances, encoding_indices, _, \
-            encoding_distances, embedding_distances, frames_vs_embedding_distances, \
-            concatenated_quantized = self._model.vq(z)
-        valid_reconstructions = self._model.decoder(quantized, self._data_stream.speaker_dic, speaker_ids)[0]
+        vq_output = self._model.vq(z)
+        valid_reconstructions = self._model.decoder(vq_output.quantized, self._data_stream.speaker_dic, speaker_ids)[0]
 
         return {
             'preprocessed_audio': preprocessed_audio,
@@ -151,14 +167,9 @@ class Evaluator(object):
             'shifting_time': shifting_time,
             'preprocessed_length': preprocessed_length,
             'batch_size': batch_size,
-            'quantized': quantized,
-            'encodings': encodings,
-            'distances': distances,
-            'encoding_indices': encoding_indices,
-            'encoding_distances': encoding_distances,
-            'embedding_distances': embedding_distances,
-            'frames_vs_embedding_distances': frames_vs_embedding_distances,
-            'concatenated_quantized': concatenated_quantized,
+            'quantized': vq_output.quantized,
+            'encoding_indices': vq_output.encoding_indices,
+            'vq_output': vq_output,
             'valid_reconstructions': valid_reconstructions
         }
 
@@ -185,7 +196,7 @@ class Evaluator(object):
 
         valid_originals = evaluation_entry['valid_originals'].detach().cpu()[0].numpy()
 
-        probs = F.softmax(-evaluation_entry['distances'][0], dim=1).detach().cpu().transpose(0, 1).contiguous()
+        probs = F.softmax(-evaluation_entry['vq_output'].distances[0], dim=1).detach().cpu().transpose(0, 1).contiguous()
 
         #target = self._target.detach().cpu()[0].numpy()
 
@@ -217,7 +228,7 @@ class Evaluator(object):
         axs[3].set_title('Softmax of distances computed in VQ\n($||z_e(x) - e_i||^2_2$ with $z_e(x)$ the output of the encoder prior to quantization)')
         self._plot_pcolormesh(probs, fig, x=self._compute_unified_time_scale(probs.shape[1], downsampling_factor=2), axis=axs[3])
 
-        encodings = evaluation_entry['encodings'].detach().cpu().numpy()
+        encodings = evaluation_entry['vq_output'].encodings.detach().cpu().numpy()
         axs[4].set_title('Encodings')
         self._plot_pcolormesh(encodings[0].transpose(), fig, x=self._compute_unified_time_scale(encodings[0].transpose().shape[1],
             downsampling_factor=2), axis=axs[4])
@@ -240,10 +251,38 @@ class Evaluator(object):
     def _compute_unified_time_scale(self, shape, winstep=0.01, downsampling_factor=1):
         return np.arange(shape) * winstep * downsampling_factor
 
-    def _plot_distances_histogram(self, evaluation_entry):
-        encoding_distances = evaluation_entry['encoding_distances'][0].detach().cpu().numpy()
-        embedding_distances = evaluation_entry['embedding_distances'].detach().cpu().numpy()
-        frames_vs_embedding_distances = evaluation_entry['frames_vs_embedding_distances'].detach()[0].cpu().transpose(0, 1).numpy().ravel()
+    def _compute_validation_distances(self):
+        """
+        Compute the distances diagnostics of the VQ over the whole validation set.
+        The encodings distances are computed per batch, the others for all the frames.
+        """
+
+        all_encoding_distances = list()
+        all_frames_vs_embedding_distances = list()
+        embedding_distances = None
+
+        with torch.no_grad():
+            with tqdm(self._data_stream.validation_loader) as bar:
+                for data in bar:
+                    valid_originals = data['input_features'].to(self._device).permute(0, 2, 1).contiguous().float()
+                    z = self._model.encoder(valid_originals)
+                    z = self._model.pre_vq_conv(z)
+                    encoding_distances, embedding_distances, frames_vs_embedding_distances = \
+                        self._model.vq.compute_distances(z)
+                    all_encoding_distances.append(encoding_distances.view(-1).cpu())
+                    all_frames_vs_embedding_distances.append(frames_vs_embedding_distances.view(
+                        -1, frames_vs_embedding_distances.size(2)).cpu())
+
+        return {
+            'encoding_distances': torch.cat(all_encoding_distances).unsqueeze(0),
+            'embedding_distances': embedding_distances,
+            'frames_vs_embedding_distances': torch.cat(all_frames_vs_embedding_distances).unsqueeze(0)
+        }
+
+    def _plot_distances_histogram(self, evaluation_entry, output_suffix='_distances-histogram-plot.png'):
+        encoding_distances = evaluation_entry['vq_output'].encoding_distances[0].detach().cpu().numpy()
+        embedding_distances = evaluation_entry['vq_output'].embedding_distances.detach().cpu().numpy()
+        frames_vs_embedding_distances = evaluation_entry['vq_output'].frames_vs_embedding_distances.detach()[0].cpu().transpose(0, 1).numpy().ravel()
 
         if self._configuration['verbose']:
             ConsoleLogger.status('encoding_distances[0].size(): {}'.format(encoding_distances.shape))
@@ -267,7 +306,7 @@ class Evaluator(object):
         )
         sns.distplot(frames_vs_embedding_distances, hist=True, kde=False, ax=axs[2], norm_hist=True)
 
-        output_path = self._results_path + os.sep + self._experiment_name + '_distances-histogram-plot.png'
+        output_path = self._results_path + os.sep + self._experiment_name + output_suffix
         fig.savefig(output_path, bbox_inches='tight', pad_inches=0)
         plt.close(fig)
 
@@ -326,12 +365,11 @@ class Evaluator(object):
 
                 z = self._model.encoder(valid_originals)
                 z = self._model.pre_vq_conv(z)
-                _, quantized, _, encodings, _, encoding_indices, _, \
-                    _, _, _, _ = self._model.vq(z)
-                valid_reconstructions = self._model.decoder(quantized, self._data_stream.speaker_dic, speaker_ids)
+                vq_output = self._model.vq(z)
+                valid_reconstructions = self._model.decoder(vq_output.quantized, self._data_stream.speaker_dic, speaker_ids)
                 B = valid_reconstructions.size(0)
 
-                encoding_indices = encoding_indices.view(B, -1, 1)
+                encoding_indices = vq_output.encoding_indices.view(B, -1, 1)
 
                 for i in range(len(valid_reconstructions)):
                     wav_filename = wav_filenames[0][i]
@@ -429,8 +467,7 @@ class Evaluator(object):
 
                 z = self._model.encoder(valid_originals)
                 z = self._model.pre_vq_conv(z)
-                _, quantized, _, _, _, _, _, \
-                    _, _, _, _ = self._model.vq(z)
+                quantized = self._model.vq(z).quantized
                 valid_reconstructions = self._model.decoder(quantized, self._data_stream.speaker_dic, speaker_ids)
                 B = valid_reconstructions.size(0)
 
@@ -461,8 +498,7 @@ class Evaluator(object):
 
                 z = self._model.encoder(valid_originals)
                 z = self._model.pre_vq_conv(z)
-                _, quantized, _, _, _, _, _, \
-                    _, _, _, _ = self._model.vq(z)
+                quantized = self._model.vq(z).quantized
                 valid_reconstructions = self._model.decoder(quantized, self._data_stream.speaker_dic, speaker_ids)
 
                 quantized_probs = F.softmax(quantized[0], dim=1).detach().cpu()
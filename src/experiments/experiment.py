@@ -26,6 +26,8 @@
 
 from experiments.device_configuration import DeviceConfiguration
 from experiments.pipeline_factory import PipelineFactory
+from experiments.post_training_quantization import PostTrainingQuantization
+from models.vq_tokenizer import VQTokenizer
 from error_handling.console_logger import ConsoleLogger
 
 import os
@@ -120,3 +122,15 @@ class Experiment(object):
         ConsoleLogger.status('Begins to evaluate the model')
         self._evaluator.evaluate(evaluation_options)
         ConsoleLogger.success("Succeed to runned the experiment called '{}'".format(self._name))
+
+    def export_tokenizer(self):
+        tokenizer_path = self._results_path + os.sep + self._name + '_vq-tokenizer.pt'
+        ConsoleLogger.status("Exporting the tokenizer of the experiment called '{}'".format(self._name))
+        self._evaluator.model.eval()
+        VQTokenizer.export(self._evaluator.model, tokenizer_path)
+        ConsoleLogger.success("Tokenizer exported at: '{}'".format(tokenizer_path))
+
+    def quantize(self):
+        ConsoleLogger.status("Quantizing the model of the experiment called '{}'".format(self._name))
+        PostTrainingQuantization(self._evaluator.model, self._evaluator.data_stream, self._configuration,
+            self._results_path, self._name).run()
@@ -54,6 +54,15 @@ class Experiments(object):
             experiment.train()
             torch.cuda.empty_cache()
 
+    def export_tokenizers(self):
+        for experiment in self._experiments:
+            experiment.export_tokenizer()
+
+    def quantize(self):
+        for experiment in self._experiments:
+            Experiments.set_deterministic_on(experiment.seed)
+            experiment.quantize()
+
     def evaluate(self, evaluation_options):
         # TODO: put all types of evaluation in evaluation_options, and skip this loop if none of them are set to true
         for experiment in self._experiments:
@@ -0,0 +1,244 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from modules.residual_stack import ResidualStack
+from modules.weight_norm_folding import WeightNormFolding
+from error_handling.console_logger import ConsoleLogger
+
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import copy
+import io
+import itertools
+import json
+import os
+import time
+import warnings
+
+
+class PostTrainingQuantization(object):
+    """
+    Post training static quantization of a ConvolutionalVQVAE, for the CPU
+    inference: the convolutions of the encoder, of the residual stacks and
+    of the decoder are quantized to int8 (per channel weights), with their
+    activation ranges calibrated on a sample of the validation set.
+
+    Each quantized submodule is replaced by its FX quantized graph, with
+    float inputs and outputs. The layers of the residual stacks are
+    quantized one by one, so the stacks keep their masked forward and
+    their layers, and the model keeps its forward (with or without
+    lengths), its chunked decoding and its streaming encoding. The
+    quantized model is saved as a state dict (see save() and load()),
+    as the FX quantized graphs can't be pickled. The pre VQ convolution and the
+    codebook are kept in float, as the outputs of the pre VQ convolution
+    are directly compared to the codebook. The output layer of the decoder
+    (_conv_trans_3) is kept in float too, as usual for the last layer of a
+    quantized model (and its quantized kernel is inaccurate for transposed
+    convolutions with different in and out channels).
+    """
+
+    quantized_encoder_submodules = ['_conv_1', '_conv_2', '_conv_3', '_conv_4', '_conv_5', '_residual_stack']
+    quantized_decoder_submodules = ['_conv_1', '_residual_stack', '_conv_trans_1', '_conv_trans_2']
+
+    DATA_FIELDS = ['input_features', 'output_features', 'speaker_id']
+
+    def __init__(self, model, data_stream, configuration, results_path, experiment_name):
+        self._model = model
+        self._data_stream = data_stream
+        self._configuration = configuration
+        self._results_path = results_path
+        self._experiment_name = experiment_name
+
+    def run(self):
+        """
+        Quantize the model on a calibration sample of the validation set,
+        compare it to the float model on the next validation batches, and
+        save the quantized model and the report in the results path.
+
+        Returns:
+            dict of the report.
+        """
+
+        calibration_batches = self._configuration.get('quantization_calibration_batches', 10)
+        evaluation_batches = self._configuration.get('quantization_evaluation_batches', 10)
+        self._data_stream.select_fields(self.DATA_FIELDS)
+        batches = list(itertools.islice(self._data_stream.validation_loader, calibration_batches + evaluation_batches))
+
+        model = WeightNormFolding.folded_copy(self._model).cpu().eval()
+        backend = self._configuration.get('quantization_backend', 'x86')
+        ConsoleLogger.status('Calibrating the quantization on {} validation batches'.format(calibration_batches))
+        # The float model is kept as the baseline of the comparison
+        quantized_model = PostTrainingQuantization.quantize(copy.deepcopy(model), batches[:calibration_batches],
+            self._data_stream.speaker_dic, backend)
+
+        report = PostTrainingQuantization.compare(model, quantized_model, batches[calibration_batches:],
+            self._data_stream.speaker_dic)
+        for name, value in report.items():
+            ConsoleLogger.status('{}: {}'.format(name, value))
+
+        model_path = self._results_path + os.sep + self._experiment_name + '_int8-model.pth'
+        PostTrainingQuantization.save(quantized_model, model_path, backend)
+        report_path = self._results_path + os.sep + self._experiment_name + '_quantization-report.json'
+        with open(report_path, 'w') as file:
+            json.dump(report, file, indent=4)
+        ConsoleLogger.success("Quantized model saved at: '{}' and report at: '{}'".format(model_path, report_path))
+
+        return report
+
+    @staticmethod
+    def quantize(model, calibration_batches, speaker_dic, backend='x86'):
+        """
+        Args:
+            model: ConvolutionalVQVAE on the CPU in eval mode, without weight
+                norm (see WeightNormFolding). It's quantized in place.
+            calibration_batches: list of batches of the features streams.
+            speaker_dic: dict of the speakers of the features streams.
+            backend: quantized engine ('x86', 'fbgemm' or 'qnnpack').
+
+        Returns:
+            The quantized model.
+        """
+
+        torch.backends.quantized.engine = backend
+        qconfig_mapping = get_default_qconfig_mapping(backend)
+        submodules = PostTrainingQuantization.quantized_submodules(model)
+
+        # Insert the observers, and calibrate them with the float model
+        for parent, name in submodules:
+            module = getattr(parent, name)
+            if isinstance(module, (nn.Conv1d, nn.ConvTranspose1d)):
+                # A single convolution can't be the root of the traced graph
+                module = nn.Sequential(module)
+            in_channels = next(submodule for submodule in module.modules()
+                if isinstance(submodule, (nn.Conv1d, nn.ConvTranspose1d))).in_channels
+            setattr(parent, name, prepare_fx(module, qconfig_mapping, (torch.zeros(1, in_channels, 8),)))
+
+        with torch.no_grad():
+            for data in calibration_batches:
+                model(data['input_features'], speaker_dic, data['speaker_id'])
+
+        for parent, name in submodules:
+            setattr(parent, name, convert_fx(getattr(parent, name)))
+
+        return model
+
+    @staticmethod
+    def quantized_submodules(model):
+        """
+        Returns:
+            list of the (parent, name) of the submodules of model to quantize.
+            The residual stacks are replaced by their layers, which are
+            unshared, as each layer has its own activation ranges.
+        """
+
+        submodules = list()
+        for parent, names in [(model.encoder, PostTrainingQuantization.quantized_encoder_submodules),
+            (model.decoder, PostTrainingQuantization.quantized_decoder_submodules)]:
+            for name in names:
+                module = getattr(parent, name)
+                if isinstance(module, ResidualStack):
+                    module._layers = nn.ModuleList([copy.deepcopy(layer) for layer in module.layers])
+                    submodules += [(module.layers, str(i)) for i in range(len(module.layers))]
+                else:
+                    submodules.append((parent, name))
+        return submodules
+
+    @staticmethod
+    def save(quantized_model, path, backend='x86'):
+        torch.save({
+            'state_dict': quantized_model.state_dict(),
+            'quantized_encoder_submodules': PostTrainingQuantization.quantized_encoder_submodules,
+            'quantized_decoder_submodules': PostTrainingQuantization.quantized_decoder_submodules,
+            'backend': backend
+        }, path)
+
+    @staticmethod
+    def load(path, configuration):
+        """
+        Load a quantized model saved by save(), by quantizing a float
+        ConvolutionalVQVAE of the same configuration to the same structure,
+        and loading the weights and the quantization parameters of path.
+
+        Returns:
+            The quantized model, on the CPU in eval mode.
+        """
+
+        checkpoint = torch.load(path, map_location='cpu')
+        if checkpoint['quantized_encoder_submodules'] != PostTrainingQuantization.quantized_encoder_submodules or \
+            checkpoint['quantized_decoder_submodules'] != PostTrainingQuantization.quantized_decoder_submodules:
+            raise ValueError("The quantized submodules of '{}' don't match the current ones".format(path))
+
+        model = WeightNormFolding.fold(ConvolutionalVQVAE(configuration, 'cpu')).eval()
+        with warnings.catch_warnings():
+            # The observers aren't calibrated, their quantization parameters are overwritten by the state dict
+            warnings.simplefilter('ignore')
+            model = PostTrainingQuantization.quantize(model, list(), None, checkpoint['backend'])
+        model.load_state_dict(checkpoint['state_dict'])
+        return model
+
+    @staticmethod
+    def compare(model, quantized_model, batches, speaker_dic):
+        """
+        Returns:
+            dict of the code index agreement, the reconstruction MSE, the
+            serialized size and the latency per batch of both models.
+        """
+
+        agreement, frames = 0, 0
+        mse = {'float': 0.0, 'int8': 0.0}
+        latency = {'float': 0.0, 'int8': 0.0}
+        with torch.no_grad():
+            for data in batches:
+                target = data['output_features'].permute(0, 2, 1).contiguous().float()
+                indices = dict()
+                for name, current_model in [('float', model), ('int8', quantized_model)]:
+                    start = time.perf_counter()
+                    reconstructed_x, vq_output = current_model(data['input_features'], speaker_dic, data['speaker_id'])
+                    latency[name] += (time.perf_counter() - start) / len(batches)
+                    mse[name] += F.mse_loss(reconstructed_x, target).item() / len(batches)
+                    indices[name] = vq_output.encoding_indices
+                agreement += (indices['float'] == indices['int8']).sum().item()
+                frames += indices['float'].numel()
+
+        return {
+            'code_index_agreement': agreement / frames,
+            'float_reconstruction_mse': mse['float'],
+            'int8_reconstruction_mse': mse['int8'],
+            'float_size_mb': PostTrainingQuantization.serialized_size(model) / 2**20,
+            'int8_size_mb': PostTrainingQuantization.serialized_size(quantized_model) / 2**20,
+            'float_latency_ms': latency['float'] * 1000,
+            'int8_latency_ms': latency['int8'] * 1000
+        }
+
+    @staticmethod
+    def serialized_size(model):
+        buffer = io.BytesIO()
+        torch.save(model.state_dict(), buffer)
+        return buffer.tell()
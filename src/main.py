@@ -27,6 +27,10 @@
 from error_handling.console_logger import ConsoleLogger
 from dataset.vctk_speech_stream import VCTKSpeechStream
 from dataset.vctk_features_stream import VCTKFeaturesStream
+from dataset.vctk_features_memmap_dataset import VCTKFeaturesMemmapDataset
+from dataset.features_store import FeaturesStoreWriter
+from dataset.vctk_metadata_index import VCTKMetadataIndex
+from dataset.vctk import VCTK
 from experiments.pipeline_factory import PipelineFactory
 from experiments.device_configuration import DeviceConfiguration
 from experiments.experiments import Experiments
@@ -67,7 +71,10 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--summary', nargs='?', default=None, type=str, help='The summary of the model based of a specified configuration file')
+    parser.add_argument('--quantize', action='store_true', help='Quantize the convolutions of the specified experiments to int8 for the CPU inference, and report the differences with the float models')
     parser.add_argument('--export_to_features', action='store_true', help='Export the VCTK dataset files to features')
+    parser.add_argument('--convert_features_to_memmap', action='store_true', help='Convert the pickle files of the exported features to memory mapped stores, read with features_store: memmap')
+    parser.add_argument('--build_metadata_index', action='store_true', help='Build the index of the metadata of the VCTK utterances (silences, trimming indices, lengths, alignments) at metadata_index_path')
     parser.add_argument('--compute_dataset_stats', action='store_true', help='Compute the mean and the std of the VCTK dataset')
     parser.add_argument('--experiments_configuration_path', nargs='?', default=default_experiments_configuration_path, type=str, help='The path of the experiments configuration file')
     parser.add_argument('--experiments_path', nargs='?', default=default_experiments_path, type=str, help='The path of the experiments ouput directory')
@@ -77,6 +84,7 @@ if __name__ == "__main__":
     parser.add_argument('--plot_quantized_embedding_spaces', action='store_true', help='Compute a 2D projection of the VQ codebook for a single sample')
     parser.add_argument('--compute_quantized_embedding_spaces_animation', action='store_true', help='Compute a 2D projection of the VQ codebook over training iterations')
     parser.add_argument('--plot_distances_histogram', action='store_true', help='Compute histograms of several distances to investiguate how close are the samples with the codebook')
+    parser.add_argument('--plot_validation_distances_histogram', action='store_true', help='Compute histograms of several distances over the whole validation set')
     parser.add_argument('--compute_many_to_one_mapping', action='store_true', help='Compute the many to one mapping for all the samples')
     parser.add_argument('--compute_alignments', action='store_true', help='Compute the groundtruth alignments and those of the specified experiments')
     parser.add_argument('--alignment_subset', action='store', type=str, default='val')
@@ -85,6 +93,7 @@ if __name__ == "__main__":
     parser.add_argument('--plot_clustering_metrics_evolution', action='store_true', help='Compute the evolution of the clustering metrics accross different number of embedding vectors')
     parser.add_argument('--check_clustering_metrics_stability_over_seeds', action='store_true', help='Check the evolution of the clustering metrics statbility over different seed values')
     parser.add_argument('--plot_gradient_stats', action='store_true', help='Plot the gradient stats of the training')
+    parser.add_argument('--export_tokenizer', action='store_true', help='Export the encoder and the codebook of the specified experiments as a TorchScript tokenizer')
     args = parser.parse_args()
     
     evaluation_options = {
@@ -92,6 +101,7 @@ if __name__ == "__main__":
         'plot_quantized_embedding_spaces': args.plot_quantized_embedding_spaces,
         'compute_quantized_embedding_spaces_animation': args.compute_quantized_embedding_spaces_animation,
         'plot_distances_histogram': args.plot_distances_histogram,
+        'plot_validation_distances_histogram': args.plot_validation_distances_histogram,
         'compute_many_to_one_mapping': args.compute_many_to_one_mapping,
         'compute_alignments': args.compute_alignments,
         'alignment_subset': args.alignment_subset,
@@ -112,6 +122,11 @@ if __name__ == "__main__":
         print(model)
         sys.exit(0)
 
+    if args.quantize:
+        Experiments.load(args.experiments_configuration_path).quantize()
+        ConsoleLogger.success('All experiments quantized')
+        sys.exit(0)
+
     if args.plot_experiments_losses:
         LossesPlotter().plot_training_losses(
             Experiments.load(args.experiments_configuration_path).experiments,
@@ -129,11 +144,46 @@ if __name__ == "__main__":
             default_dataset_path + os.sep + configuration['features_path']))
         sys.exit(0)
 
+    if args.build_metadata_index:
+        configuration = load_configuration(default_configuration_path)
+        configuration = update_configuration_from_experiments(args.experiments_configuration_path, configuration)
+        vctk = VCTK(configuration['data_root'], ratio=configuration['train_val_split'])
+        metadata_index = VCTKMetadataIndex.build(
+            vctk.audios,
+            vctk.speaker_dic,
+            configuration['sampling_rate'],
+            configuration['res_type'],
+            configuration.get('metadata_index_top_dbs', list()) + [configuration['top_db']],
+            configuration.get('export_workers', 0)
+        )
+        metadata_index.save(configuration['metadata_index_path'])
+        ConsoleLogger.success("Metadata of {} utterances indexed at: '{}'".format(len(metadata_index),
+            configuration['metadata_index_path']))
+        sys.exit(0)
+
+    if args.convert_features_to_memmap:
+        configuration = load_configuration(default_configuration_path)
+        configuration = update_configuration_from_experiments(args.experiments_configuration_path, configuration)
+        for subset in ['train', 'val']:
+            store_path = VCTKFeaturesMemmapDataset.store_path(default_dataset_path, subset, configuration['features_path'])
+            items_number = FeaturesStoreWriter.convert(
+                default_dataset_path + os.sep + configuration['features_path'] + os.sep + subset,
+                store_path
+            )
+            ConsoleLogger.success("{} features converted to a memory mapped store of {} items at: '{}'".format(
+                subset, items_number, store_path))
+        sys.exit(0)
+
     if args.evaluate:
         Experiments.load(args.experiments_configuration_path).evaluate(evaluation_options)
         ConsoleLogger.success('All evaluating experiments done')
         sys.exit(0)
 
+    if args.export_tokenizer:
+        Experiments.load(args.experiments_configuration_path).export_tokenizers()
+        ConsoleLogger.success('All tokenizers exported')
+        sys.exit(0)
+
     if args.compute_dataset_stats:
         configuration = load_configuration(default_configuration_path)
         configuration = update_configuration_from_experiments(args.experiments_configuration_path, configuration)
@@ -26,18 +26,21 @@
 
 from modules.residual_stack import ResidualStack
 from modules.conv1d_builder import Conv1DBuilder
+from modules.weight_norm_folding import WeightNormFolding
+from modules.padding_mask import PaddingMask
 from error_handling.console_logger import ConsoleLogger
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 
 
 class ConvolutionalEncoder(nn.Module):
     
     def __init__(self, in_channels, num_hiddens, num_residual_layers, num_residual_hiddens,
         use_kaiming_normal, input_features_type, features_filters, sampling_rate,
-        device, verbose=False):
+        device, verbose=False, use_activation_checkpointing=False):
 
         super(ConvolutionalEncoder, self).__init__()
 
@@ -109,38 +112,219 @@ class ConvolutionalEncoder(nn.Module):
             use_kaiming_normal=use_kaiming_normal
         )
         
+        self._num_hiddens = num_hiddens
         self._input_features_type = input_features_type
         self._features_filters = features_filters
         self._sampling_rate = sampling_rate
         self._device = device
         self._verbose = verbose
+        self._use_activation_checkpointing = use_activation_checkpointing
+        self._in_place = False
 
-    def forward(self, inputs):
+    @property
+    def features_filters(self):
+        return self._features_filters
+
+    def prepare_for_inference(self):
+        """
+        Fold the weight norms, and switch to the in place forward: the ReLUs
+        and the residual additions overwrite the outputs of the convolutions
+        (no autograd graph is needed at inference). The module can't be
+        trained afterwards.
+        """
+
+        WeightNormFolding.fold(self)
+        self._verbose = False
+        self._in_place = True
+        return self.eval()
+
+    @staticmethod
+    def output_lengths(lengths):
+        """
+        Returns:
+            The number of encoded frames of inputs of the given lengths.
+        """
+
+        return lengths // 2 + 1
+
+    def forward(self, inputs, lengths=None):
+        """
+        Args:
+            inputs: Tensor of shape (B, features_filters, T).
+            lengths: Tensor of the B lengths of the inputs, if they're zero padded
+                to T frames. The padding frames are kept at zero after each layer,
+                so the valid encoded frames are the same as if each input was
+                encoded alone, and the padding ones are zero.
+
+        Returns:
+            Tensor of shape (B, num_hiddens, T // 2 + 1).
+        """
+
+        if self._in_place and lengths is None:
+            return self._in_place_forward(inputs)
+
+        mask, latent_mask = None, None
+        if lengths is not None:
+            mask = PaddingMask.from_lengths(lengths, inputs.size(2), inputs.dtype)
+            latent_mask = PaddingMask.from_lengths(self.output_lengths(lengths),
+                self.output_lengths(inputs.size(2)), inputs.dtype)
+
+        x = self._segment(self._preprocessing_layers, inputs, mask)
+        x = self._segment(self._downsampling_layers, x, latent_mask)
+        return self._segment(self._residual_layers, x, latent_mask)
+
+    def _segment(self, layers, x, mask):
+        """
+        With activation checkpointing, only the inputs of the segment are
+        stored for the backward pass, and its activations are recomputed.
+        The segment runs on a copy of its inputs, which the residual stack
+        modifies in place (with the ReLU of its first layer).
+        """
+
+        if self._use_activation_checkpointing and self.training and torch.is_grad_enabled():
+            return checkpoint(lambda x, mask: layers(x.clone(), mask), x, mask, use_reentrant=False)
+        return layers(x, mask)
+
+    def _preprocessing_layers(self, inputs, mask):
+        inputs = PaddingMask.apply(inputs, mask)
         if self._verbose:
             ConsoleLogger.status('inputs size: {}'.format(inputs.size()))
 
-        x_conv_1 = F.relu(self._conv_1(inputs))
+        x_conv_1 = PaddingMask.apply(F.relu(self._conv_1(inputs)), mask)
         if self._verbose:
             ConsoleLogger.status('x_conv_1 output size: {}'.format(x_conv_1.size()))
 
-        x = F.relu(self._conv_2(x_conv_1)) + x_conv_1
+        x = PaddingMask.apply(F.relu(self._conv_2(x_conv_1)), mask) + x_conv_1
         if self._verbose:
             ConsoleLogger.status('_conv_2 output size: {}'.format(x.size()))
-        
-        x_conv_3 = F.relu(self._conv_3(x))
+
+        return x
+
+    def _downsampling_layers(self, x, mask):
+        x_conv_3 = PaddingMask.apply(F.relu(self._conv_3(x)), mask)
         if self._verbose:
             ConsoleLogger.status('_conv_3 output size: {}'.format(x_conv_3.size()))
 
-        x_conv_4 = F.relu(self._conv_4(x_conv_3)) + x_conv_3
+        x_conv_4 = PaddingMask.apply(F.relu(self._conv_4(x_conv_3)), mask) + x_conv_3
         if self._verbose:
             ConsoleLogger.status('_conv_4 output size: {}'.format(x_conv_4.size()))
 
-        x_conv_5 = F.relu(self._conv_5(x_conv_4)) + x_conv_4
+        x_conv_5 = PaddingMask.apply(F.relu(self._conv_5(x_conv_4)), mask) + x_conv_4
         if self._verbose:
             ConsoleLogger.status('x_conv_5 output size: {}'.format(x_conv_5.size()))
 
-        x = self._residual_stack(x_conv_5) + x_conv_5
+        return x_conv_5
+
+    def _residual_layers(self, x_conv_5, mask):
+        x = (self._residual_stack(x_conv_5) if mask is None else self._residual_stack.masked_forward(x_conv_5, mask)) + x_conv_5
         if self._verbose:
             ConsoleLogger.status('_residual_stack output size: {}'.format(x.size()))
 
         return x
+
+    def _in_place_forward(self, inputs):
+        x_conv_1 = torch.relu_(self._conv_1(inputs))
+        x = torch.relu_(self._conv_2(x_conv_1)).add_(x_conv_1)
+        x_conv_3 = torch.relu_(self._conv_3(x))
+        x_conv_4 = torch.relu_(self._conv_4(x_conv_3)).add_(x_conv_3)
+        x_conv_5 = torch.relu_(self._conv_5(x_conv_4)).add_(x_conv_4)
+        return self._residual_stack(x_conv_5).add_(x_conv_5)
+
+    def init_state(self):
+        """
+        Initial state of the streaming encoding (see step()).
+        """
+
+        return {
+            'buffers': [None] * (5 + len(self._residual_stack.layers)),
+            'skip': None
+        }
+
+    def step(self, chunk, state):
+        """
+        Encode a chunk of a stream of features, with the same result as
+        forward() on the whole stream once flush() is called.
+
+        Each layer keeps the input frames that are still needed by its next
+        output frames (its left context), so the memory is bounded by the
+        receptive field instead of the length of the stream. The latent
+        frames are emitted as soon as their right context is available.
+
+        Args:
+            chunk: Tensor of shape (B, features_filters, T_chunk). The chunks
+                can be of any length, including shorter than the receptive field.
+            state: dict returned by init_state() or by the previous step().
+
+        Returns:
+            Tensor of shape (B, num_hiddens, T_out) of the new latent frames
+            (T_out can be 0), and the updated state.
+        """
+
+        return self._stream(chunk, state, final=False)
+
+    def flush(self, state):
+        """
+        Emit the last latent frames of the stream, by right padding each
+        layer as forward() does. The state can't be used afterwards.
+
+        Returns:
+            Tensor of shape (B, num_hiddens, T_out) of the last latent frames.
+        """
+
+        if state['buffers'][0] is None:
+            raise ValueError('Nothing to flush, as no chunk was streamed')
+
+        return self._stream(None, state, final=True)[0]
+
+    def _streaming_layers(self):
+        """
+        Layers of forward(), as functions with their kernel size, stride and
+        padding. The function outputs are aligned with their inputs, so the
+        residual connections of the convolutions don't need their own cache.
+        """
+
+        layers = [
+            (lambda x: F.relu(self._conv_1(x)), 3, 1, 1),
+            (lambda x: F.relu(self._conv_2(x)) + x, 3, 1, 1),
+            (lambda x: F.relu(self._conv_3(x)), 4, 2, 2),
+            (lambda x: F.relu(self._conv_4(x)) + x, 3, 1, 1),
+            (lambda x: F.relu(self._conv_5(x)) + x, 3, 1, 1)
+        ]
+        layers += [(layer, 3, 1, 1) for layer in self._residual_stack.layers]
+        return layers
+
+    def _stream(self, x, state, final):
+        buffers = state['buffers']
+        for i, (layer, kernel_size, stride, padding) in enumerate(self._streaming_layers()):
+            # Zero padding of the start (and of the end, when flushing) of the stream
+            if buffers[i] is None:
+                buffers[i] = x.new_zeros(x.size(0), x.size(1), padding)
+            buffered = [buffers[i]]
+            if x is not None:
+                buffered.append(x)
+            if final:
+                buffered.append(buffers[i].new_zeros(buffers[i].size(0), buffers[i].size(1), padding))
+            buffer = torch.cat(buffered, dim=2)
+
+            if buffer.size(2) < kernel_size:
+                # Waiting for the right context of the next output frame
+                buffers[i] = buffer
+                return buffer.new_zeros(buffer.size(0), self._num_hiddens, 0), state
+
+            # The outputs of index padding // stride onward only depend on buffered frames
+            num_outputs = (buffer.size(2) - kernel_size) // stride + 1
+            first = padding // stride
+            x = layer(buffer)[:, :, first:first + num_outputs]
+            # Only whole strides are dropped, to keep the phase of the strided _conv_3
+            buffers[i] = buffer[:, :, num_outputs * stride:]
+
+            if i == 4:
+                # Input of the residual stack, kept until the stack outputs the same frames
+                state['skip'] = x if state['skip'] is None else torch.cat([state['skip'], x], dim=2)
+
+        # Last ReLU of the residual stack, and its residual connection
+        num_outputs = x.size(2)
+        x = F.relu(x) + state['skip'][:, :, :num_outputs]
+        state['skip'] = state['skip'][:, :, num_outputs:]
+
+        return x, state
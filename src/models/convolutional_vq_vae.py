@@ -28,6 +28,10 @@ from models.convolutional_encoder import ConvolutionalEncoder
 from models.deconvolutional_decoder import DeconvolutionalDecoder
 from models.vector_quantizer import VectorQuantizer
 from models.vector_quantizer_ema import VectorQuantizerEMA
+from models.vector_quantizer_grouped import VectorQuantizerGrouped
+from modules.codebook_search import CodebookSearch
+from modules.weight_norm_folding import WeightNormFolding
+from modules.padding_mask import PaddingMask
 from error_handling.console_logger import ConsoleLogger
 
 import torch.nn as nn
@@ -55,7 +59,8 @@ class ConvolutionalVQVAE(nn.Module):
             features_filters=configuration['input_features_filters'] * 3 if configuration['augment_input_features'] else configuration['input_features_filters'],
             sampling_rate=configuration['sampling_rate'],
             device=device,
-            verbose=self._verbose
+            verbose=self._verbose,
+            use_activation_checkpointing=configuration.get('use_activation_checkpointing', False)
         )
 
         self._pre_vq_conv = nn.Conv1d(
@@ -65,20 +70,43 @@ class ConvolutionalVQVAE(nn.Module):
             padding=1
         )
 
-        if configuration['decay'] > 0.0:
+        vq_layout = configuration.get('vq_layout', 'legacy')
+        if vq_layout not in ['legacy', 'channels_first']:
+            raise NotImplementedError("VQ layout '{}' isn't implemented for now".format(vq_layout))
+        channels_first = vq_layout == 'channels_first'
+        if configuration.get('pad_variable_lengths', False) and not channels_first:
+            # The flattened rows of the legacy layout mix the frames of the batch elements
+            raise ValueError("pad_variable_lengths requires vq_layout: 'channels_first'")
+
+        if configuration.get('num_groups', 1) > 1:
+            self._vq = VectorQuantizerGrouped(
+                num_embeddings=configuration['num_embeddings'],
+                embedding_dim=configuration['embedding_dim'],
+                commitment_cost=configuration['commitment_cost'],
+                num_groups=configuration['num_groups'],
+                device=device,
+                decay=configuration['decay'],
+                codebook_search_factory=lambda: CodebookSearch.from_configuration(configuration),
+                channels_first=channels_first
+            )
+        elif configuration['decay'] > 0.0:
             self._vq = VectorQuantizerEMA(
                 num_embeddings=configuration['num_embeddings'],
                 embedding_dim=configuration['embedding_dim'],
                 commitment_cost=configuration['commitment_cost'],
                 decay=configuration['decay'],
-                device=device
+                device=device,
+                codebook_search=CodebookSearch.from_configuration(configuration),
+                channels_first=channels_first
             )
         else:
             self._vq = VectorQuantizer(
                 num_embeddings=configuration['num_embeddings'],
                 embedding_dim=configuration['embedding_dim'],
                 commitment_cost=configuration['commitment_cost'],
-                device=device
+                device=device,
+                codebook_search=CodebookSearch.from_configuration(configuration),
+                channels_first=channels_first
             )
 
         self._decoder = DeconvolutionalDecoder(
@@ -92,11 +120,18 @@ class ConvolutionalVQVAE(nn.Module):
             jitter_probability=configuration['jitter_probability'],
             use_speaker_conditioning=configuration['use_speaker_conditioning'],
             device=device,
-            verbose=self._verbose
+            verbose=self._verbose,
+            num_speakers=configuration.get('num_speakers', 109),
+            speaker_embedding_dim=configuration.get('speaker_embedding_dim', 40),
+            use_activation_checkpointing=configuration.get('use_activation_checkpointing', False)
         )
 
+        self._decoder_window_size = configuration.get('decoder_window_size', None)
+        self._decoder_windows_per_batch = configuration.get('decoder_windows_per_batch', 16)
+        self._decoder_crossfade = configuration.get('decoder_crossfade', 0)
+
         self._device = device
-        self._record_codebook_stats = configuration['record_codebook_stats']
+        self._inference = False
 
     @property
     def vq(self):
@@ -114,10 +149,50 @@ class ConvolutionalVQVAE(nn.Module):
     def decoder(self):
         return self._decoder
 
-    def forward(self, x, speaker_dic, speaker_id):
-        x = x.permute(0, 2, 1).contiguous().float()
-
-        z = self._encoder(x)
+    def prepare_for_inference(self):
+        """
+        Optimize the encoder, the pre VQ convolution and the decoder for the
+        inference: fold their weight norms in plain weights, apply their
+        ReLUs and residual additions in place on the outputs of the
+        convolutions, drop the verbose logging, and run the forward in eval
+        and inference mode.
+        The model can't be trained afterwards.
+
+        Returns:
+            The model.
+        """
+
+        self._encoder.prepare_for_inference()
+        WeightNormFolding.fold(self._pre_vq_conv)
+        self._decoder.prepare_for_inference()
+        self._verbose = False
+        self._inference = True
+        self.requires_grad_(False)
+        return self.eval()
+
+    def forward(self, x, speaker_dic, speaker_id, lengths=None):
+        """
+        Args:
+            x: Tensor of shape (B, T, input_features_dim).
+            lengths: Tensor of the B lengths of the inputs, if they're zero padded
+                to T frames (see VCTKFeaturesStream.pad_collate()). The padding
+                frames are then masked through the encoder, the quantizer and the
+                decoder, so each input is reconstructed as if it was alone in the batch.
+
+        Returns:
+            The reconstructed features of shape (B, output_features_filters, T),
+            zero on the padding frames, and the VectorQuantizerOutput.
+        """
+
+        with torch.inference_mode(self._inference):
+            return self._forward(x, speaker_dic, speaker_id, lengths)
+
+    def _forward(self, x, speaker_dic, speaker_id, lengths=None):
+        # (B, T, features) -> (B, features, T) view, consumed as is by the first convolution
+        x = x.permute(0, 2, 1).float()
+        latent_lengths = None if lengths is None else self._encoder.output_lengths(lengths)
+
+        z = self._encoder(x, lengths)
         if self._verbose:
             ConsoleLogger.status('[ConvVQVAE] _encoder output size: {}'.format(z.size()))
 
@@ -125,15 +200,20 @@ class ConvolutionalVQVAE(nn.Module):
         if self._verbose:
             ConsoleLogger.status('[ConvVQVAE] _pre_vq_conv output size: {}'.format(z.size()))
 
-        vq_loss, quantized, perplexity, _, _, encoding_indices, \
-            losses, _, _, _, concatenated_quantized = self._vq(z, record_codebook_stats=self._record_codebook_stats)
+        vq_output = self._vq(z, None if lengths is None else PaddingMask.from_lengths(latent_lengths, z.size(2)))
 
-        reconstructed_x = self._decoder(quantized, speaker_dic, speaker_id)
+        # The chunked decoding stitches the windows of unpadded inputs only
+        if self._decoder_window_size and not self.training and lengths is None:
+            reconstructed_x = self._decoder.decode_chunked(vq_output.quantized, speaker_dic, speaker_id,
+                self._decoder_window_size, self._decoder_windows_per_batch, self._decoder_crossfade)
+        else:
+            reconstructed_x = self._decoder(vq_output.quantized, speaker_dic, speaker_id, latent_lengths)
 
-        input_features_size = x.size(2)
-        output_features_size = reconstructed_x.size(2)
+        # The decoder outputs a few more frames than the inputs
+        reconstructed_x = reconstructed_x.view(-1, self._output_features_filters, reconstructed_x.size(2))
+        reconstructed_x = reconstructed_x[:, :, :x.size(2)]
+        if lengths is not None:
+            reconstructed_x = PaddingMask.apply(reconstructed_x,
+                PaddingMask.from_lengths(lengths, x.size(2), reconstructed_x.dtype))
 
-        reconstructed_x = reconstructed_x.view(-1, self._output_features_filters, output_features_size)
-        reconstructed_x = reconstructed_x[:, :, :-(output_features_size-input_features_size)]
-        
-        return reconstructed_x, vq_loss, losses, perplexity, encoding_indices, concatenated_quantized
+        return reconstructed_x, vq_output
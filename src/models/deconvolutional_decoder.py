@@ -28,19 +28,23 @@ from modules.residual_stack import ResidualStack
 from modules.jitter import Jitter
 from modules.conv1d_builder import Conv1DBuilder
 from modules.conv_transpose1d_builder import ConvTranspose1DBuilder
-from speech_utils.global_conditioning import GlobalConditioning
+from modules.weight_norm_folding import WeightNormFolding
+from modules.speaker_conditioning import SpeakerConditioning
+from modules.padding_mask import PaddingMask
 from error_handling.console_logger import ConsoleLogger
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 
 
 class DeconvolutionalDecoder(nn.Module):
     
     def __init__(self, in_channels, out_channels, num_hiddens, num_residual_layers,
         num_residual_hiddens, use_kaiming_normal, use_jitter, jitter_probability,
-        use_speaker_conditioning, device, verbose=False):
+        use_speaker_conditioning, device, verbose=False, num_speakers=109, speaker_embedding_dim=40,
+        use_activation_checkpointing=False):
 
         super(DeconvolutionalDecoder, self).__init__()
 
@@ -48,13 +52,12 @@ class DeconvolutionalDecoder(nn.Module):
         self._use_speaker_conditioning = use_speaker_conditioning
         self._device = device
         self._verbose = verbose
+        self._use_activation_checkpointing = use_activation_checkpointing
+        self._in_place = False
 
         if self._use_jitter:
             self._jitter = Jitter(jitter_probability)
 
-        # FIXME hardcoded
-        in_channels = in_channels + 40 if self._use_speaker_conditioning else in_channels
-
         self._conv_1 = Conv1DBuilder.build(
             in_channels=in_channels,
             out_channels=num_hiddens,
@@ -63,6 +66,16 @@ class DeconvolutionalDecoder(nn.Module):
             use_kaiming_normal=use_kaiming_normal
         )
 
+        if self._use_speaker_conditioning:
+            # The speaker embeddings are folded into _conv_1, as a per-speaker bias
+            self._speaker_conditioning = SpeakerConditioning(
+                num_speakers=num_speakers,
+                embedding_dim=speaker_embedding_dim,
+                out_channels=num_hiddens,
+                kernel_size=3,
+                use_kaiming_normal=use_kaiming_normal
+            )
+
         self._upsample = nn.Upsample(scale_factor=2)
 
         self._residual_stack = ResidualStack(
@@ -97,41 +110,255 @@ class DeconvolutionalDecoder(nn.Module):
             use_kaiming_normal=use_kaiming_normal
         )
 
-    def forward(self, inputs, speaker_dic, speaker_id):
+    def prepare_for_inference(self):
+        """
+        Fold the weight norms, and switch to the in place decoding: the ReLUs
+        overwrite the outputs of the convolutions (no autograd graph is needed
+        at inference). The module can't be trained afterwards.
+        """
+
+        WeightNormFolding.fold(self)
+        self._verbose = False
+        self._in_place = True
+        return self.eval()
+
+    @staticmethod
+    def output_lengths(lengths):
+        """
+        Returns:
+            The number of decoded frames of inputs of the given lengths.
+        """
+
+        return 2 * lengths + 3
+
+    def forward(self, inputs, speaker_dic, speaker_id, lengths=None):
+        """
+        Args:
+            inputs: Tensor of shape (B, in_channels, T).
+            lengths: Tensor of the B lengths of the inputs, if they're zero padded
+                to T frames. The padding frames are kept at zero after each layer,
+                so the valid decoded frames (output_lengths(lengths)) are the same
+                as if each input was decoded alone, and the padding ones are zero.
+
+        Returns:
+            Tensor of shape (B, out_channels, 2 x T + 3).
+        """
+
+        self._check_speaker_dic(speaker_dic)
+        return self._decode(self._jitter_inputs(inputs, lengths), speaker_id, lengths)
+
+    def decode_chunked(self, inputs, speaker_dic, speaker_id, window_size, windows_per_batch=16,
+        crossfade=0, context=None):
+        """
+        Decode the inputs window by window, with the same result as forward().
+
+        Each window of window_size latent frames is decoded with context
+        latent frames on each side, and only its own output frames are kept.
+        With the default context (the receptive field of the decoder), the
+        windows are stitched exactly. The windows of the same length are
+        decoded in batches of windows_per_batch windows, so the peak memory
+        of the activations is bounded whatever the length of the inputs.
+
+        Args:
+            inputs: Tensor of shape (B, in_channels, T).
+            window_size: Number of latent frames per window.
+            windows_per_batch: Number of windows decoded at once.
+            crossfade: Number of output frames linearly crossfaded on each
+                side of the window boundaries (at most 2 x context). Useful
+                to hide the seams with a context smaller than the receptive field.
+            context: Number of latent frames of context on each side of the
+                windows. If None, the receptive field of the decoder plus the
+                crossfaded frames, so that the stitching stays exact.
+
+        Returns:
+            Tensor of shape (B, out_channels, 2 x T + 3), as forward().
+        """
+
+        self._check_speaker_dic(speaker_dic)
+        context = self.receptive_field + (crossfade + 1) // 2 if context is None else context
+        if crossfade > 2 * context:
+            raise ValueError('The crossfade ({}) must be at most twice the context ({})'.format(crossfade, context))
+
+        x = self._jitter_inputs(inputs)
+        batch_size, _, time = x.size()
+        if time <= window_size:
+            return self._decode(x, speaker_id)
+
+        # Group the windows of the same length (the ones at the edges are clipped)
+        windows = dict()
+        for start in range(0, time, window_size):
+            end = min(start + window_size, time)
+            first, last = max(start - context, 0), min(end + context, time)
+            windows.setdefault(last - first, list()).append((start, end, first, last))
+
+        output = None
+        weights = x.new_zeros(2 * time + 3)
+        ramp = (torch.arange(2 * crossfade, dtype=x.dtype, device=x.device) + 0.5) / max(2 * crossfade, 1)
+        for group in windows.values():
+            for i in range(0, len(group), windows_per_batch):
+                batch = group[i:i + windows_per_batch]
+                decoded = self._decode(torch.cat([x[:, :, first:last] for _, _, first, last in batch], dim=0),
+                    None if speaker_id is None else speaker_id.view(-1).repeat(len(batch)))
+                if output is None:
+                    output = x.new_zeros(batch_size, decoded.size(1), 2 * time + 3)
+
+                for j, (start, end, first, last) in enumerate(batch):
+                    # Output frames of the window, with the crossfaded ones
+                    output_start = 2 * start - crossfade if start > 0 else 0
+                    output_end = 2 * end + crossfade if end < time else 2 * time + 3
+                    window_weights = x.new_ones(output_end - output_start)
+                    if start > 0 and crossfade > 0:
+                        window_weights[:2 * crossfade] = ramp
+                    if end < time and crossfade > 0:
+                        window_weights[-2 * crossfade:] = 1 - ramp
+
+                    window_output = decoded[j * batch_size:(j + 1) * batch_size,
+                        :, output_start - 2 * first:output_end - 2 * first]
+                    output[:, :, output_start:output_end] += window_output * window_weights
+                    weights[output_start:output_end] += window_weights
+
+        return output / weights
+
+    @property
+    def receptive_field(self):
+        """
+        Number of latent frames of context needed on each side of a window
+        to decode it exactly. The zero padding at the edges of a window
+        spreads by one upsampled frame per residual layer and through the
+        _conv_1 and the transposed convolutions (i.e. on up to
+        num_residual_layers + 6 output frames).
+        """
+
+        return (len(self._residual_stack.layers) + 7) // 2
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        if self._use_speaker_conditioning:
+            self._split_speaker_channels(state_dict, prefix)
+        super(DeconvolutionalDecoder, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def _split_speaker_channels(self, state_dict, prefix):
+        """
+        Migrate in place the state dict of a decoder which concatenated the speaker
+        embeddings to the inputs of _conv_1: the weights of the extra input channels
+        of _conv_1 are those of the speaker convolution. The embeddings of such a
+        decoder were drawn again at each forward, so they were never learned, and
+        the ones of this module are kept.
+        """
+
+        conditioning_prefix = prefix + '_speaker_conditioning.'
+        if any(key.startswith(conditioning_prefix) for key in state_dict):
+            return
+
+        in_channels = self._conv_1.in_channels
+        use_weight_norm = prefix + '_conv_1.weight_v' in state_dict
+        weight_key = prefix + '_conv_1.' + ('weight_v' if use_weight_norm else 'weight')
+        if weight_key not in state_dict or state_dict[weight_key].size(1) <= in_channels:
+            return
+
+        weight = state_dict[weight_key]
+        weight_g = state_dict[prefix + '_conv_1.weight_g'] if use_weight_norm else None
+        weights = {
+            prefix + '_conv_1.': weight[:, :in_channels],
+            conditioning_prefix + '_conv.': weight[:, in_channels:]
+        }
+        for name, split_weight in weights.items():
+            if use_weight_norm:
+                # Same weights: the norm of each output channel is split with the channels
+                state_dict[name + 'weight_g'] = weight_g * torch.norm_except_dim(split_weight, 2, 0) / \
+                    torch.norm_except_dim(weight, 2, 0)
+                state_dict[name + 'weight_v'] = split_weight.clone()
+            else:
+                state_dict[name + 'weight'] = split_weight.clone()
+        state_dict[conditioning_prefix + '_embedding.weight'] = self._speaker_conditioning.embedding.weight.detach().clone()
+
+    def _check_speaker_dic(self, speaker_dic):
+        # The speaker embeddings are sized by num_speakers, and indexed by the ids of speaker_dic
+        if self._use_speaker_conditioning and speaker_dic is not None and \
+            len(speaker_dic) != self._speaker_conditioning.embedding.num_embeddings:
+            raise ValueError('The {} speakers of the data stream don\'t match the {} speaker embeddings (num_speakers)'.format(
+                len(speaker_dic), self._speaker_conditioning.embedding.num_embeddings))
+
+    def _jitter_inputs(self, inputs, lengths=None):
         x = inputs
         if self._verbose:
             ConsoleLogger.status('[FEATURES_DEC] input size: {}'.format(x.size()))
 
         if self._use_jitter and self.training:
-            x = self._jitter(x)
+            x = self._jitter(x, lengths)
 
-        if self._use_speaker_conditioning:
-            speaker_embedding = GlobalConditioning.compute(speaker_dic, speaker_id, x,
-                device=self._device, gin_channels=40, expand=True)
-            x = torch.cat([x, speaker_embedding], dim=1).to(self._device)
+        return x
+
+    def _decode(self, x, speaker_id, lengths=None):
+        if self._in_place and lengths is None:
+            return self._in_place_decode(x, speaker_id)
+
+        x = self._segment(self._input_layers, x, speaker_id, lengths)
+        x = self._segment(self._residual_layers, x, lengths)
+        return self._segment(self._output_layers, x, lengths)
+
+    def _segment(self, layers, x, *args):
+        """
+        With activation checkpointing, only the inputs of the segment are
+        stored for the backward pass, and its activations are recomputed.
+        The segment runs on a copy of its inputs, which the residual stack
+        modifies in place (with the ReLU of its first layer).
+        """
+
+        if self._use_activation_checkpointing and self.training and torch.is_grad_enabled():
+            return checkpoint(lambda x, *args: layers(x.clone(), *args), x, *args, use_reentrant=False)
+        return layers(x, *args)
+
+    @staticmethod
+    def _mask(x, lengths):
+        return None if lengths is None else PaddingMask.from_lengths(lengths, x.size(2), x.dtype)
+
+    def _input_layers(self, x, speaker_id, lengths):
+        x_mask = self._mask(x, lengths)
+        x = PaddingMask.apply(x, x_mask)
 
         x = self._conv_1(x)
+        if self._use_speaker_conditioning:
+            x = self._speaker_conditioning(x, speaker_id, x_mask)
+        x = PaddingMask.apply(x, x_mask)
         if self._verbose:
             ConsoleLogger.status('[FEATURES_DEC] _conv_1 output size: {}'.format(x.size()))
 
         x = self._upsample(x)
         if self._verbose:
             ConsoleLogger.status('[FEATURES_DEC] _upsample output size: {}'.format(x.size()))
-        
-        x = self._residual_stack(x)
+
+        return x
+
+    def _residual_layers(self, x, lengths):
+        x_mask = self._mask(x, None if lengths is None else 2 * lengths)
+        x = self._residual_stack(x) if x_mask is None else self._residual_stack.masked_forward(x, x_mask)
         if self._verbose:
             ConsoleLogger.status('[FEATURES_DEC] _residual_stack output size: {}'.format(x.size()))
-        
-        x = F.relu(self._conv_trans_1(x))
+
+        return x
+
+    def _output_layers(self, x, lengths):
+        x = PaddingMask.apply(F.relu(self._conv_trans_1(x)), self._mask(x, None if lengths is None else 2 * lengths))
         if self._verbose:
             ConsoleLogger.status('[FEATURES_DEC] _conv_trans_1 output size: {}'.format(x.size()))
 
         x = F.relu(self._conv_trans_2(x))
+        x = PaddingMask.apply(x, self._mask(x, None if lengths is None else 2 * lengths + 2))
         if self._verbose:
             ConsoleLogger.status('[FEATURES_DEC] _conv_trans_2 output size: {}'.format(x.size()))
 
         x = self._conv_trans_3(x)
+        x = PaddingMask.apply(x, self._mask(x, None if lengths is None else self.output_lengths(lengths)))
         if self._verbose:
             ConsoleLogger.status('[FEATURES_DEC] _conv_trans_3 output size: {}'.format(x.size()))
-        
+
         return x
+
+    def _in_place_decode(self, x, speaker_id):
+        x = self._conv_1(x)
+        if self._use_speaker_conditioning:
+            x = self._speaker_conditioning(x, speaker_id)
+        x = self._residual_stack(self._upsample(x))
+        x = torch.relu_(self._conv_trans_1(x))
+        x = torch.relu_(self._conv_trans_2(x))
+        return self._conv_trans_3(x)
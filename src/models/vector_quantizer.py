@@ -25,9 +25,14 @@
  #   SOFTWARE.                                                                       #
  #####################################################################################
 
+from models.vector_quantizer_output import VectorQuantizerOutput
+from modules.pairwise_distances import PairwiseDistances
+from modules.codebook_search import CodebookSearch
+from modules.codebook_metrics import CodebookMetrics
+from modules.padding_mask import PaddingMask
+
 import torch
 import torch.nn as nn
-from itertools import combinations, product
 
 
 class VectorQuantizer(nn.Module):
@@ -53,9 +58,13 @@ class VectorQuantizer(nn.Module):
         num_embeddings: integer, the number of vectors in the quantized space.
             commitment_cost: scalar which controls the weighting of the loss terms
             (see equation 4 in the paper - this variable is Beta).
+        codebook_search: CodebookSearch used to find the nearest embedding vectors
+            (exhaustive search if None).
+        channels_first: boolean, the layout of the inputs (see forward()).
     """
     
-    def __init__(self, num_embeddings, embedding_dim, commitment_cost, device):
+    def __init__(self, num_embeddings, embedding_dim, commitment_cost, device, codebook_search=None,
+        channels_first=False):
         super(VectorQuantizer, self).__init__()
 
         self._embedding_dim = embedding_dim
@@ -66,80 +75,86 @@ class VectorQuantizer(nn.Module):
 
         self._commitment_cost = commitment_cost
         self._device = device
+        self._codebook_search = CodebookSearch() if codebook_search is None else codebook_search
+        self._metrics = CodebookMetrics(num_embeddings)
+        self._channels_first = channels_first
 
-    def forward(self, inputs, compute_distances_if_possible=True, record_codebook_stats=False):
+    def forward(self, inputs, mask=None):
         """
         Connects the module to some inputs.
 
         Args:
-            inputs: Tensor, final dimension must be equal to embedding_dim. All other
-                leading dimensions will be flattened and treated as a large batch.
+            inputs: Tensor of shape (B, embedding_dim, T). In the legacy layout
+                (channels_first=False), it's permuted to (embedding_dim, T, B) and
+                flattened in rows of embedding_dim values, which mix the channels of
+                consecutive frames, as in the original implementation. In the channels
+                first layout, each frame is quantized in place, without any copy,
+                and the rows (e.g. of the encoding indices) are the frames in batch
+                major order.
+            mask: Tensor of shape (B, 1, T) of the valid frames of padded inputs
+                (see PaddingMask), or None. The losses are averaged over the valid
+                elements only, and the perplexity, the codebook usage and the EMA
+                statistics only count the flattened rows without padding elements.
+                The padding frames of the quantized output are set to zero.
 
         Returns:
-            loss: Tensor containing the loss to optimize.
-            quantize: Tensor containing the quantized version of the input.
-            perplexity: Tensor containing the perplexity of the encodings.
-            encodings: Tensor containing the discrete encodings, ie which element
-                of the quantized space each input element was mapped to.
-            distances
+            VectorQuantizerOutput, with the loss, the quantized inputs of shape
+            (B, embedding_dim, T), the perplexity, the encoding indices and the
+            losses dict, and the diagnostics (encodings, distances, ...) computed
+            on demand.
         """
 
-        # Convert inputs from BCHW -> BHWC
-        inputs = inputs.permute(1, 2, 0).contiguous()
-        input_shape = inputs.shape
-        _, time, batch_size = input_shape
+        """
+        In mixed precision, the inputs are converted to float32, such as the
+        losses and the straight-through estimator are computed in float32.
+        """
+        if self._channels_first:
+            inputs = inputs.float()
+            batch_size, _, time = inputs.shape
+            element_mask, valid_rows = PaddingMask.quantizer_masks(mask, self._embedding_dim, channels_first=True)
 
-        # Flatten input
-        flat_input = inputs.view(-1, self._embedding_dim)
+            # Search the nearest embedding vector of each frame, with batched products over the channels
+            encoding_indices = self._codebook_search.search_channels_first(inputs, self._embedding.weight)
+        else:
+            # Convert inputs from BCHW -> BHWC, and flatten input
+            inputs = inputs.permute(1, 2, 0).contiguous().float()
+            input_shape = inputs.shape
+            _, time, batch_size = input_shape
+            flat_input = inputs.view(-1, self._embedding_dim)
+            element_mask, valid_rows = PaddingMask.quantizer_masks(mask, self._embedding_dim)
 
-        # Compute distances between encoded audio frames and embedding vectors
-        distances = (torch.sum(flat_input**2, dim=1, keepdim=True)
-            + torch.sum(self._embedding.weight**2, dim=1)
-            - 2 * torch.matmul(flat_input, self._embedding.weight.t()))
+            # Search the nearest embedding vector of each encoded audio frame
+            encoding_indices, _ = self._codebook_search.search(flat_input, self._embedding.weight)
 
         """
         encoding_indices: Tensor containing the discrete encoding indices, ie
         which element of the quantized space each input element was mapped to.
         """
-        encoding_indices = torch.argmin(distances, dim=1).unsqueeze(1)
-        encodings = torch.zeros(encoding_indices.shape[0], self._num_embeddings, dtype=torch.float).to(self._device)
-        encodings.scatter_(1, encoding_indices, 1)
-
-        # Compute distances between encoding vectors
-        if not self.training and compute_distances_if_possible:
-            _encoding_distances = [torch.dist(items[0], items[1], 2).to(self._device) for items in combinations(flat_input, r=2)]
-            encoding_distances = torch.tensor(_encoding_distances).to(self._device).view(batch_size, -1)
-        else:
-            encoding_distances = None
+        encoding_indices = encoding_indices.view(-1, 1)
 
-        # Compute distances between embedding vectors
-        if not self.training and compute_distances_if_possible:
-            _embedding_distances = [torch.dist(items[0], items[1], 2).to(self._device) for items in combinations(self._embedding.weight, r=2)]
-            embedding_distances = torch.tensor(_embedding_distances).to(self._device)
-        else:
-            embedding_distances = None
+        # Number of frames mapped to each embedding vector
+        valid_indices = encoding_indices.view(-1) if valid_rows is None else encoding_indices.view(-1)[valid_rows]
+        encodings_counts = torch.bincount(valid_indices, minlength=self._num_embeddings)
+        if self.training:
+            self._metrics.record_usage(encodings_counts)
 
-        # Sample nearest embedding
-        if not self.training and compute_distances_if_possible:
-            _frames_vs_embedding_distances = [torch.dist(items[0], items[1], 2).to(self._device) for items in product(flat_input, self._embedding.weight.detach())]
-            frames_vs_embedding_distances = torch.tensor(_frames_vs_embedding_distances).to(self._device).view(batch_size, time, -1)
+        if self._channels_first:
+            # Quantize by gathering the embedding vectors, as a (B, embedding_dim, T) view
+            quantized = self._embedding(encoding_indices.view(batch_size, time)).float().transpose(1, 2)
         else:
-            frames_vs_embedding_distances = None
-
-        # Quantize and unflatten
-        quantized = torch.matmul(encodings, self._embedding.weight).view(input_shape)
-        # TODO: Check if the more readable self._embedding.weight.index_select(dim=1, index=encoding_indices) works better
-
-        concatenated_quantized = self._embedding.weight[torch.argmin(distances, dim=1).detach().cpu()] if not self.training or record_codebook_stats else None
+            # Quantize by gathering the embedding vectors, and unflatten
+            flat_quantized = self._embedding(encoding_indices.view(-1)).float()
+            quantized = flat_quantized.view(input_shape)
 
         # Losses
-        e_latent_loss = torch.mean((quantized.detach() - inputs)**2)
-        q_latent_loss = torch.mean((quantized - inputs.detach())**2)
+        e_latent_loss = PaddingMask.mean((quantized.detach() - inputs)**2, element_mask)
+        q_latent_loss = PaddingMask.mean((quantized - inputs.detach())**2, element_mask)
         commitment_loss = self._commitment_cost * e_latent_loss
         vq_loss = q_latent_loss + commitment_loss
 
         quantized = inputs + (quantized - inputs).detach() # Trick to prevent backpropagation of quantized
-        avg_probs = torch.mean(encodings, dim=0)
+        quantized = PaddingMask.apply(quantized, element_mask)
+        avg_probs = encodings_counts.float() / max(valid_indices.shape[0], 1)
 
         """
         The perplexity a useful value to track during training.
@@ -147,14 +162,69 @@ class VectorQuantizer(nn.Module):
         """
         perplexity = torch.exp(-torch.sum(avg_probs * torch.log(avg_probs + 1e-10))) # Exponential entropy
 
+        losses = {'e_latent_loss': e_latent_loss.detach(), 'q_latent_loss': q_latent_loss.detach(),
+            'commitment_loss': commitment_loss.detach(), 'vq_loss': vq_loss.detach()}
+        if self._channels_first:
+            return VectorQuantizerOutput.build_channels_first(vq_loss, quantized, perplexity, encoding_indices,
+                losses, inputs, self._embedding, self._codebook_search)
+
         # Convert quantized from BHWC -> BCHW
-        return vq_loss, quantized.permute(2, 0, 1).contiguous(), \
-            perplexity, encodings.view(batch_size, time, -1), \
-            distances.view(batch_size, time, -1), encoding_indices, \
-            {'e_latent_loss': e_latent_loss.item(), 'q_latent_loss': q_latent_loss.item(),
-            'commitment_loss': commitment_loss.item(), 'vq_loss': vq_loss.item()}, \
-            encoding_distances, embedding_distances, frames_vs_embedding_distances, concatenated_quantized
+        return VectorQuantizerOutput.build(vq_loss, quantized.permute(2, 0, 1).contiguous(), perplexity,
+            encoding_indices, losses, flat_input, flat_quantized, self._embedding, self._codebook_search,
+            batch_size, time)
+
+    def compute_distances(self, inputs, chunk_size=PairwiseDistances.default_chunk_size):
+        """
+        Compute the distances diagnostics of forward() in eval mode,
+        without quantizing the inputs. It can be used to accumulate
+        the distances over a whole dataset.
+
+        Args:
+            inputs: Tensor of the same shape as the one used in forward().
+            chunk_size: number of rows processed at the same time.
+
+        Returns:
+            encoding_distances, embedding_distances, frames_vs_embedding_distances
+        """
+
+        with torch.no_grad():
+            batch_size, _, time = inputs.shape
+            return PairwiseDistances.compute(self.flatten(inputs), self._embedding.weight,
+                batch_size, time, chunk_size)
+
+    def flatten(self, inputs):
+        """
+        Args:
+            inputs: Tensor of shape (B, embedding_dim, T).
+
+        Returns:
+            The rows quantized by forward(), as a Tensor of shape (N, embedding_dim).
+        """
+
+        if self._channels_first:
+            return inputs.transpose(1, 2).reshape(-1, self._embedding_dim)
+        return inputs.permute(1, 2, 0).contiguous().view(-1, self._embedding_dim)
+
+    def load_codebook(self, codebook, cluster_sizes=None):
+        """
+        Replace in-place the embedding vectors, e.g. with k-means centers.
+
+        Args:
+            codebook: Tensor of shape (num_embeddings, embedding_dim).
+            cluster_sizes: unused, for compatibility with VectorQuantizerEMA.
+        """
+
+        with torch.no_grad():
+            self._embedding.weight.copy_(codebook)
 
     @property
     def embedding(self):
         return self._embedding
+
+    @property
+    def channels_first(self):
+        return self._channels_first
+
+    @property
+    def metrics(self):
+        return self._metrics
@@ -25,9 +25,14 @@
  #   SOFTWARE.                                                                       #
  #####################################################################################
 
+from models.vector_quantizer_output import VectorQuantizerOutput
+from modules.pairwise_distances import PairwiseDistances
+from modules.codebook_search import CodebookSearch
+from modules.codebook_metrics import CodebookMetrics
+from modules.padding_mask import PaddingMask
+
 import torch
 import torch.nn as nn
-from itertools import combinations
 
 
 class VectorQuantizerEMA(nn.Module):
@@ -60,9 +65,13 @@ class VectorQuantizerEMA(nn.Module):
             equation 4 in the paper).
         decay: float, decay for the moving averages.
         epsilon: small float constant to avoid numerical instability.
+        codebook_search: CodebookSearch used to find the nearest embedding vectors
+            (exhaustive search if None).
+        channels_first: boolean, the layout of the inputs (see VectorQuantizer.forward()).
     """
     
-    def __init__(self, num_embeddings, embedding_dim, commitment_cost, decay, device, epsilon=1e-5):
+    def __init__(self, num_embeddings, embedding_dim, commitment_cost, decay, device, epsilon=1e-5,
+        codebook_search=None, channels_first=False):
         super(VectorQuantizerEMA, self).__init__()
 
         self._num_embeddings = num_embeddings
@@ -72,102 +81,103 @@ class VectorQuantizerEMA(nn.Module):
         self._embedding.weight.data.normal_()
         self._commitment_cost = commitment_cost
 
+        """
+        The codebook and its EMA statistics are updated in-place by forward(), and
+        not by the optimizer, so they are stored as buffers (with the same
+        state dict keys as the previous parameters).
+        """
+        weight = self._embedding.weight.data
+        del self._embedding.weight
+        self._embedding.register_buffer('weight', weight)
         self.register_buffer('_ema_cluster_size', torch.zeros(num_embeddings))
-        self._ema_w = nn.Parameter(torch.Tensor(num_embeddings, self._embedding_dim))
-        self._ema_w.data.normal_()
+        self.register_buffer('_ema_w', torch.Tensor(num_embeddings, self._embedding_dim).normal_())
         
         self._decay = decay
         self._device = device
         self._epsilon = epsilon
+        self._codebook_search = CodebookSearch() if codebook_search is None else codebook_search
+        self._metrics = CodebookMetrics(num_embeddings)
+        self._channels_first = channels_first
 
-    def forward(self, inputs, compute_distances_if_possible=True, record_codebook_stats=False):
+    def forward(self, inputs, mask=None):
         """
         Connects the module to some inputs.
 
         Args:
-            inputs: Tensor, final dimension must be equal to embedding_dim. All other
-                leading dimensions will be flattened and treated as a large batch.
-        
+            inputs: Tensor of shape (B, embedding_dim, T), in the layout described
+                in VectorQuantizer.forward().
+            mask: Tensor of shape (B, 1, T) of the valid frames of padded inputs
+                (see PaddingMask), or None. The losses are averaged over the valid
+                elements only, and the perplexity, the codebook usage and the EMA
+                statistics only count the flattened rows without padding elements.
+                The padding frames of the quantized output are set to zero.
+
         Returns:
-            loss: Tensor containing the loss to optimize.
-            quantize: Tensor containing the quantized version of the input.
-            perplexity: Tensor containing the perplexity of the encodings.
-            encodings: Tensor containing the discrete encodings, ie which element
-                of the quantized space each input element was mapped to.
-            distances
-        """
-
-        # Convert inputs from BCHW -> BHWC
-        inputs = inputs.permute(1, 2, 0).contiguous()
-        input_shape = inputs.shape
-        _, time, batch_size = input_shape
-        
-        # Flatten input
-        flat_input = inputs.view(-1, self._embedding_dim)
-        
-        # Compute distances between encoded audio frames and embedding vectors
-        distances = (torch.sum(flat_input**2, dim=1, keepdim=True) 
-                    + torch.sum(self._embedding.weight**2, dim=1)
-                    - 2 * torch.matmul(flat_input, self._embedding.weight.t()))
+            VectorQuantizerOutput, with the loss, the quantized inputs of shape
+            (B, embedding_dim, T), the perplexity, the encoding indices and the
+            losses dict, and the diagnostics (encodings, distances, ...) computed
+            on demand.
+        """
 
         """
-        encoding_indices: Tensor containing the discrete encoding indices, ie
-        which element of the quantized space each input element was mapped to.
+        In mixed precision, the inputs are converted to float32, such as the
+        losses and the straight-through estimator are computed in float32.
         """
-        encoding_indices = torch.argmin(distances, dim=1).unsqueeze(1)
-        encodings = torch.zeros(encoding_indices.shape[0], self._num_embeddings, dtype=torch.float).to(self._device)
-        encodings.scatter_(1, encoding_indices, 1)
-
-        # Compute distances between encoding vectors
-        if not self.training and compute_distances_if_possible:
-            _encoding_distances = [torch.dist(items[0], items[1], 2).to(self._device) for items in combinations(flat_input, r=2)]
-            encoding_distances = torch.tensor(_encoding_distances).to(self._device).view(batch_size, -1)
-        else:
-            encoding_distances = None
+        if self._channels_first:
+            inputs = inputs.float()
+            batch_size, _, time = inputs.shape
+            element_mask, valid_rows = PaddingMask.quantizer_masks(mask, self._embedding_dim, channels_first=True)
 
-        # Compute distances between embedding vectors
-        if not self.training and compute_distances_if_possible:
-            _embedding_distances = [torch.dist(items[0], items[1], 2).to(self._device) for items in combinations(self._embedding.weight, r=2)]
-            embedding_distances = torch.tensor(_embedding_distances).to(self._device)
+            # Search the nearest embedding vector of each frame, with batched products over the channels
+            encoding_indices = self._codebook_search.search_channels_first(inputs, self._embedding.weight)
         else:
-            embedding_distances = None
-
-        # Sample nearest embedding
-        if not self.training and compute_distances_if_possible:
-            _frames_vs_embedding_distances = [torch.dist(items[0], items[1], 2).to(self._device) for items in product(flat_input, self._embedding.weight.detach())]
-            frames_vs_embedding_distances = torch.tensor(_frames_vs_embedding_distances).to(self._device).view(batch_size, time, -1)
-        else:
-            frames_vs_embedding_distances = None
-        
-        # Use EMA to update the embedding vectors
-        if self.training:
-            self._ema_cluster_size = self._ema_cluster_size * self._decay + \
-                (1 - self._decay) * torch.sum(encodings, 0)
+            # Convert inputs from BCHW -> BHWC, and flatten input
+            inputs = inputs.permute(1, 2, 0).contiguous().float()
+            input_shape = inputs.shape
+            _, time, batch_size = input_shape
+            flat_input = inputs.view(-1, self._embedding_dim)
+            element_mask, valid_rows = PaddingMask.quantizer_masks(mask, self._embedding_dim)
 
-            n = torch.sum(self._ema_cluster_size.data)
-            self._ema_cluster_size = (
-                (self._ema_cluster_size + self._epsilon)
-                / (n + self._num_embeddings * self._epsilon) * n
-            )
+            # Search the nearest embedding vector of each encoded audio frame
+            encoding_indices, _ = self._codebook_search.search(flat_input, self._embedding.weight)
 
-            dw = torch.matmul(encodings.t(), flat_input)
-            self._ema_w = nn.Parameter(self._ema_w * self._decay + (1 - self._decay) * dw)
+        """
+        encoding_indices: Tensor containing the discrete encoding indices, ie
+        which element of the quantized space each input element was mapped to.
+        """
+        encoding_indices = encoding_indices.view(-1, 1)
 
-            self._embedding.weight = nn.Parameter(self._ema_w / self._ema_cluster_size.unsqueeze(1))
+        # Number of frames mapped to each embedding vector
+        valid_indices = encoding_indices.view(-1) if valid_rows is None else encoding_indices.view(-1)[valid_rows]
+        encodings_counts = torch.bincount(valid_indices, minlength=self._num_embeddings)
+        if self.training:
+            self._metrics.record_usage(encodings_counts)
 
-        # Quantize and unflatten
-        quantized = torch.matmul(encodings, self._embedding.weight).view(input_shape)
-        # TODO: Check if the more readable self._embedding.weight.index_select(dim=1, index=encoding_indices) works better
+        # Use EMA to update the embedding vectors
+        if self.training and self._channels_first:
+            # The padding frames are zeroed, so they don't contribute to the accumulated frames
+            self._update_ema(PaddingMask.apply(inputs, element_mask), encoding_indices.view(batch_size, time),
+                encodings_counts)
+        elif self.training:
+            self._update_ema(flat_input if valid_rows is None else flat_input[valid_rows],
+                valid_indices, encodings_counts)
 
-        concatenated_quantized = self._embedding.weight[torch.argmin(distances, dim=1).detach().cpu()] if not self.training or record_codebook_stats else None
+        if self._channels_first:
+            # Quantize by gathering the embedding vectors, as a (B, embedding_dim, T) view
+            quantized = self._embedding(encoding_indices.view(batch_size, time)).float().transpose(1, 2)
+        else:
+            # Quantize by gathering the embedding vectors, and unflatten
+            flat_quantized = self._embedding(encoding_indices.view(-1)).float()
+            quantized = flat_quantized.view(input_shape)
 
         # Loss
-        e_latent_loss = torch.mean((quantized.detach() - inputs)**2)
+        e_latent_loss = PaddingMask.mean((quantized.detach() - inputs)**2, element_mask)
         commitment_loss = self._commitment_cost * e_latent_loss
         vq_loss = commitment_loss
 
         quantized = inputs + (quantized - inputs).detach()
-        avg_probs = torch.mean(encodings, dim=0)
+        quantized = PaddingMask.apply(quantized, element_mask)
+        avg_probs = encodings_counts.float() / max(valid_indices.shape[0], 1)
 
         """
         The perplexity a useful value to track during training.
@@ -175,13 +185,106 @@ class VectorQuantizerEMA(nn.Module):
         """
         perplexity = torch.exp(-torch.sum(avg_probs * torch.log(avg_probs + 1e-10)))
 
+        if self._channels_first:
+            return VectorQuantizerOutput.build_channels_first(vq_loss, quantized, perplexity, encoding_indices,
+                {'vq_loss': vq_loss.detach()}, inputs, self._embedding, self._codebook_search)
+
         # Convert quantized from BHWC -> BCHW
-        return vq_loss, quantized.permute(2, 0, 1).contiguous(), \
-            perplexity, encodings.view(batch_size, time, -1), \
-            distances.view(batch_size, time, -1), encoding_indices, \
-            {'vq_loss': vq_loss.item()}, encoding_distances, embedding_distances, \
-            frames_vs_embedding_distances, concatenated_quantized
+        return VectorQuantizerOutput.build(vq_loss, quantized.permute(2, 0, 1).contiguous(), perplexity,
+            encoding_indices, {'vq_loss': vq_loss.detach()}, flat_input, flat_quantized,
+            self._embedding, self._codebook_search, batch_size, time)
+
+    def _update_ema(self, inputs, encoding_indices, encodings_counts):
+        """
+        Update in-place the EMA statistics and the embedding vectors, without
+        allocating new buffers.
+
+        Args:
+            inputs: Tensor of shape (N, embedding_dim) of the frames, or of
+                shape (B, embedding_dim, T) in the channels first layout.
+            encoding_indices: Tensor of shape (N), or (B, T) in the channels first layout.
+            encodings_counts: Tensor of shape (num_embeddings).
+        """
+
+        with torch.no_grad():
+            self._ema_cluster_size.mul_(self._decay).add_(encodings_counts.float(), alpha=1 - self._decay)
+
+            # Laplace smoothing of the cluster sizes
+            n = torch.sum(self._ema_cluster_size)
+            self._ema_cluster_size.add_(self._epsilon).div_(n + self._num_embeddings * self._epsilon).mul_(n)
+
+            # Accumulate the frames mapped to each embedding vector
+            self._ema_w.mul_(self._decay)
+            if self._channels_first:
+                # Accumulated sample by sample in the transposed statistics, without flattening the inputs
+                ema_w = self._ema_w.t()
+                for sample_inputs, sample_indices in zip(inputs, encoding_indices):
+                    ema_w.index_add_(1, sample_indices, sample_inputs, alpha=1 - self._decay)
+            else:
+                self._ema_w.index_add_(0, encoding_indices, inputs, alpha=1 - self._decay)
+
+            torch.div(self._ema_w, self._ema_cluster_size.unsqueeze(1), out=self._embedding.weight)
+
+    def load_codebook(self, codebook, cluster_sizes=None):
+        """
+        Replace in-place the embedding vectors, e.g. with k-means centers,
+        and set the EMA statistics consistently.
+
+        Args:
+            codebook: Tensor of shape (num_embeddings, embedding_dim).
+            cluster_sizes: Tensor of shape (num_embeddings) containing the
+                expected number of frames per batch mapped to each embedding
+                vector, used as EMA cluster sizes (1 for all if None).
+        """
+
+        with torch.no_grad():
+            if cluster_sizes is None:
+                self._ema_cluster_size.fill_(1)
+            else:
+                self._ema_cluster_size.copy_(cluster_sizes)
+            self._embedding.weight.copy_(codebook)
+            torch.mul(self._embedding.weight, self._ema_cluster_size.unsqueeze(1), out=self._ema_w)
+
+    def compute_distances(self, inputs, chunk_size=PairwiseDistances.default_chunk_size):
+        """
+        Compute the distances diagnostics of forward() in eval mode,
+        without quantizing the inputs. It can be used to accumulate
+        the distances over a whole dataset.
+
+        Args:
+            inputs: Tensor of the same shape as the one used in forward().
+            chunk_size: number of rows processed at the same time.
+
+        Returns:
+            encoding_distances, embedding_distances, frames_vs_embedding_distances
+        """
+
+        with torch.no_grad():
+            batch_size, _, time = inputs.shape
+            return PairwiseDistances.compute(self.flatten(inputs), self._embedding.weight,
+                batch_size, time, chunk_size)
+
+    def flatten(self, inputs):
+        """
+        Args:
+            inputs: Tensor of shape (B, embedding_dim, T).
+
+        Returns:
+            The rows quantized by forward(), as a Tensor of shape (N, embedding_dim).
+        """
+
+        if self._channels_first:
+            return inputs.transpose(1, 2).reshape(-1, self._embedding_dim)
+        return inputs.permute(1, 2, 0).contiguous().view(-1, self._embedding_dim)
 
     @property
     def embedding(self):
         return self._embedding
+
+    @property
+    def channels_first(self):
+        return self._channels_first
+
+    @property
+    def metrics(self):
+        return self._metrics
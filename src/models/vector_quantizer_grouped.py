@@ -0,0 +1,241 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ # Copyright (C) 2018 Zalando Research                                               #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+from models.vector_quantizer import VectorQuantizer
+from models.vector_quantizer_ema import VectorQuantizerEMA
+from models.vector_quantizer_output import VectorQuantizerOutput
+from modules.pairwise_distances import PairwiseDistances
+from modules.codebook_metrics import CodebookMetrics
+from modules.padding_mask import PaddingMask
+
+import torch
+import torch.nn as nn
+
+
+class VectorQuantizerGrouped(nn.Module):
+    """
+    Product quantization variant of VectorQuantizer and VectorQuantizerEMA.
+
+    The embedding_dim channels of the inputs are split in num_groups groups
+    of embedding_dim / num_groups channels, and each group is quantized
+    against its own codebook of num_embeddings vectors. The effective
+    vocabulary is num_embeddings^num_groups, whereas the search cost and the
+    codebooks memory are only num_groups x num_embeddings x embedding_dim / num_groups.
+
+    The returned encoding indices are the joint indices of the groups
+    (mixed radix, the first group being the most significant digit). They can
+    be split back with split_indices(). The returned perplexity is the joint
+    one, and the perplexity of each group is reported in the losses dict as
+    perplexity_group_<g>. The encodings, the distances and the distances
+    diagnostics are the ones of the groups, concatenated on their last dimension.
+
+    Args:
+        num_embeddings: integer, the number of vectors in the codebook of each group.
+        embedding_dim: integer representing the dimensionality of the tensors in the
+            quantized space. It has to be divisible by num_groups.
+        commitment_cost: scalar which controls the weighting of the loss terms.
+        num_groups: integer, the number of groups.
+        decay: float, decay for the moving averages. If 0.0, the codebooks
+            are updated with the auxiliary loss (VectorQuantizer) instead of EMA.
+        codebook_search_factory: callable returning a new CodebookSearch for
+            each group (exhaustive search if None).
+        channels_first: boolean, the layout of the inputs of the groups
+            (see VectorQuantizer.forward()).
+    """
+
+    # Largest joint vocabulary whose perplexity is computed with a histogram
+    max_joint_histogram_size = 2 ** 16
+
+    def __init__(self, num_embeddings, embedding_dim, commitment_cost, num_groups, device, decay=0.0,
+        codebook_search_factory=None, channels_first=False):
+        super(VectorQuantizerGrouped, self).__init__()
+
+        if embedding_dim % num_groups != 0:
+            raise ValueError('embedding_dim ({}) has to be divisible by num_groups ({})'.format(
+                embedding_dim, num_groups))
+        if num_embeddings ** num_groups > torch.iinfo(torch.long).max:
+            raise ValueError('The joint vocabulary of {} groups of {} embeddings overflows the joint indices'.format(
+                num_groups, num_embeddings))
+
+        self._num_embeddings = num_embeddings
+        self._embedding_dim = embedding_dim
+        self._num_groups = num_groups
+        self._group_dim = embedding_dim // num_groups
+        self._device = device
+        self._channels_first = channels_first
+
+        codebook_search_factory = (lambda: None) if codebook_search_factory is None else codebook_search_factory
+        if decay > 0.0:
+            self._quantizers = nn.ModuleList([
+                VectorQuantizerEMA(num_embeddings, self._group_dim, commitment_cost, decay, device,
+                    codebook_search=codebook_search_factory(), channels_first=channels_first)
+                for _ in range(num_groups)
+            ])
+        else:
+            self._quantizers = nn.ModuleList([
+                VectorQuantizer(num_embeddings, self._group_dim, commitment_cost, device,
+                    codebook_search=codebook_search_factory(), channels_first=channels_first)
+                for _ in range(num_groups)
+            ])
+
+        # Weight of each group digit in the joint indices
+        self.register_buffer('_radix', num_embeddings ** torch.arange(num_groups - 1, -1, -1, dtype=torch.long),
+            persistent=False)
+
+        # The usage histogram concatenates the ones recorded by the quantizers of the groups
+        self._metrics = CodebookMetrics(num_groups * num_embeddings,
+            groups_metrics=[quantizer.metrics for quantizer in self._quantizers])
+
+        # (versions of the codebooks, embedding) of the last embedding property, kept out of the submodules
+        self._embedding_cache = None
+
+    def forward(self, inputs, mask=None):
+        """
+        Connects the module to some inputs, with the same arguments and
+        outputs as VectorQuantizer.forward(). The diagnostics of the
+        groups are concatenated on their last dimension.
+        """
+
+        outputs = [quantizer(group_inputs, mask)
+            for quantizer, group_inputs in zip(self._quantizers, torch.split(inputs, self._group_dim, dim=1))]
+
+        vq_loss = torch.stack([output.vq_loss for output in outputs]).mean()
+        group_indices = torch.cat([output.encoding_indices for output in outputs], dim=1)
+        joint_indices = self.join_indices(group_indices)
+
+        # The rows of the groups are flattened in the same way, and share the same padding
+        _, valid_rows = PaddingMask.quantizer_masks(mask, self._group_dim, self._channels_first)
+        valid_joint_indices = joint_indices if valid_rows is None else joint_indices[valid_rows]
+        perplexity = self._joint_perplexity(valid_joint_indices.view(-1))
+
+        merged_losses = {name: sum(output.losses[name] for output in outputs) / self._num_groups
+            for name in outputs[0].losses}
+        for group, output in enumerate(outputs):
+            merged_losses['perplexity_group_{}'.format(group)] = output.perplexity.detach()
+
+        def concatenate(name):
+            return lambda: self._concatenate([getattr(output, name) for output in outputs])
+
+        return VectorQuantizerOutput(vq_loss, torch.cat([output.quantized for output in outputs], dim=1),
+            perplexity, joint_indices, merged_losses, concatenate('encodings'), concatenate('distances'),
+            lambda: tuple(self._concatenate(group_distances) for group_distances in zip(*[(output.encoding_distances,
+                output.embedding_distances, output.frames_vs_embedding_distances) for output in outputs])),
+            concatenate('concatenated_quantized'))
+
+    def _joint_perplexity(self, joint_indices):
+        """
+        Perplexity of the joint codes, computed on the device without
+        synchronization (the sizes of the counts don't depend on the indices).
+        """
+
+        if self._num_embeddings ** self._num_groups <= self.max_joint_histogram_size:
+            counts = torch.bincount(joint_indices, minlength=self._num_embeddings ** self._num_groups)
+        else:
+            # Too many joint codes for a histogram: counts of the runs of equal sorted indices
+            sorted_indices, _ = torch.sort(joint_indices)
+            runs = torch.cumsum(sorted_indices[1:] != sorted_indices[:-1], dim=0)
+            runs = torch.cat([runs.new_zeros(min(sorted_indices.shape[0], 1)), runs])
+            counts = torch.zeros_like(sorted_indices).scatter_add_(0, runs, torch.ones_like(sorted_indices))
+
+        avg_probs = counts.float() / max(joint_indices.shape[0], 1)
+        return torch.exp(-torch.sum(avg_probs * torch.log(avg_probs + 1e-10)))
+
+    def join_indices(self, group_indices):
+        """
+        Args:
+            group_indices: Tensor of shape (N, num_groups).
+
+        Returns:
+            Tensor of shape (N, 1) containing the joint indices.
+        """
+
+        return torch.sum(group_indices * self._radix, dim=1, keepdim=True)
+
+    def split_indices(self, joint_indices):
+        """
+        Args:
+            joint_indices: Tensor of shape (N, 1).
+
+        Returns:
+            Tensor of shape (N, num_groups) containing the indices of each group.
+        """
+
+        return (joint_indices // self._radix) % self._num_embeddings
+
+    def compute_distances(self, inputs, chunk_size=PairwiseDistances.default_chunk_size):
+        """
+        Compute the distances diagnostics of each group, concatenated
+        on their last dimension (see VectorQuantizer.compute_distances()).
+        """
+
+        distances = [quantizer.compute_distances(group_inputs, chunk_size)
+            for quantizer, group_inputs in zip(self._quantizers, torch.split(inputs, self._group_dim, dim=1))]
+        return tuple(self._concatenate(group_distances) for group_distances in zip(*distances))
+
+    def load_codebook(self, codebook, cluster_sizes=None):
+        """
+        Args:
+            codebook: Tensor of shape (num_groups, num_embeddings, embedding_dim / num_groups).
+            cluster_sizes: Tensor of shape (num_groups, num_embeddings) or None.
+        """
+
+        for group, quantizer in enumerate(self._quantizers):
+            quantizer.load_codebook(codebook[group], None if cluster_sizes is None else cluster_sizes[group])
+
+    def _concatenate(self, tensors):
+        return None if tensors[0] is None else torch.cat(tensors, dim=-1)
+
+    @property
+    def num_groups(self):
+        return self._num_groups
+
+    @property
+    def quantizers(self):
+        return self._quantizers
+
+    @property
+    def channels_first(self):
+        return self._channels_first
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def embedding(self):
+        """
+        Detached copy of the codebooks of all the groups, as an embedding of
+        num_groups x num_embeddings vectors of embedding_dim / num_groups dimensions.
+        It's only copied again once the codebooks are modified.
+        """
+
+        weights = [quantizer.embedding.weight for quantizer in self._quantizers]
+        versions = [(id(weight), weight._version) for weight in weights]
+        if self._embedding_cache is None or self._embedding_cache[0] != versions:
+            self._embedding_cache = (versions, nn.Embedding.from_pretrained(
+                torch.cat([weight.detach() for weight in weights], dim=0)))
+        return self._embedding_cache[1]
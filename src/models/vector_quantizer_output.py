@@ -0,0 +1,153 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ # Copyright (C) 2018 Zalando Research                                               #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+from modules.pairwise_distances import PairwiseDistances
+
+import torch
+
+
+class VectorQuantizerOutput(object):
+    """
+    Outputs of the quantizers.
+
+    The outputs needed by the training (loss, quantized, perplexity, encoding
+    indices and losses) are always computed. The other ones are only
+    diagnostics, computed on demand the first time they're accessed, and then
+    cached. They're computed with the codebook at access time (i.e. after the
+    EMA update in training mode).
+
+    Args:
+        vq_loss: Tensor containing the loss to optimize.
+        quantized: Tensor containing the quantized version of the input, of shape (B, C, T).
+        perplexity: Tensor containing the perplexity of the encodings.
+        encoding_indices: Tensor of shape (N, 1) containing the discrete encoding
+            indices, ie which element of the quantized space each input element
+            was mapped to.
+        losses: dict of detached scalar tensors, for the logging.
+        compute_encodings: function returning the one-hot encodings, of shape (B, T, num_embeddings).
+        compute_distances: function returning the distances between the encoded
+            frames and the embedding vectors, of shape (B, T, num_embeddings).
+        compute_pairwise_distances: function returning the encoding distances,
+            the embedding distances and the frames vs embedding distances.
+        compute_concatenated_quantized: function returning the flat quantized
+            vectors, of shape (N, embedding_dim).
+    """
+
+    def __init__(self, vq_loss, quantized, perplexity, encoding_indices, losses, compute_encodings,
+        compute_distances, compute_pairwise_distances, compute_concatenated_quantized):
+
+        self.vq_loss = vq_loss
+        self.quantized = quantized
+        self.perplexity = perplexity
+        self.encoding_indices = encoding_indices
+        self.losses = losses
+        self._compute_functions = {
+            'encodings': compute_encodings,
+            'distances': compute_distances,
+            'pairwise_distances': compute_pairwise_distances,
+            'concatenated_quantized': compute_concatenated_quantized
+        }
+        self._values = dict()
+
+    @staticmethod
+    def build(vq_loss, quantized, perplexity, encoding_indices, losses, flat_input, flat_quantized,
+        embedding, codebook_search, batch_size, time):
+        """
+        Build the outputs of VectorQuantizer and VectorQuantizerEMA, with the
+        diagnostics computed from the flat inputs of shape (N, embedding_dim)
+        and the codebook of the embedding.
+        """
+
+        flat_input = flat_input.detach()
+        return VectorQuantizerOutput._build(vq_loss, quantized, perplexity, encoding_indices, losses,
+            lambda: flat_input, lambda: flat_quantized, embedding, codebook_search, batch_size, time)
+
+    @staticmethod
+    def build_channels_first(vq_loss, quantized, perplexity, encoding_indices, losses, inputs,
+        embedding, codebook_search):
+        """
+        Build the outputs of VectorQuantizer and VectorQuantizerEMA in channels
+        first layout, from their inputs of shape (B, embedding_dim, T). The
+        flat inputs and quantized vectors (one row per frame, in batch major
+        order) are only copied if a diagnostic needs them.
+        """
+
+        batch_size, embedding_dim, time = inputs.size()
+        inputs = inputs.detach()
+        return VectorQuantizerOutput._build(vq_loss, quantized, perplexity, encoding_indices, losses,
+            lambda: inputs.transpose(1, 2).reshape(-1, embedding_dim),
+            lambda: quantized.detach().transpose(1, 2).reshape(-1, embedding_dim),
+            embedding, codebook_search, batch_size, time)
+
+    @staticmethod
+    def _build(vq_loss, quantized, perplexity, encoding_indices, losses, compute_flat_input,
+        compute_flat_quantized, embedding, codebook_search, batch_size, time):
+
+        def compute_encodings():
+            encodings = torch.zeros(encoding_indices.shape[0], embedding.weight.size(0), dtype=torch.float, device=encoding_indices.device)
+            encodings.scatter_(1, encoding_indices, 1)
+            return encodings.view(batch_size, time, -1)
+
+        def compute_distances():
+            return codebook_search.distances(compute_flat_input(), embedding.weight).view(batch_size, time, -1)
+
+        def compute_pairwise_distances():
+            # Distances between encoding vectors, between embedding vectors and between both
+            with torch.no_grad():
+                return PairwiseDistances.compute(compute_flat_input(), embedding.weight, batch_size, time)
+
+        return VectorQuantizerOutput(vq_loss, quantized, perplexity, encoding_indices, losses,
+            compute_encodings, compute_distances, compute_pairwise_distances, compute_flat_quantized)
+
+    def _get(self, name):
+        if name not in self._values:
+            self._values[name] = self._compute_functions[name]()
+        return self._values[name]
+
+    @property
+    def encodings(self):
+        return self._get('encodings')
+
+    @property
+    def distances(self):
+        return self._get('distances')
+
+    @property
+    def encoding_distances(self):
+        return self._get('pairwise_distances')[0]
+
+    @property
+    def embedding_distances(self):
+        return self._get('pairwise_distances')[1]
+
+    @property
+    def frames_vs_embedding_distances(self):
+        return self._get('pairwise_distances')[2]
+
+    @property
+    def concatenated_quantized(self):
+        return self._get('concatenated_quantized')
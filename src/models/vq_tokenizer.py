@@ -0,0 +1,139 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ # Copyright (C) 2018 Zalando Research                                               #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+from modules.weight_norm_folding import WeightNormFolding
+
+import torch
+import torch.nn as nn
+import json
+
+
+class VQTokenizer(nn.Module):
+    """
+    Inference only tokenizer, made of the encoder, the pre VQ convolution and
+    the codebook(s) of a ConvolutionalVQVAE: it maps input features to the
+    indices of the nearest codebook vectors (exhaustive search), without the
+    decoder and the training bookkeeping of the quantizers.
+
+    It's exported as a TorchScript archive by export(), and loaded back by
+    load(), which only depends on torch (no model code, matplotlib, umap or
+    sklearn on the load path).
+
+    Args:
+        encoder: ConvolutionalEncoder of the model.
+        pre_vq_conv: Conv1d of the model.
+        codebooks: list of Tensors of shape (num_embeddings, embedding_dim / num_groups),
+            a single one for VectorQuantizer and VectorQuantizerEMA.
+        channels_first: boolean, the layout of the quantizers (see VectorQuantizer.forward()).
+    """
+
+    configuration_file_name = 'vq_tokenizer.json'
+
+    def __init__(self, encoder, pre_vq_conv, codebooks, channels_first=False):
+        super(VQTokenizer, self).__init__()
+
+        self._encoder = WeightNormFolding.folded_copy(encoder)
+        self._pre_vq_conv = WeightNormFolding.folded_copy(pre_vq_conv)
+
+        self._num_groups = len(codebooks)
+        self._num_embeddings = codebooks[0].size(0)
+        self._group_dim = codebooks[0].size(1)
+        self._channels_first = channels_first
+        self.register_buffer('_codebooks', torch.stack([codebook.detach().float() for codebook in codebooks]))
+        self.register_buffer('_squared_norms', torch.sum(self._codebooks**2, dim=2))
+        # Weight of each group digit in the joint indices, as in VectorQuantizerGrouped
+        self.register_buffer('_radix', self._num_embeddings ** torch.arange(self._num_groups - 1, -1, -1, dtype=torch.long))
+
+    @staticmethod
+    def from_model(model):
+        vq = model.vq
+        quantizers = vq.quantizers if hasattr(vq, 'quantizers') else [vq]
+        return VQTokenizer(model.encoder, model.pre_vq_conv,
+            [quantizer.embedding.weight for quantizer in quantizers], vq.channels_first).eval()
+
+    def forward(self, features):
+        """
+        Args:
+            features: Tensor of shape (B, T, features_filters), as the input
+                features of the data streams.
+
+        Returns:
+            Tensor of shape (B, T / 2 + 1) containing the encoding indices,
+            with the same layout as the ones of ConvolutionalVQVAE.
+        """
+
+        x = features.permute(0, 2, 1).float()
+        z = self._pre_vq_conv(self._encoder(x))
+        batch_size = z.size(0)
+
+        encoding_indices = torch.zeros(1, dtype=torch.long, device=z.device)
+        for group, group_z in enumerate(torch.split(z, self._group_dim, dim=1)):
+            if self._channels_first:
+                # Scores of shape (B, num_embeddings, T), with batched products over the channels
+                scores = torch.matmul(self._codebooks[group], group_z).mul_(-2).add_(
+                    self._squared_norms[group].unsqueeze(1))
+                group_indices = torch.argmin(scores, dim=1).view(-1)
+            else:
+                # Same flattening as in the quantizers
+                flat_input = group_z.permute(1, 2, 0).contiguous().view(-1, self._group_dim)
+                scores = torch.addmm(self._squared_norms[group], flat_input, self._codebooks[group].t(), alpha=-2)
+                group_indices = torch.argmin(scores, dim=1)
+            encoding_indices = encoding_indices + group_indices * self._radix[group]
+
+        return encoding_indices.view(batch_size, -1)
+
+    @staticmethod
+    def export(model, path, example_length=160):
+        """
+        Trace the tokenizer of a ConvolutionalVQVAE, and save it with its configuration
+        as a TorchScript archive.
+        """
+
+        tokenizer = VQTokenizer.from_model(model).cpu()
+        example = torch.randn(1, example_length, model.encoder.features_filters)
+        with torch.no_grad():
+            traced_tokenizer = torch.jit.trace(tokenizer, example)
+        configuration = {
+            'num_embeddings': tokenizer._num_embeddings,
+            'num_groups': tokenizer._num_groups,
+            'embedding_dim': tokenizer._num_groups * tokenizer._group_dim,
+            'vq_layout': 'channels_first' if tokenizer._channels_first else 'legacy',
+            'features_filters': model.encoder.features_filters
+        }
+        torch.jit.save(traced_tokenizer, path,
+            _extra_files={VQTokenizer.configuration_file_name: json.dumps(configuration)})
+
+    @staticmethod
+    def load(path, device='cpu'):
+        """
+        Returns:
+            The TorchScript tokenizer, and its configuration dict.
+        """
+
+        extra_files = {VQTokenizer.configuration_file_name: ''}
+        tokenizer = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+        return tokenizer, json.loads(extra_files[VQTokenizer.configuration_file_name])
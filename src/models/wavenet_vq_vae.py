@@ -28,6 +28,7 @@ from models.convolutional_encoder import ConvolutionalEncoder
 from models.wavenet_decoder import WaveNetDecoder
 from models.vector_quantizer import VectorQuantizer
 from models.vector_quantizer_ema import VectorQuantizerEMA
+from modules.codebook_search import CodebookSearch
 
 import torch
 import torch.nn as nn
@@ -47,7 +48,8 @@ class WaveNetVQVAE(nn.Module):
             input_features_type=configuration['input_features_type'],
             features_filters=configuration['input_features_filters'] * 3 if configuration['augment_input_features'] else configuration['input_features_filters'],
             sampling_rate=configuration['sampling_rate'],
-            device=device
+            device=device,
+            use_activation_checkpointing=configuration.get('use_activation_checkpointing', False)
         )
 
         self._pre_vq_conv = nn.Conv1d(
@@ -64,14 +66,16 @@ class WaveNetVQVAE(nn.Module):
                 embedding_dim=configuration['embedding_dim'],
                 commitment_cost=configuration['commitment_cost'],
                 decay=configuration['decay'],
-                device=device
+                device=device,
+                codebook_search=CodebookSearch.from_configuration(configuration)
             )
         else:
             self._vq = VectorQuantizer(
                 num_embeddings=configuration['num_embeddings'],
                 embedding_dim=configuration['embedding_dim'],
                 commitment_cost=configuration['commitment_cost'],
-                device=device
+                device=device,
+                codebook_search=CodebookSearch.from_configuration(configuration)
             )
 
         self._decoder = WaveNetDecoder(
@@ -81,7 +85,6 @@ class WaveNetVQVAE(nn.Module):
         )
 
         self._device = device
-        self._record_codebook_stats = configuration['record_codebook_stats']
 
     @property
     def vq(self):
@@ -104,10 +107,9 @@ class WaveNetVQVAE(nn.Module):
 
         z = self._pre_vq_conv(z)
 
-        vq_loss, quantized, perplexity, _, _, encoding_indices, \
-            losses, _, _, _, concatenated_quantized = self._vq(z, record_codebook_stats=self._record_codebook_stats)
+        vq_output = self._vq(z)
 
-        local_condition = quantized
+        local_condition = vq_output.quantized
         local_condition = local_condition.squeeze(-1)
         x_dec = x_dec.squeeze(-1)
 
@@ -115,7 +117,7 @@ class WaveNetVQVAE(nn.Module):
         reconstructed_x = reconstructed_x.unsqueeze(-1)
         x_dec = x_dec.unsqueeze(-1)
 
-        return reconstructed_x, x_dec, vq_loss, losses, perplexity, encoding_indices, concatenated_quantized
+        return reconstructed_x, x_dec, vq_output
 
     def save(self, path):
         torch.save(self.state_dict(), path)
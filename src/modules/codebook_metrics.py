@@ -0,0 +1,183 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import torch
+import torch.nn as nn
+
+
+class CodebookMetrics(nn.Module):
+    """
+    On-device accumulator of the training metrics of a quantizer.
+
+    The code usage histogram of the epoch is accumulated on the device of the
+    codebook, and the per step metrics (losses and perplexity) are kept as
+    device tensors until flush() is called, such as the training loop only
+    synchronizes with the host every flush_interval steps or at the end of
+    an epoch, instead of at every .item() call.
+
+    The buffers aren't persistent, so the state dict of the quantizers
+    is unchanged.
+
+    Args:
+        num_embeddings: integer, the number of codes of the histogram.
+        flush_interval: integer, number of steps between two flushes.
+        groups_metrics: list of the CodebookMetrics of the groups of a grouped
+            quantizer, or None. The usage histogram is then the concatenation
+            of the ones of the groups, instead of being recorded again.
+    """
+
+    def __init__(self, num_embeddings, flush_interval=100, groups_metrics=None):
+        super(CodebookMetrics, self).__init__()
+
+        self._num_embeddings = num_embeddings
+        self._flush_interval = flush_interval
+        # Not registered as submodules, as they belong to the quantizers of the groups
+        self._groups_metrics = None if groups_metrics is None else list(groups_metrics)
+        self.register_buffer('_usage', torch.zeros(0 if groups_metrics is not None else num_embeddings,
+            dtype=torch.long), persistent=False)
+        self._names = None
+        self._pending = list()
+        self._steps = 0
+        self._sums = dict()
+        self._count = 0
+        self._last = dict()
+
+    @property
+    def flush_interval(self):
+        return self._flush_interval
+
+    @flush_interval.setter
+    def flush_interval(self, flush_interval):
+        self._flush_interval = flush_interval
+
+    @property
+    def last(self):
+        """
+        Metrics of the last flushed step.
+        """
+
+        return self._last
+
+    @property
+    def usage(self):
+        """
+        Usage histogram of the epoch, on the device.
+        """
+
+        if self._groups_metrics is not None:
+            return torch.cat([metrics.usage for metrics in self._groups_metrics])
+        return self._usage
+
+    def record_usage(self, encodings_counts):
+        """
+        Add the number of frames mapped to each code in a batch to the
+        usage histogram, without synchronization.
+        """
+
+        with torch.no_grad():
+            self._usage.add_(encodings_counts.to(self._usage.device))
+
+    def record(self, losses, perplexity):
+        """
+        Record the metrics of a step, without synchronization.
+
+        Args:
+            losses: dict of scalar tensors.
+            perplexity: scalar tensor.
+        """
+
+        if self._names is None:
+            self._names = list(losses.keys()) + ['perplexity']
+        with torch.no_grad():
+            self._pending.append(torch.stack([torch.as_tensor(losses[name]).detach().float().to(perplexity.device)
+                for name in self._names[:-1]] + [perplexity.detach().float()]))
+        self._steps += 1
+
+    def should_flush(self):
+        return len(self._pending) > 0 and self._steps % self._flush_interval == 0
+
+    def flush(self):
+        """
+        Copy the pending metrics to the host, with a single synchronization.
+
+        Returns:
+            losses: list of dicts of floats, one per step.
+            perplexities: list of floats, one per step.
+        """
+
+        if len(self._pending) == 0:
+            return list(), list()
+
+        rows = torch.stack(self._pending).cpu().tolist()
+        self._pending = list()
+
+        losses = [dict(zip(self._names[:-1], row[:-1])) for row in rows]
+        perplexities = [row[-1] for row in rows]
+        for row in rows:
+            for name, value in zip(self._names, row):
+                self._sums[name] = self._sums.get(name, 0.0) + value
+        self._count += len(rows)
+        self._last = dict(zip(self._names, rows[-1]))
+
+        return losses, perplexities
+
+    def summary(self):
+        """
+        Metrics of the epoch, computed from the usage histogram and the flushed steps.
+
+        Returns:
+            dict with the epoch perplexity of the codes, the number of dead
+            codes (not used during the epoch), the usage histogram and the
+            mean of each flushed metric.
+        """
+
+        usage = self.usage.cpu()
+        total = usage.sum().item()
+        if total > 0:
+            avg_probs = usage.double() / total
+            perplexity = torch.exp(-torch.sum(avg_probs * torch.log(avg_probs + 1e-10))).item()
+        else:
+            perplexity = 0.0
+
+        return {
+            'epoch_perplexity': perplexity,
+            'dead_codes': int((usage == 0).sum().item()),
+            'usage': usage.numpy(),
+            'means': {name: value / self._count for name, value in self._sums.items()} if self._count > 0 else dict()
+        }
+
+    def reset(self):
+        """
+        Clear the epoch accumulators. The pending steps have to be flushed before.
+        """
+
+        self._usage.zero_()
+        for metrics in self._groups_metrics or list():
+            metrics.reset()
+        self._pending = list()
+        self._steps = 0
+        self._sums = dict()
+        self._count = 0
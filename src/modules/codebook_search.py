@@ -0,0 +1,346 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import torch
+
+
+class CodebookSearch(object):
+    """
+    Nearest codebook vector search used by the quantizers.
+
+    By default (tile_size=None), the search is exhaustive: the whole
+    (N x num_embeddings) distances matrix is built, and its argmin is taken.
+    If tile_size is specified, the frames are processed by blocks of
+    tile_size rows, such as the peak memory is bounded by
+    tile_size x num_embeddings instead of N x num_embeddings.
+
+    The squared norms of the codebook vectors are cached between calls,
+    and recomputed only if the codebook was modified in-place (detected
+    with the version counter of the tensor) or replaced.
+
+    In mixed precision (reduced precision inputs or autocast), the products
+    between the frames and the codebook vectors are computed in reduced
+    precision, but the norms, the distances and the argmin are kept in
+    float32, as the expanded square formula loses too much precision in
+    float16/bfloat16.
+
+    Args:
+        tile_size: integer, number of frames processed at the same time,
+            or None to use the exhaustive search.
+    """
+
+    def __init__(self, tile_size=None):
+        self._tile_size = tile_size
+        self._cached_weight = None
+        self._cached_version = None
+        self._cached_squared_norms = None
+
+    @staticmethod
+    def from_configuration(configuration):
+        search_type = configuration.get('codebook_search', 'exhaustive')
+        if search_type == 'exhaustive':
+            return CodebookSearch()
+        elif search_type == 'tiled':
+            return CodebookSearch(tile_size=configuration.get('codebook_search_tile_size', 4096))
+        elif search_type == 'inverted_file':
+            return InvertedFileCodebookSearch(
+                num_lists=configuration.get('codebook_search_num_lists', 64),
+                num_probes=configuration.get('codebook_search_num_probes', 4),
+                rebuild_interval=configuration.get('codebook_search_rebuild_interval', 100)
+            )
+        raise NotImplementedError("Codebook search '{}' isn't implemented for now".format(search_type))
+
+    @property
+    def tile_size(self):
+        return self._tile_size
+
+    def invalidate(self):
+        """
+        Drop the cached squared norms. It has to be called if the codebook
+        was modified without incrementing its version counter (e.g. with .data).
+        """
+
+        self._cached_weight = None
+        self._cached_version = None
+        self._cached_squared_norms = None
+
+    def squared_norms(self, weight):
+        if self._cached_weight is not weight or self._cached_version != weight._version:
+            with torch.no_grad():
+                self._cached_squared_norms = torch.sum(weight.float()**2, dim=1)
+            self._cached_weight = weight
+            self._cached_version = weight._version
+        return self._cached_squared_norms
+
+    def distances(self, flat_input, weight):
+        """
+        Compute the full distances matrix between the frames and the codebook vectors.
+
+        Args:
+            flat_input: Tensor of shape (N, embedding_dim).
+            weight: Tensor of shape (num_embeddings, embedding_dim).
+
+        Returns:
+            Tensor of shape (N, num_embeddings).
+        """
+
+        with torch.no_grad():
+            return (torch.sum(flat_input.float()**2, dim=1, keepdim=True)
+                + self.squared_norms(weight)
+                - 2 * torch.matmul(flat_input, weight.t().to(flat_input.dtype)).float())
+
+    @staticmethod
+    def reduced_precision(tensor):
+        return tensor.dtype in (torch.float16, torch.bfloat16) or torch.is_autocast_enabled(tensor.device.type)
+
+    def scores(self, queries, vectors, squared_norms):
+        """
+        Compute |e|^2 - 2x.e in float32, which has the same argmin over e as
+        the distances, as |x|^2 doesn't change the argmin of a row.
+        """
+
+        if self.reduced_precision(queries):
+            return squared_norms - 2 * torch.matmul(queries, vectors.t().to(queries.dtype)).float()
+        return torch.addmm(squared_norms, queries, vectors.t(), alpha=-2)
+
+    def search(self, flat_input, weight, return_distances=False):
+        """
+        Search the nearest codebook vector of each frame.
+
+        Args:
+            flat_input: Tensor of shape (N, embedding_dim).
+            weight: Tensor of shape (num_embeddings, embedding_dim).
+            return_distances: boolean, if True the full distances matrix
+                is also returned (and materialized in the tiled mode).
+
+        Returns:
+            encoding_indices: Tensor of shape (N) containing the indices of
+                the nearest codebook vectors.
+            distances: Tensor of shape (N, num_embeddings) or None.
+        """
+
+        if self._tile_size is None:
+            distances = self.distances(flat_input, weight)
+            return torch.argmin(distances, dim=1), distances if return_distances else None
+
+        with torch.no_grad():
+            squared_norms = self.squared_norms(weight)
+            encoding_indices = torch.empty(flat_input.size(0), dtype=torch.long, device=flat_input.device)
+            for start in range(0, flat_input.size(0), self._tile_size):
+                block = flat_input[start:start + self._tile_size]
+                block_distances = self.scores(block, weight, squared_norms)
+                encoding_indices[start:start + self._tile_size] = torch.argmin(block_distances, dim=1)
+
+        return encoding_indices, self.distances(flat_input, weight) if return_distances else None
+
+    def search_channels_first(self, inputs, weight):
+        """
+        Search the nearest codebook vector of each frame of inputs in channels
+        first layout, with batched products over the channels, without
+        flattening the inputs. The tiled mode processes blocks of frames of
+        all the batch, of about tile_size frames.
+
+        Args:
+            inputs: Tensor of shape (B, embedding_dim, T).
+            weight: Tensor of shape (num_embeddings, embedding_dim).
+
+        Returns:
+            Tensor of shape (B, T) containing the indices of the nearest codebook vectors.
+        """
+
+        with torch.no_grad():
+            squared_norms = self.squared_norms(weight).unsqueeze(1)
+            batch_size, _, time = inputs.size()
+            if self._tile_size is None:
+                return torch.argmin(self.channels_first_scores(inputs, weight, squared_norms), dim=1)
+
+            tile_length = max(1, self._tile_size // batch_size)
+            encoding_indices = torch.empty(batch_size, time, dtype=torch.long, device=inputs.device)
+            for start in range(0, time, tile_length):
+                block = inputs[:, :, start:start + tile_length]
+                encoding_indices[:, start:start + tile_length] = torch.argmin(
+                    self.channels_first_scores(block, weight, squared_norms), dim=1)
+            return encoding_indices
+
+    def channels_first_scores(self, inputs, vectors, squared_norms):
+        """
+        Same as scores(), for inputs of shape (B, embedding_dim, T) and
+        squared norms of shape (num_embeddings, 1). Returns scores of shape
+        (B, num_embeddings, T).
+        """
+
+        if self.reduced_precision(inputs):
+            return squared_norms - 2 * torch.matmul(vectors.to(inputs.dtype), inputs).float()
+        return torch.baddbmm(squared_norms, vectors.expand(inputs.size(0), -1, -1), inputs, alpha=-2)
+
+
+class InvertedFileCodebookSearch(CodebookSearch):
+    """
+    Approximate nearest codebook vector search, based on an inverted file
+    partition of the codebook.
+
+    The codebook vectors are partitioned in num_lists clusters with k-means.
+    Each frame is then only compared to the codebook vectors of the num_probes
+    lists with the nearest centroids, instead of the whole codebook. The cost
+    of a search is reduced from num_embeddings x embedding_dim to
+    (num_lists + num_probes x num_embeddings / num_lists) x embedding_dim per
+    frame, which is sub-linear in num_embeddings for num_lists ~ sqrt(num_embeddings).
+
+    The distances to the candidates are always computed with the current
+    codebook, but the partition is only rebuilt after rebuild_interval
+    modifications of the codebook (e.g. optimizer steps or EMA updates).
+
+    Args:
+        num_lists: integer, number of lists of the partition.
+        num_probes: integer, number of lists searched for each frame.
+        rebuild_interval: integer, number of codebook modifications after
+            which the partition is rebuilt.
+        kmeans_iterations: integer, number of k-means iterations of a rebuild.
+        seed: integer, seed of the k-means initialization.
+    """
+
+    def __init__(self, num_lists=64, num_probes=4, rebuild_interval=100, kmeans_iterations=10, seed=1234):
+        super(InvertedFileCodebookSearch, self).__init__()
+
+        self._num_lists = num_lists
+        self._num_probes = num_probes
+        self._rebuild_interval = rebuild_interval
+        self._kmeans_iterations = kmeans_iterations
+        self._seed = seed
+        self._centroids = None
+        self._lists = None
+        self._seen_weight = None
+        self._seen_version = None
+        self._modifications_since_rebuild = 0
+
+    @property
+    def num_lists(self):
+        return self._num_lists
+
+    @property
+    def num_probes(self):
+        return self._num_probes
+
+    def invalidate(self):
+        super(InvertedFileCodebookSearch, self).invalidate()
+        self._centroids = None
+        self._lists = None
+
+    def rebuild(self, weight):
+        """
+        Partition the codebook vectors with k-means.
+        """
+
+        with torch.no_grad():
+            vectors = weight.detach().float()
+            num_lists = min(self._num_lists, vectors.size(0))
+            generator = torch.Generator().manual_seed(self._seed)
+            centroids = vectors[torch.randperm(vectors.size(0), generator=generator)[:num_lists].to(vectors.device)].clone()
+
+            for _ in range(self._kmeans_iterations):
+                assignments = torch.argmin(torch.cdist(vectors, centroids), dim=1)
+                counts = torch.bincount(assignments, minlength=num_lists)
+                sums = torch.zeros_like(centroids).index_add_(0, assignments, vectors)
+                # The empty lists keep their previous centroid
+                non_empty = counts > 0
+                centroids[non_empty] = sums[non_empty] / counts[non_empty].unsqueeze(1).to(vectors.dtype)
+
+            assignments = torch.argmin(torch.cdist(vectors, centroids), dim=1)
+            sorted_assignments, order = torch.sort(assignments)
+            counts = torch.bincount(sorted_assignments, minlength=num_lists).tolist()
+
+        self._centroids = centroids
+        self._lists = list(torch.split(order, counts))
+        self._seen_weight = weight
+        self._seen_version = weight._version
+        self._modifications_since_rebuild = 0
+
+    def _refresh(self, weight):
+        if self._lists is None:
+            self.rebuild(weight)
+            return
+
+        if self._seen_weight is not weight or self._seen_version != weight._version:
+            self._seen_weight = weight
+            self._seen_version = weight._version
+            self._modifications_since_rebuild += 1
+
+        if self._modifications_since_rebuild >= self._rebuild_interval:
+            self.rebuild(weight)
+
+    def search(self, flat_input, weight, return_distances=False):
+        with torch.no_grad():
+            self._refresh(weight)
+            squared_norms = self.squared_norms(weight)
+            flat_input = flat_input.detach()
+            vectors = weight.detach()
+            num_frames = flat_input.size(0)
+            num_probes = min(self._num_probes, len(self._lists))
+
+            # Select the lists to probe for each frame
+            centroids_distances = self.scores(flat_input, self._centroids,
+                torch.sum(self._centroids.float()**2, dim=1))
+            probes = torch.topk(centroids_distances, num_probes, dim=1, largest=False).indices.view(-1)
+
+            """
+            Group the (frame, probed list) pairs by list, such as each list is
+            compared to all the frames that probe it with a single matmul.
+            """
+            pairs_frames = torch.arange(num_frames, device=flat_input.device).repeat_interleave(num_probes)
+            sorted_probes, order = torch.sort(probes)
+            pairs_counts = torch.bincount(sorted_probes, minlength=len(self._lists)).tolist()
+
+            pairs_distances = torch.full((probes.size(0),), float('inf'), device=flat_input.device)
+            pairs_indices = torch.zeros(probes.size(0), dtype=torch.long, device=flat_input.device)
+            for codes, pairs in zip(self._lists, torch.split(order, pairs_counts)):
+                if codes.numel() == 0 or pairs.numel() == 0:
+                    continue
+                distances = self.scores(flat_input[pairs_frames[pairs]], vectors[codes], squared_norms[codes])
+                min_distances, argmin = torch.min(distances, dim=1)
+                pairs_distances[pairs] = min_distances
+                pairs_indices[pairs] = codes[argmin]
+
+            # Keep the best candidate over the probed lists of each frame
+            best_probes = torch.argmin(pairs_distances.view(num_frames, num_probes), dim=1, keepdim=True)
+            encoding_indices = pairs_indices.view(num_frames, num_probes).gather(1, best_probes).view(-1)
+
+        return encoding_indices, self.distances(flat_input, weight) if return_distances else None
+
+    def search_channels_first(self, inputs, weight):
+        # The lists are searched frame by frame, on the flattened inputs
+        batch_size, embedding_dim, time = inputs.size()
+        encoding_indices, _ = self.search(inputs.transpose(1, 2).reshape(-1, embedding_dim), weight)
+        return encoding_indices.view(batch_size, time)
+
+    def recall_at_1(self, flat_input, weight):
+        """
+        Fraction of the frames for which the approximate search returns
+        the same codebook vector as the exhaustive search.
+        """
+
+        approximate_indices, _ = self.search(flat_input, weight)
+        exact_indices, _ = CodebookSearch().search(flat_input, weight)
+        return (approximate_indices == exact_indices).float().mean().item()
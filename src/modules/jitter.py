@@ -24,8 +24,8 @@
  #   SOFTWARE.                                                                       #
  #####################################################################################
 
+import torch
 import torch.nn as nn
-import numpy as np
 
 
 class Jitter(nn.Module):
@@ -37,34 +37,58 @@ class Jitter(nn.Module):
     this regularization also promotes latent representation stability
     over time: a latent vector extracted at time step t must strive
     to also be useful at time steps t − 1 or t + 1.
+
+    The replacements are drawn with the torch RNG on the device of the
+    inputs, as a tensor of time indices per sample, and applied with a
+    single gather. The replacing neighbors are detached, so a replaced
+    vector has no gradient, as with the copy of a detached clone.
+
+    Args:
+        probability: Probability to replace each latent vector (0.12 from the paper).
+        independent_per_sample: If True, each element of the batch has its
+            own replacements, otherwise they're shared across the batch.
+        generator: torch.Generator on the device of the inputs, for
+            reproducible replacements (the default generator if None).
     """
 
-    def __init__(self, probability=0.12):
+    def __init__(self, probability=0.12, independent_per_sample=False, generator=None):
         super(Jitter, self).__init__()
 
         self._probability = probability
+        self._independent_per_sample = independent_per_sample
+        self._generator = generator
+
+    def forward(self, quantized, lengths=None):
+        """
+        Args:
+            quantized: Tensor of shape (B, C, T).
+            lengths: Tensor of the B lengths of the sequences, if they're zero
+                padded to T frames (None if they all have T frames). The last
+                valid vector of each sequence is then only replaced by the previous one.
+        """
+
+        batch_size, channels, length = quantized.size()
+        if length < 2:
+            return quantized
+
+        mask_size = (batch_size if self._independent_per_sample else 1, length)
+
+        """
+        Each latent vector is replace with either of its neighbors with a certain probability.
+        "We independently sample whether it is to be replaced with the token right after
+        or before it."
+        """
+        replace = torch.rand(mask_size, device=quantized.device, generator=self._generator) < self._probability
+        offsets = torch.where(torch.rand(mask_size, device=quantized.device, generator=self._generator) < 0.5, -1, 1)
+        offsets[:, 0] = 1 # The first vector can only be replaced by the next one
+        offsets[:, -1] = -1 # And the last one by the previous one
+        if lengths is not None:
+            lengths = lengths.view(-1, 1)
+            positions = torch.arange(length, device=quantized.device)
+            offsets = torch.where(positions == lengths - 1, -1, offsets)
+            replace = replace & (lengths > 1) # The sequences of one vector are unchanged
 
-    def forward(self, quantized):
-        original_quantized = quantized.detach().clone()
-        length = original_quantized.size(2)
-        for i in range(length):
-            """
-            Each latent vector is replace with either of its neighbors with a certain probability
-            (0.12 from the paper).
-            """
-            replace = [True, False][np.random.choice([1, 0], p=[self._probability, 1 - self._probability])]
-            if replace:
-                if i == 0:
-                    neighbor_index = i + 1
-                elif i == length - 1:
-                    neighbor_index = i - 1
-                else:
-                    """
-                    "We independently sample whether it is to
-                    be replaced with the token right after
-                    or before it."
-                    """
-                    neighbor_index = i + np.random.choice([-1, 1], p=[0.5, 0.5])
-                quantized[:, :, i] = original_quantized[:, :, neighbor_index]
+        indices = torch.arange(length, device=quantized.device) + replace * offsets
+        indices = indices.expand(batch_size, length).unsqueeze(1).expand(batch_size, channels, length)
 
-        return quantized
+        return torch.where(replace.unsqueeze(1), torch.gather(quantized.detach(), 2, indices), quantized)
@@ -0,0 +1,96 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+from modules.codebook_search import CodebookSearch
+
+import torch
+
+
+class KMeans(object):
+    """
+    Vectorized mini-batch k-means [Sculley, 2010] with k-means++ seeding
+    [Arthur and Vassilvitskii, 2007], used to initialize the codebooks
+    from encoded frames.
+    """
+
+    @staticmethod
+    def plus_plus_seeding(samples, num_clusters):
+        """
+        Args:
+            samples: Tensor of shape (N, D).
+            num_clusters: integer, number of centers to select.
+
+        Returns:
+            Tensor of shape (num_clusters, D) containing the initial centers.
+        """
+
+        centers = torch.empty(num_clusters, samples.size(1), dtype=samples.dtype, device=samples.device)
+        centers[0] = samples[torch.randint(samples.size(0), (1,), device=samples.device)]
+        min_distances = torch.sum((samples - centers[0])**2, dim=1)
+        for i in range(1, num_clusters):
+            # Sample the next center with a probability proportional to the squared distance to the nearest center
+            index = torch.multinomial(min_distances + 1e-12, 1)
+            centers[i] = samples[index]
+            min_distances = torch.minimum(min_distances, torch.sum((samples - centers[i])**2, dim=1))
+        return centers
+
+    @staticmethod
+    def fit(samples, num_clusters, iterations=100, batch_size=4096):
+        """
+        Args:
+            samples: Tensor of shape (N, D).
+            num_clusters: integer, number of clusters.
+            iterations: integer, number of mini-batch updates.
+            batch_size: integer, number of samples of each mini-batch.
+
+        Returns:
+            centers: Tensor of shape (num_clusters, D).
+            cluster_sizes: Tensor of shape (num_clusters) containing the
+                number of samples assigned to each center.
+        """
+
+        with torch.no_grad():
+            samples = samples.float()
+            codebook_search = CodebookSearch(tile_size=batch_size)
+            centers = KMeans.plus_plus_seeding(samples, num_clusters)
+            counts = torch.zeros(num_clusters, device=samples.device)
+
+            for _ in range(iterations):
+                batch = samples[torch.randint(samples.size(0), (min(batch_size, samples.size(0)),), device=samples.device)]
+                assignments, _ = codebook_search.search(batch, centers)
+                batch_counts = torch.bincount(assignments, minlength=num_clusters).float()
+                batch_sums = torch.zeros_like(centers).index_add_(0, assignments, batch)
+                counts += batch_counts
+
+                # Each center moves toward the mean of its batch samples, with a learning rate of 1 / its total count
+                learning_rates = torch.where(counts > 0, batch_counts / counts.clamp(min=1), torch.zeros_like(counts))
+                batch_means = batch_sums / batch_counts.clamp(min=1).unsqueeze(1)
+                centers += learning_rates.unsqueeze(1) * (batch_means - centers)
+
+            assignments, _ = codebook_search.search(samples, centers)
+            cluster_sizes = torch.bincount(assignments, minlength=num_clusters).float()
+
+        return centers, cluster_sizes
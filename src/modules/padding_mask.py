@@ -0,0 +1,115 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+import torch
+
+
+class PaddingMask(object):
+    """
+    Masks of the valid frames of a batch of sequences of different lengths,
+    zero padded to the length of the longest one.
+
+    Multiplying the activations by the mask after each layer keeps the
+    padding frames at zero, as the zero padding of a convolution applied
+    on a single sequence. So the valid frames of each sequence are the same
+    as if the sequence was processed alone.
+    """
+
+    @staticmethod
+    def from_lengths(lengths, size, dtype=torch.float32):
+        """
+        Args:
+            lengths: Tensor of B lengths.
+            size: Length of the padded sequences.
+
+        Returns:
+            Tensor of shape (B, 1, size), 1 for the valid frames and 0 for the padding ones.
+        """
+
+        positions = torch.arange(size, device=lengths.device)
+        return (positions.unsqueeze(0) < lengths.view(-1, 1)).to(dtype).unsqueeze(1)
+
+    @staticmethod
+    def apply(x, mask):
+        """
+        Returns:
+            x with its padding frames set to zero (x itself if mask is None).
+        """
+
+        return x if mask is None else x * mask
+
+    @staticmethod
+    def mean(values, mask):
+        """
+        Returns:
+            The mean of values over their valid elements (over all of them if mask is None).
+        """
+
+        if mask is None:
+            return torch.mean(values)
+
+        mask = mask.expand_as(values)
+        return torch.sum(values * mask) / torch.clamp(torch.sum(mask), min=1)
+
+    @staticmethod
+    def quantizer_masks(mask, channels, channels_first=False):
+        """
+        Masks of the inputs of the quantizers. In their legacy layout, the
+        inputs are permuted from (B, C, T) to (C, T, B) and flattened in rows
+        of C values, which aren't frames: a row can mix the valid and the
+        padding elements of different frames and batch elements, so the
+        padding can only be masked if the rows are aligned on the lengths
+        (as with a single sequence whose length is a multiple of C). In the
+        channels first layout, each row is a frame.
+
+        Args:
+            mask: Tensor of shape (B, 1, T), or None.
+            channels: Number of channels C of the inputs.
+            channels_first: If True, masks of the channels first layout.
+
+        Returns:
+            The mask of the elements of the (permuted) inputs, of shape (C, T, B),
+            or (B, 1, T) in the channels first layout, and the boolean mask of
+            the rows of the flattened inputs that only contain valid elements
+            (None, None if mask is None).
+
+        Raises:
+            ValueError: If a row of the legacy layout mixes valid and padding elements.
+        """
+
+        if mask is None:
+            return None, None
+
+        if channels_first:
+            return mask.float(), mask.reshape(-1).bool()
+
+        batch_size, _, time = mask.size()
+        element_mask = mask.float().expand(batch_size, channels, time).permute(1, 2, 0).contiguous()
+        rows = element_mask.view(-1, channels).bool()
+        valid_rows = rows.all(dim=1)
+        if not torch.equal(valid_rows, rows.any(dim=1)):
+            raise ValueError("The rows of the legacy VQ layout mix valid and padding elements, "
+                "the padding can only be masked with vq_layout: 'channels_first'")
+        return element_mask, valid_rows
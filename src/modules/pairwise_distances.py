@@ -0,0 +1,119 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import torch
+
+
+class PairwiseDistances(object):
+    """
+    Batched replacement of the itertools based euclidean distances
+    previously computed in the eval mode of the quantizers.
+    The pairs are computed by blocks of chunk_size rows with torch.cdist,
+    in order to bound the peak memory to chunk_size x N floats
+    (plus the output itself). The values are returned in the same
+    order as itertools.combinations() and itertools.product() would
+    generate them, so the shapes of the outputs are unchanged.
+    """
+
+    default_chunk_size = 1024
+
+    @staticmethod
+    def combinations(vectors, chunk_size=default_chunk_size):
+        """
+        Equivalent of [torch.dist(a, b, 2) for a, b in combinations(vectors, r=2)].
+
+        Args:
+            vectors: Tensor of shape (N, D).
+            chunk_size: number of rows processed at the same time.
+
+        Returns:
+            Tensor of shape (N * (N - 1) / 2) with the upper triangle of the
+            distance matrix in row-major order.
+        """
+
+        vectors = vectors.detach()
+        n = vectors.size(0)
+        if n < 2:
+            return vectors.new_zeros(0)
+
+        chunks = list()
+        for start in range(0, n - 1, chunk_size):
+            end = min(start + chunk_size, n - 1)
+            # Only the columns at the right of the chunk start are needed
+            distances = torch.cdist(vectors[start:end], vectors[start:])
+            rows = torch.arange(end - start, device=vectors.device).unsqueeze(1)
+            columns = torch.arange(n - start, device=vectors.device).unsqueeze(0)
+            chunks.append(distances[columns > rows])
+
+        return torch.cat(chunks)
+
+    @staticmethod
+    def product(vectors, other_vectors, chunk_size=default_chunk_size):
+        """
+        Equivalent of [torch.dist(a, b, 2) for a, b in product(vectors, other_vectors)].
+
+        Args:
+            vectors: Tensor of shape (N, D).
+            other_vectors: Tensor of shape (M, D).
+            chunk_size: number of rows of vectors processed at the same time.
+
+        Returns:
+            Tensor of shape (N, M).
+        """
+
+        vectors = vectors.detach()
+        other_vectors = other_vectors.detach()
+
+        return torch.cat([
+            torch.cdist(vectors[start:start + chunk_size], other_vectors)
+            for start in range(0, vectors.size(0), chunk_size)
+        ])
+
+    @staticmethod
+    def compute(flat_input, embedding_weight, batch_size, time, chunk_size=default_chunk_size):
+        """
+        Compute the three distances diagnostics of the quantizers.
+
+        Args:
+            flat_input: Tensor of shape (batch_size * time, embedding_dim)
+                containing the encoded audio frames.
+            embedding_weight: Tensor of shape (num_embeddings, embedding_dim).
+
+        Returns:
+            encoding_distances: Tensor of shape (batch_size, -1) containing the
+                distances between all the encoded frames pairs.
+            embedding_distances: Tensor containing the distances between all the
+                embedding vectors pairs.
+            frames_vs_embedding_distances: Tensor of shape (batch_size, time, num_embeddings)
+                containing the distances between each encoded frame and each embedding vector.
+        """
+
+        encoding_distances = PairwiseDistances.combinations(flat_input, chunk_size).view(batch_size, -1)
+        embedding_distances = PairwiseDistances.combinations(embedding_weight, chunk_size)
+        frames_vs_embedding_distances = PairwiseDistances.product(flat_input, embedding_weight,
+            chunk_size).view(batch_size, time, -1)
+
+        return encoding_distances, embedding_distances, frames_vs_embedding_distances
@@ -26,6 +26,7 @@
  #####################################################################################
 
 from modules.residual import Residual
+from modules.padding_mask import PaddingMask
 
 import torch.nn as nn
 import torch.nn.functional as F
@@ -40,7 +41,21 @@ class ResidualStack(nn.Module):
         self._layers = nn.ModuleList(
             [Residual(in_channels, num_hiddens, num_residual_hiddens, use_kaiming_normal)] * self._num_residual_layers)
         
+    @property
+    def layers(self):
+        return self._layers
+
     def forward(self, x):
+        return self.masked_forward(x, None)
+
+    def masked_forward(self, x, mask):
+        """
+        Args:
+            x: Tensor of shape (B, C, T).
+            mask: Tensor of shape (B, 1, T) of the valid frames (see PaddingMask),
+                to keep the padding frames at zero between the layers, or None.
+        """
+
         for i in range(self._num_residual_layers):
-            x = self._layers[i](x)
+            x = PaddingMask.apply(self._layers[i](x), mask)
         return F.relu(x)
@@ -0,0 +1,103 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import torch.nn as nn
+
+
+class SpeakerConditioning(nn.Module):
+    """
+    Learned speaker embeddings, folded into a convolution as a per-speaker bias.
+
+    Concatenating the embedding of the speaker, expanded over the T frames,
+    to the inputs of a convolution is the same as adding the convolution of
+    the constant embedding to the convolution of the inputs. Inside the
+    sequence, this speaker term is the same for every frame, so it's only
+    computed once and broadcasted. Only the padding frames at both edges
+    see part of the kernel, and they're computed separately.
+
+    Args:
+        num_speakers: Number of speakers.
+        embedding_dim: Dimension of the speaker embeddings.
+        out_channels: Output channels of the conditioned convolution.
+        kernel_size: Kernel size of the conditioned convolution (odd, with
+            a padding of kernel_size // 2).
+        use_kaiming_normal: If True, weight norm and kaiming normal
+            initialization of the speaker convolution.
+    """
+
+    def __init__(self, num_speakers, embedding_dim, out_channels, kernel_size=3, use_kaiming_normal=False):
+        super(SpeakerConditioning, self).__init__()
+
+        self._embedding = nn.Embedding(num_speakers, embedding_dim)
+        self._embedding.weight.data.normal_(0, 0.1)
+
+        self._padding = kernel_size // 2
+        self._conv = nn.Conv1d(
+            in_channels=embedding_dim,
+            out_channels=out_channels,
+            kernel_size=kernel_size,
+            padding=self._padding,
+            bias=False
+        )
+        if use_kaiming_normal:
+            self._conv = nn.utils.weight_norm(self._conv)
+            nn.init.kaiming_normal_(self._conv.weight)
+
+    def forward(self, x, speaker_id, mask=None):
+        """
+        Args:
+            x: Tensor of shape (B, out_channels, T), output of the conditioned convolution.
+            speaker_id: Tensor of B speaker indices.
+            mask: Tensor of shape (B, 1, T) of the valid frames of zero padded
+                inputs (see PaddingMask), or None. The right edge of each sequence
+                is then at its own length, so the speaker term is convolved over
+                the masked embeddings instead.
+
+        Returns:
+            x plus the speaker term, as if the speaker embeddings were
+            concatenated to the inputs of the convolution.
+        """
+
+        length = x.size(2)
+        embedding = self._embedding(speaker_id.view(-1).long()).unsqueeze(2)
+        if mask is not None:
+            return x + self._conv(embedding * mask)
+
+        # Speaker term of the left edge frames, of an inner frame and of the right edge frames
+        edges_length = min(length, 2 * self._padding + 1)
+        speaker_term = self._conv(embedding.expand(-1, -1, edges_length))
+        if length <= edges_length or self._padding == 0:
+            return x + speaker_term
+
+        inner_term = speaker_term[:, :, self._padding:self._padding + 1]
+        x = x + inner_term
+        x[:, :, :self._padding] += speaker_term[:, :, :self._padding] - inner_term
+        x[:, :, -self._padding:] += speaker_term[:, :, -self._padding:] - inner_term
+        return x
+
+    @property
+    def embedding(self):
+        return self._embedding
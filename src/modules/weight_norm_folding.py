@@ -0,0 +1,65 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import copy
+import torch.nn as nn
+
+
+class WeightNormFolding(object):
+    """
+    With use_kaiming_normal, the convolutions are wrapped in a weight norm,
+    which recomputes the weights g * v / ||v|| before each forward. At
+    inference, the weights are fixed, so the reparametrization can be
+    folded in plain weights.
+    """
+
+    @staticmethod
+    def fold(module):
+        """
+        Fold the weight norm of all the submodules of module, in place.
+
+        Returns:
+            The module.
+        """
+
+        for submodule in module.modules():
+            if hasattr(submodule, 'weight_g'):
+                nn.utils.remove_weight_norm(submodule)
+        return module
+
+    @staticmethod
+    def folded_copy(module):
+        """
+        Returns:
+            A deep copy of module, with its weight norms folded.
+        """
+
+        # The weights computed by the weight norm hooks aren't leaves, and can't be deep copied.
+        # They're copied detached, as the folding recomputes them from weight_g and weight_v
+        memo = {id(submodule.weight): submodule.weight.detach() for submodule in module.modules()
+            if hasattr(submodule, 'weight_g')}
+
+        return WeightNormFolding.fold(copy.deepcopy(module, memo))
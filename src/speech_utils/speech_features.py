@@ -24,7 +24,10 @@
  #   SOFTWARE.                                                                       #
  #####################################################################################
 
+from speech_utils.torch_speech_features import TorchSpeechFeatures
+
 import numpy as np
+import torch
 from python_speech_features.base import mfcc, logfbank
 from python_speech_features import delta
 
@@ -67,6 +70,54 @@ class SpeechFeatures(object):
         )
         return concatenated_features
 
+    @staticmethod
+    def torch_mfcc(signal, rate=default_rate, filters_number=default_filters_number, augmented=default_augmented):
+        return SpeechFeatures._torch_features(TorchSpeechFeatures.mfcc, [signal], rate, filters_number, augmented)[0]
+
+    @staticmethod
+    def torch_logfbank(signal, rate=default_rate, filters_number=default_filters_number, augmented=default_augmented):
+        return SpeechFeatures._torch_features(TorchSpeechFeatures.logfbank, [signal], rate, filters_number, augmented)[0]
+
     @staticmethod
     def features_from_name(name, signal, rate=default_rate, filters_number=default_filters_number, augmented=default_augmented):
         return getattr(SpeechFeatures, name)(signal, rate, filters_number, augmented)
+
+    @staticmethod
+    def batch_features_from_name(name, signals, rate=default_rate, filters_number=default_filters_number,
+        augmented=default_augmented):
+        """
+        Compute the features of a list of signals. With the torch implementations, the
+        signals of the same shape are computed in batches, otherwise one by one.
+
+        Returns:
+            list of the features of the signals.
+        """
+
+        if name not in ['torch_mfcc', 'torch_logfbank']:
+            return [SpeechFeatures.features_from_name(name, signal, rate, filters_number, augmented) for signal in signals]
+
+        features = TorchSpeechFeatures.mfcc if name == 'torch_mfcc' else TorchSpeechFeatures.logfbank
+        batches = dict()
+        for i, signal in enumerate(signals):
+            batches.setdefault(np.shape(signal), list()).append(i)
+
+        batch_features = [None] * len(signals)
+        for indices in batches.values():
+            computed_features = SpeechFeatures._torch_features(features, [signals[i] for i in indices], rate,
+                filters_number, augmented)
+            for i, signal_features in zip(indices, computed_features):
+                batch_features[i] = signal_features
+        return batch_features
+
+    @staticmethod
+    def _torch_features(features, signals, rate, filters_number, augmented):
+        """
+        Compute the features of signals of the same shape with a single call of
+        TorchSpeechFeatures, as python_speech_features would. Its pre-emphasis is
+        computed along the first axis of a signal, so it's a no-op on a signal
+        of a single row (as the (1, 1, T, 1) tensors of the features export).
+        """
+
+        preemphasis = TorchSpeechFeatures.default_preemphasis if np.shape(signals[0])[0] > 1 else 0
+        signals = torch.stack([torch.as_tensor(np.asarray(signal, dtype=np.float64)).reshape(-1) for signal in signals])
+        return features(signals, rate, filters_number, augmented, preemphasis=preemphasis).numpy()
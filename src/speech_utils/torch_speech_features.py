@@ -0,0 +1,233 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import torch
+import torch.nn.functional as F
+import numpy as np
+import functools
+import math
+
+
+class TorchSpeechFeatures(object):
+    """
+    Batched torch implementation of the MFCC and log filterbank features of
+    python_speech_features (with its default parameters: frames of 25 ms
+    every 10 ms, without window, FFT of 512 points, 0.97 pre-emphasis,
+    lifter of 22, and the log energy as first cepstral coefficient), and of
+    their deltas.
+
+    The waveforms of a batch have the same number of samples, so they have
+    the same number of frames. The mel filterbanks and the DCT matrices are
+    built once per parameters, and cached.
+    """
+
+    default_rate = 16000
+    default_filters_number = 13
+    default_augmented = True
+    default_mfcc_filters_number = 26
+    default_window_length = 0.025
+    default_window_step = 0.01
+    default_fft_size = 512
+    default_preemphasis = 0.97
+    default_lifter = 22
+    # Floor of the zero energies before the log, as python_speech_features
+    eps = np.finfo(float).eps
+
+    @staticmethod
+    def frames_number(samples_number, rate=default_rate, window_length=default_window_length,
+        window_step=default_window_step):
+
+        frame_length, frame_step = TorchSpeechFeatures._frame_sizes(rate, window_length, window_step)
+        if samples_number <= frame_length:
+            return 1
+        return 1 + int(math.ceil((samples_number - frame_length) / frame_step))
+
+    @staticmethod
+    def power_spectrum(signals, rate=default_rate, window_length=default_window_length,
+        window_step=default_window_step, fft_size=default_fft_size, preemphasis=default_preemphasis):
+        """
+        Args:
+            signals: Tensor of shape (B, T).
+
+        Returns:
+            Tensor of shape (B, frames, fft_size // 2 + 1) of the power spectrums of the frames.
+
+        Raises:
+            ValueError: if the frames are longer than fft_size samples.
+        """
+
+        if preemphasis:
+            signals = torch.cat([signals[:, :1], signals[:, 1:] - preemphasis * signals[:, :-1]], dim=1)
+
+        frame_length, frame_step = TorchSpeechFeatures._frame_sizes(rate, window_length, window_step)
+        if frame_length > fft_size:
+            # python_speech_features truncates the frames instead
+            raise ValueError('The frame length ({} samples) is greater than the FFT size ({})'.format(
+                frame_length, fft_size))
+        frames_number = TorchSpeechFeatures.frames_number(signals.size(1), rate, window_length, window_step)
+        # stft centers the window of frame_length samples in the fft_size samples of a frame. The power
+        # spectrum of a zero padded frame is invariant to a circular shift, so shifting the signal by the
+        # left padding of the window gives the spectrums of the frames starting every frame_step samples
+        window_padding = (fft_size - frame_length) // 2
+        padded_length = (frames_number - 1) * frame_step + fft_size
+        signals = F.pad(signals, (window_padding, padded_length - window_padding - signals.size(1)))
+        window = TorchSpeechFeatures._cached(TorchSpeechFeatures._rectangular_window, signals.device,
+            signals.dtype, frame_length)
+        spectrums = torch.stft(signals, n_fft=fft_size, hop_length=frame_step, win_length=frame_length,
+            window=window, center=False, return_complex=True)
+        return spectrums.abs().pow(2).div(fft_size).transpose(1, 2)
+
+    @staticmethod
+    def filterbank_energies(signals, rate=default_rate, filters_number=default_mfcc_filters_number,
+        fft_size=default_fft_size, preemphasis=default_preemphasis):
+        """
+        Returns:
+            (Tensor of shape (B, frames, filters_number) of the mel filterbank energies,
+            Tensor of shape (B, frames) of the total energies of the frames).
+        """
+
+        power_spectrums = TorchSpeechFeatures.power_spectrum(signals, rate, fft_size=fft_size, preemphasis=preemphasis)
+        filterbanks = TorchSpeechFeatures._cached(TorchSpeechFeatures._filterbanks, signals.device, signals.dtype,
+            filters_number, fft_size, rate)
+        energies = power_spectrums.sum(dim=2)
+        energies = energies.masked_fill(energies == 0, TorchSpeechFeatures.eps)
+        features = torch.matmul(power_spectrums, filterbanks)
+        features = features.masked_fill(features == 0, TorchSpeechFeatures.eps)
+        return features, energies
+
+    @staticmethod
+    def mfcc(signals, rate=default_rate, filters_number=default_filters_number, augmented=default_augmented,
+        preemphasis=default_preemphasis):
+        """
+        Args:
+            signals: Tensor of shape (B, T).
+            filters_number: Number of cepstral coefficients.
+            augmented: Concatenate the deltas and the delta-deltas of the coefficients.
+
+        Returns:
+            Tensor of shape (B, frames, filters_number), or (B, frames, 3 * filters_number) if augmented.
+        """
+
+        features, energies = TorchSpeechFeatures.filterbank_energies(signals, rate,
+            TorchSpeechFeatures.default_mfcc_filters_number, preemphasis=preemphasis)
+        dct = TorchSpeechFeatures._cached(TorchSpeechFeatures._dct, signals.device, signals.dtype,
+            TorchSpeechFeatures.default_mfcc_filters_number, filters_number, TorchSpeechFeatures.default_lifter)
+        mfcc_features = torch.matmul(features.log(), dct)
+        mfcc_features[:, :, 0] = energies.log()
+        return TorchSpeechFeatures._augment(mfcc_features) if augmented else mfcc_features
+
+    @staticmethod
+    def logfbank(signals, rate=default_rate, filters_number=default_filters_number, augmented=default_augmented,
+        preemphasis=default_preemphasis):
+        """
+        Args:
+            signals: Tensor of shape (B, T).
+            filters_number: Number of mel filters.
+            augmented: Concatenate the deltas and the delta-deltas of the log energies.
+
+        Returns:
+            Tensor of shape (B, frames, filters_number), or (B, frames, 3 * filters_number) if augmented.
+        """
+
+        features, _ = TorchSpeechFeatures.filterbank_energies(signals, rate, filters_number, preemphasis=preemphasis)
+        logfbank_features = features.log()
+        return TorchSpeechFeatures._augment(logfbank_features) if augmented else logfbank_features
+
+    @staticmethod
+    def delta(features, N=2):
+        """
+        Args:
+            features: Tensor of shape (B, frames, D).
+            N: Number of preceding and following frames of the regression.
+
+        Returns:
+            Tensor of shape (B, frames, D) of the deltas, with the edge frames repeated as python_speech_features.
+        """
+
+        frames_number = features.size(1)
+        padded = F.pad(features.transpose(1, 2), (N, N), mode='replicate')
+        delta_features = sum(n * (padded[:, :, N + n:N + n + frames_number] - padded[:, :, N - n:N - n + frames_number])
+            for n in range(1, N + 1))
+        return (delta_features / (2 * sum(n ** 2 for n in range(1, N + 1)))).transpose(1, 2)
+
+    @staticmethod
+    def _augment(features):
+        delta_features = TorchSpeechFeatures.delta(features, 2)
+        return torch.cat([features, delta_features, TorchSpeechFeatures.delta(delta_features, 2)], dim=2)
+
+    @staticmethod
+    def _frame_sizes(rate, window_length, window_step):
+        # Rounded half up, as python_speech_features
+        return int(math.floor(window_length * rate + 0.5)), int(math.floor(window_step * rate + 0.5))
+
+    @staticmethod
+    def _cached(build, device, dtype, *args):
+        return TorchSpeechFeatures._cached_float64(build, *args).to(device=device, dtype=dtype)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _cached_float64(build, *args):
+        return build(*args)
+
+    @staticmethod
+    def _rectangular_window(length):
+        return torch.ones(length, dtype=torch.float64)
+
+    @staticmethod
+    def _filterbanks(filters_number, fft_size, rate):
+        """
+        Returns:
+            Tensor of shape (fft_size // 2 + 1, filters_number) of the triangular mel filters
+            between 0 Hz and rate / 2, on the FFT bins of python_speech_features.
+        """
+
+        hz_to_mel = lambda hz: 2595 * np.log10(1 + hz / 700.)
+        mel_to_hz = lambda mel: 700 * (10 ** (mel / 2595.0) - 1)
+        mel_points = np.linspace(hz_to_mel(0), hz_to_mel(rate / 2), filters_number + 2)
+        bins = np.floor((fft_size + 1) * mel_to_hz(mel_points) / rate)
+
+        positions = np.arange(fft_size // 2 + 1).reshape(-1, 1)
+        left, center, right = bins[:-2], bins[1:-1], bins[2:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rising = np.where((positions >= left) & (positions < center), (positions - left) / (center - left), 0)
+            falling = np.where((positions >= center) & (positions < right), (right - positions) / (right - center), 0)
+        return torch.from_numpy(rising + falling)
+
+    @staticmethod
+    def _dct(filters_number, coefficients_number, lifter):
+        """
+        Returns:
+            Tensor of shape (filters_number, coefficients_number) of the orthonormal DCT-II
+            of the log energies, followed by the cepstral lifter.
+        """
+
+        n = np.arange(filters_number).reshape(-1, 1)
+        k = np.arange(coefficients_number).reshape(1, -1)
+        dct = np.cos(np.pi * k * (2 * n + 1) / (2 * filters_number)) * np.sqrt(2 / filters_number)
+        dct[:, 0] /= np.sqrt(2)
+        if lifter > 0:
+            dct *= 1 + (lifter / 2) * np.sin(np.pi * k / lifter)
+        return torch.from_numpy(dct)
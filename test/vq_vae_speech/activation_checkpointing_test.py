@@ -0,0 +1,78 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+
+import unittest
+import torch
+import yaml
+
+
+class ActivationCheckpointingTest(unittest.TestCase):
+
+    def _model(self, use_activation_checkpointing):
+        with open('..' + os.sep + '..' + os.sep + 'configurations' + os.sep + 'vctk_features.yaml', 'r') as configuration_file:
+            configuration = yaml.safe_load(configuration_file)
+        configuration.update({'num_hiddens': 64, 'residual_channels': 32, 'embedding_dim': 16,
+            'use_kaiming_normal': True, 'use_speaker_conditioning': True, 'use_jitter': False, 'vq_layout': 'channels_first',
+            'use_activation_checkpointing': use_activation_checkpointing})
+        torch.manual_seed(1234)
+        return ConvolutionalVQVAE(configuration, 'cpu').train()
+
+    def _gradients(self, model, inputs, speaker_id, lengths):
+        reconstructed_x, vq_output = model(inputs, None, speaker_id, lengths)
+        (vq_output.vq_loss + torch.mean(reconstructed_x ** 2)).backward()
+        return [parameter.grad for parameter in model.parameters() if parameter.grad is not None]
+
+    def test_same_gradients(self):
+        inputs = torch.randn(3, 40, 39)
+        speaker_id = torch.tensor([[3], [7], [11]])
+        for lengths in [None, torch.tensor([40, 27, 13])]:
+            expected = self._gradients(self._model(False), inputs, speaker_id, lengths)
+            gradients = self._gradients(self._model(True), inputs, speaker_id, lengths)
+            self.assertEqual(len(expected), len(gradients))
+            for gradient, expected_gradient in zip(gradients, expected):
+                self.assertTrue(torch.allclose(gradient, expected_gradient, atol=1e-6))
+
+    def test_fewer_saved_activations(self):
+        inputs = torch.randn(2, 40, 39)
+        speaker_id = torch.tensor([[3], [7]])
+        sizes = list()
+        for use_activation_checkpointing in [False, True]:
+            model = self._model(use_activation_checkpointing)
+            saved = list()
+            with torch.autograd.graph.saved_tensors_hooks(lambda tensor: saved.append(tensor.numel()) or tensor,
+                lambda tensor: tensor):
+                model(inputs, None, speaker_id)
+            sizes.append(sum(saved))
+        self.assertLess(sizes[1], sizes[0] / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.vector_quantizer_grouped import VectorQuantizerGrouped
+from modules.codebook_metrics import CodebookMetrics
+
+import unittest
+import numpy as np
+import torch
+
+
+class CodebookMetricsTest(unittest.TestCase):
+
+    def test_flushed_metrics_match_the_host_values(self):
+        torch.manual_seed(1234)
+        metrics = CodebookMetrics(8, flush_interval=3)
+        losses = [{'loss': torch.rand(()), 'commitment_loss': torch.rand(())} for _ in range(5)]
+        perplexities = [torch.rand(()) * 8 for _ in range(5)]
+        indices = [torch.randint(0, 6, (20,)) for _ in range(5)]
+
+        flushed_losses, flushed_perplexities = list(), list()
+        for step in range(5):
+            metrics.record_usage(torch.bincount(indices[step], minlength=8))
+            metrics.record(losses[step], perplexities[step])
+            self.assertEqual(step == 2, metrics.should_flush())
+            if metrics.should_flush():
+                step_losses, step_perplexities = metrics.flush()
+                flushed_losses += step_losses
+                flushed_perplexities += step_perplexities
+        step_losses, step_perplexities = metrics.flush()
+        flushed_losses += step_losses
+        flushed_perplexities += step_perplexities
+        self.assertEqual((list(), list()), metrics.flush())
+
+        for step in range(5):
+            self.assertAlmostEqual(losses[step]['loss'].item(), flushed_losses[step]['loss'], places=6)
+            self.assertAlmostEqual(losses[step]['commitment_loss'].item(), flushed_losses[step]['commitment_loss'], places=6)
+            self.assertAlmostEqual(perplexities[step].item(), flushed_perplexities[step], places=5)
+        self.assertAlmostEqual(perplexities[-1].item(), metrics.last['perplexity'], places=5)
+
+        summary = metrics.summary()
+        usage = np.bincount(torch.cat(indices).numpy(), minlength=8)
+        avg_probs = usage / usage.sum()
+        np.testing.assert_array_equal(usage, summary['usage'])
+        self.assertEqual(2, summary['dead_codes'])
+        self.assertAlmostEqual(np.exp(-np.sum(avg_probs * np.log(avg_probs + 1e-10))), summary['epoch_perplexity'], places=6)
+        self.assertAlmostEqual(np.mean([loss['loss'].item() for loss in losses]), summary['means']['loss'], places=6)
+        self.assertAlmostEqual(np.mean([perplexity.item() for perplexity in perplexities]), summary['means']['perplexity'], places=5)
+
+    def test_reset(self):
+        metrics = CodebookMetrics(4, flush_interval=10)
+        metrics.record_usage(torch.tensor([1, 2, 0, 3]))
+        metrics.record({'loss': torch.tensor(1.0)}, torch.tensor(2.0))
+        metrics.flush()
+        metrics.record({'loss': torch.tensor(3.0)}, torch.tensor(4.0))
+        metrics.reset()
+
+        summary = metrics.summary()
+        self.assertEqual(0, summary['usage'].sum())
+        self.assertEqual(4, summary['dead_codes'])
+        self.assertEqual(0.0, summary['epoch_perplexity'])
+        self.assertEqual(dict(), summary['means'])
+        self.assertFalse(metrics.should_flush())
+        self.assertEqual((list(), list()), metrics.flush())
+
+    def test_grouped_usage_is_recorded_once(self):
+        torch.manual_seed(1234)
+        vq = VectorQuantizerGrouped(8, 8, 0.25, 2, 'cpu').train()
+        output = vq(torch.randn(2, 8, 10))
+
+        group_indices = vq.split_indices(output.encoding_indices)
+        expected_usage = np.concatenate([np.bincount(group_indices[:, group].numpy(), minlength=8) for group in range(2)])
+        np.testing.assert_array_equal(expected_usage, vq.metrics.summary()['usage'])
+        for group, quantizer in enumerate(vq.quantizers):
+            np.testing.assert_array_equal(expected_usage[group * 8:(group + 1) * 8], quantizer.metrics.summary()['usage'])
+
+        vq.metrics.reset()
+        self.assertEqual(0, vq.metrics.summary()['usage'].sum())
+        self.assertTrue(all(quantizer.metrics.summary()['usage'].sum() == 0 for quantizer in vq.quantizers))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.vector_quantizer import VectorQuantizer
+from modules.codebook_search import CodebookSearch
+
+import unittest
+import torch
+
+
+class CodebookSearchTest(unittest.TestCase):
+
+    def _build(self, num_embeddings, tile_size, num_frames=4096, embedding_dim=64):
+        torch.manual_seed(1234)
+        vq = VectorQuantizer(num_embeddings, embedding_dim, 0.25, 'cpu',
+            codebook_search=CodebookSearch(tile_size=tile_size))
+        vq.embedding.weight.data.normal_()
+        # Frames around the codebook vectors, in the (B, C, T) layout flattened by the quantizer
+        flat_input = vq.embedding.weight.data[torch.randint(0, num_embeddings, (num_frames,))] \
+            + 0.3 * torch.randn(num_frames, embedding_dim)
+        inputs = flat_input.reshape(embedding_dim, num_frames, 1).permute(2, 0, 1).requires_grad_()
+        return vq, inputs
+
+    def test_bfloat16_autocast_index_agreement(self):
+        for num_embeddings in [44, 512]:
+            for tile_size in [None, 256]:
+                vq, inputs = self._build(num_embeddings, tile_size)
+                reference_indices = vq(inputs).encoding_indices
+
+                with torch.autocast('cpu', dtype=torch.bfloat16):
+                    vq_output = vq(inputs)
+
+                agreement = (vq_output.encoding_indices == reference_indices).float().mean().item()
+                self.assertGreater(agreement, 0.98, 'K={} tile_size={}'.format(num_embeddings, tile_size))
+
+                # The losses and the straight-through estimator stay in float32
+                self.assertEqual(vq_output.vq_loss.dtype, torch.float32)
+                self.assertEqual(vq_output.quantized.dtype, torch.float32)
+                (vq_output.vq_loss + vq_output.quantized.sum()).backward()
+                self.assertTrue(torch.isfinite(inputs.grad).all())
+
+    def test_float32_unchanged(self):
+        vq, inputs = self._build(512, 256)
+        flat_input = inputs.detach().permute(1, 2, 0).contiguous().view(-1, 64)
+        distances = torch.sum(flat_input**2, dim=1, keepdim=True) \
+            + torch.sum(vq.embedding.weight**2, dim=1) \
+            - 2 * torch.matmul(flat_input, vq.embedding.weight.t())
+        self.assertTrue(torch.equal(vq(inputs).encoding_indices.view(-1), torch.argmin(distances, dim=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.convolutional_encoder import ConvolutionalEncoder
+
+import unittest
+import torch
+
+
+class ConvolutionalEncoderStreamingTest(unittest.TestCase):
+
+    def _stream(self, encoder, inputs, chunk_size):
+        state = encoder.init_state()
+        outputs = list()
+        for start in range(0, inputs.size(2), chunk_size):
+            output, state = encoder.step(inputs[:, :, start:start + chunk_size], state)
+            outputs.append(output)
+        outputs.append(encoder.flush(state))
+        return torch.cat(outputs, dim=2)
+
+    def test_streamed_output_matches_offline_output(self):
+        for use_kaiming_normal in [False, True]:
+            torch.manual_seed(1234)
+            encoder = ConvolutionalEncoder(13, 32, 2, 16, use_kaiming_normal, 'mfcc', 13, 16000, 'cpu').eval()
+            for length in [1, 2, 5, 101]:
+                inputs = torch.randn(2, 13, length)
+                with torch.no_grad():
+                    expected = encoder(inputs)
+                    for chunk_size in [1, 2, 7, 160]:
+                        streamed = self._stream(encoder, inputs, chunk_size)
+                        self.assertEqual(streamed.shape, expected.shape)
+                        self.assertTrue(torch.allclose(streamed, expected, atol=1e-6),
+                            'length={} chunk_size={}'.format(length, chunk_size))
+
+    def test_memory_is_bounded(self):
+        torch.manual_seed(1234)
+        encoder = ConvolutionalEncoder(13, 32, 2, 16, False, 'mfcc', 13, 16000, 'cpu').eval()
+        state = encoder.init_state()
+        emitted = 0
+        with torch.no_grad():
+            for _ in range(100):
+                output, state = encoder.step(torch.randn(1, 13, 16), state)
+                emitted += output.size(2)
+        self.assertTrue(all(buffer.size(2) < 4 for buffer in state['buffers']))
+        self.assertLess(state['skip'].size(2), 4)
+        self.assertGreater(emitted, 790)
+
+
+if __name__ == '__main__':
+    unittest.main()
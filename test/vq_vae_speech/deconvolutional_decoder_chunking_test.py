@@ -0,0 +1,74 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.deconvolutional_decoder import DeconvolutionalDecoder
+
+import unittest
+import torch
+
+
+class DeconvolutionalDecoderChunkingTest(unittest.TestCase):
+
+    def _build(self, num_residual_layers, use_kaiming_normal=False):
+        torch.manual_seed(1234)
+        return DeconvolutionalDecoder(16, 13, 32, num_residual_layers, 16, use_kaiming_normal,
+            False, 0.12, False, 'cpu').eval()
+
+    def test_chunked_decoding_matches_whole_decoding(self):
+        for num_residual_layers in [1, 2, 3]:
+            for use_kaiming_normal in [False, True]:
+                decoder = self._build(num_residual_layers, use_kaiming_normal)
+                for length in [5, 37, 100]:
+                    inputs = torch.randn(2, 16, length)
+                    with torch.no_grad():
+                        expected = decoder(inputs, None, None)
+                        for window_size in [1, 4, 16]:
+                            for windows_per_batch in [1, 3]:
+                                decoded = decoder.decode_chunked(inputs, None, None, window_size, windows_per_batch)
+                                self.assertEqual(decoded.shape, expected.shape)
+                                self.assertTrue(torch.allclose(decoded, expected, atol=1e-6))
+
+    def test_crossfade_keeps_the_stitching_exact(self):
+        decoder = self._build(2)
+        inputs = torch.randn(1, 16, 100)
+        with torch.no_grad():
+            expected = decoder(inputs, None, None)
+            for crossfade in [1, 4, 7]:
+                decoded = decoder.decode_chunked(inputs, None, None, 8, crossfade=crossfade)
+                self.assertTrue(torch.allclose(decoded, expected, atol=1e-6))
+
+    def test_crossfade_larger_than_context(self):
+        decoder = self._build(2)
+        with self.assertRaises(ValueError):
+            decoder.decode_chunked(torch.randn(1, 16, 100), None, None, 8, crossfade=3, context=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
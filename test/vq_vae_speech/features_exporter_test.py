@@ -0,0 +1,170 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from dataset.features_exporter import FeaturesExporter
+from dataset.features_store import FeaturesStoreWriter, FeaturesStore
+from dataset.vctk_features_dataset import VCTKFeaturesDataset
+from speech_utils.speech_features import SpeechFeatures
+
+from torch.utils.data import Dataset
+import unittest
+import numpy as np
+import pickle
+import random
+import shutil
+import tempfile
+
+
+class SpeechDataset(Dataset):
+    """
+    Items in the format of VCTKDataset, the item 2 being too short for the target features shape.
+    """
+
+    def __len__(self):
+        return 5
+
+    def __getitem__(self, index):
+        length = 4000 if index == 2 else 7681
+        start_trimming = random.randint(0, 100)
+        audio = np.random.RandomState(index).randn(length + 100).astype(np.float32)[start_trimming:start_trimming + length]
+        return audio.reshape(1, length, 1), np.zeros((256, length - 1, 1), dtype=np.float32), np.array(index % 2), \
+            np.zeros((length - 1, 1)), 'p225_00{}.wav'.format(index), 16000, 0.1, start_trimming, length - 1, 20
+
+
+class FailingSpeechDataset(SpeechDataset):
+    """
+    SpeechDataset whose item 3 can't be loaded.
+    """
+
+    def __getitem__(self, index):
+        if index == 3:
+            raise OSError('Unreadable item {}'.format(index))
+        return super(FailingSpeechDataset, self).__getitem__(index)
+
+
+class FeaturesExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        # The logs of the failed items aren't written in the log directory of the repository
+        self._log_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._log_path)
+
+    def _exporter(self, output_dir, writer=None, dataset=None, features_name='mfcc', batch_size=1):
+        return FeaturesExporter(SpeechDataset() if dataset is None else dataset, output_dir, features_name, features_name,
+            16000, 13, 13, (47, 39), True, False, writer=writer, workers_number=2, window=3, batch_size=batch_size,
+            log_path=self._log_path)
+
+    def test_exported_features_match_serial_computation(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            counts = self._exporter(output_dir).export()
+            self.assertEqual({'saved': 4, 'invalid': 1, 'failed': 0, 'skipped': 0}, counts)
+            self.assertEqual(['0.pickle', '1.pickle', '3.pickle', '4.pickle', FeaturesExporter.MANIFEST_FILENAME],
+                sorted(os.listdir(output_dir)))
+
+            for index in [0, 1, 3, 4]:
+                with open(output_dir + os.sep + str(index) + '.pickle', 'rb') as file:
+                    output = pickle.load(file)
+                random.seed(index)
+                audio = SpeechDataset()[index][0]
+                np.testing.assert_array_equal(audio, output['preprocessed_audio'][0].numpy())
+                np.testing.assert_allclose(SpeechFeatures.mfcc(audio, 16000, 13), output['input_features'])
+                np.testing.assert_allclose(output['input_features'], output['output_features'])
+                self.assertEqual(('p225_00{}.wav'.format(index),), output['wav_filename'])
+                self.assertEqual((1,), tuple(output['speaker_id'].shape))
+
+    def test_features_dataset_skips_the_unsaved_items(self):
+        with tempfile.TemporaryDirectory() as vctk_path:
+            output_dir = vctk_path + os.sep + 'features' + os.sep + 'train'
+            os.makedirs(output_dir)
+            self._exporter(output_dir).export()
+
+            # The invalid item 2 leaves a hole in the numbering of the files
+            dataset = VCTKFeaturesDataset(vctk_path, 'train')
+            self.assertEqual(4, len(dataset))
+            self.assertEqual(['p225_000.wav', 'p225_001.wav', 'p225_003.wav', 'p225_004.wav'],
+                [dataset[i]['wav_filename'][0] for i in range(len(dataset))])
+
+    def test_failed_items_are_logged_and_exported_again(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            counts = self._exporter(output_dir, dataset=FailingSpeechDataset()).export()
+            self.assertEqual({'saved': 3, 'invalid': 1, 'failed': 1, 'skipped': 0}, counts)
+            for handler in self._exporter(output_dir).logger.handlers:
+                handler.flush()
+            with open(self._log_path + os.sep + 'dataset.features_exporter.log', 'r') as log_file:
+                self.assertIn('Unreadable item 3', log_file.read())
+
+            self.assertEqual({'saved': 1, 'invalid': 0, 'failed': 0, 'skipped': 4}, self._exporter(output_dir).export())
+
+    def test_batched_torch_features_match_serial_computation(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            # The batches mix items of different lengths, and an item that can't be loaded
+            counts = self._exporter(output_dir, dataset=FailingSpeechDataset(), features_name='torch_mfcc',
+                batch_size=3).export()
+            self.assertEqual({'saved': 3, 'invalid': 1, 'failed': 1, 'skipped': 0}, counts)
+
+            for index in [0, 1, 4]:
+                with open(output_dir + os.sep + str(index) + '.pickle', 'rb') as file:
+                    output = pickle.load(file)
+                np.testing.assert_allclose(SpeechFeatures.torch_mfcc(output['preprocessed_audio'], 16000, 13),
+                    output['input_features'], rtol=1e-9, atol=1e-9)
+                np.testing.assert_allclose(SpeechFeatures.mfcc(output['preprocessed_audio'], 16000, 13),
+                    output['input_features'], rtol=1e-9, atol=1e-9)
+
+    def test_rerun_only_exports_the_items_missing_from_the_manifest(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            exporter = self._exporter(output_dir)
+            exporter.export()
+            self.assertEqual({'saved': 0, 'invalid': 0, 'failed': 0, 'skipped': 5}, exporter.export())
+
+            with open(exporter.manifest_path, 'r') as file:
+                lines = [line for line in file if not line.startswith('3 ')]
+            with open(exporter.manifest_path, 'w') as file:
+                file.writelines(lines + ['4'])
+            self.assertEqual({'saved': 1, 'invalid': 0, 'failed': 0, 'skipped': 4}, exporter.export())
+
+    def test_export_to_a_store(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            store_path = output_dir + os.sep + 'train.memmap'
+            with FeaturesStoreWriter(store_path) as writer:
+                self.assertEqual(4, self._exporter(output_dir, writer).export()['saved'])
+            self.assertNotIn('0.pickle', os.listdir(output_dir))
+
+            store = FeaturesStore(store_path)
+            self.assertEqual([0, 1, 3, 4], sorted(store.keys))
+            with open(output_dir + os.sep + FeaturesExporter.MANIFEST_FILENAME, 'a') as file:
+                file.write('0 saved\n')
+            with FeaturesStoreWriter(store_path) as writer:
+                self.assertEqual(5, self._exporter(output_dir, writer).export()['skipped'])
+
+
+if __name__ == '__main__':
+    unittest.main()
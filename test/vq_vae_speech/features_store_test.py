@@ -0,0 +1,154 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from dataset.features_store import FeaturesStoreWriter, FeaturesStore
+from dataset.vctk_features_dataset import VCTKFeaturesDataset
+from dataset.vctk_features_memmap_dataset import VCTKFeaturesMemmapDataset
+from dataset.vctk_features_stream import VCTKFeaturesStream
+
+import unittest
+import numpy as np
+import pickle
+import tempfile
+import torch
+
+
+class FeaturesStoreTest(unittest.TestCase):
+
+    def _items(self, number):
+        rng = np.random.RandomState(1234)
+        return [{
+            'preprocessed_audio': rng.randn(1, 100 + i).astype(np.float32),
+            'wav_filename': ['p{}_00{}.wav'.format(225 + i, i)],
+            'input_features': rng.randn(1, 47, 39),
+            'output_features': rng.randn(1, 47, 39),
+            'one_hot': np.array([]),
+            'quantized': np.array([]),
+            'speaker_id': torch.tensor([i]),
+            'shifting_time': 0.5,
+            'top_db': 20
+        } for i in range(number)]
+
+    def _export_pickles(self, path, subset, items):
+        os.makedirs(path + os.sep + subset)
+        for i, item in enumerate(items):
+            with open(path + os.sep + subset + os.sep + str(i) + '.pickle', 'wb') as file:
+                pickle.dump(item, file)
+
+    def test_items_are_restored(self):
+        items = self._items(3)
+        with tempfile.TemporaryDirectory() as path:
+            with FeaturesStoreWriter(path) as writer:
+                for i, item in enumerate(items):
+                    writer.write(i, item)
+
+            store = FeaturesStore(path)
+            self.assertEqual(3, len(store))
+            for item, stored_item in zip(items, [store[i] for i in range(3)]):
+                self.assertEqual(set(item.keys()), set(stored_item.keys()))
+                for key in ['preprocessed_audio', 'input_features', 'output_features', 'one_hot']:
+                    self.assertEqual(item[key].dtype, stored_item[key].dtype)
+                    np.testing.assert_array_equal(item[key], stored_item[key])
+                np.testing.assert_array_equal(item['speaker_id'].numpy(), stored_item['speaker_id'])
+                for key in ['wav_filename', 'shifting_time', 'top_db']:
+                    self.assertEqual(item[key], stored_item[key])
+
+    def test_items_are_views_of_the_mapped_files(self):
+        with tempfile.TemporaryDirectory() as path:
+            with FeaturesStoreWriter(path) as writer:
+                for i, item in enumerate(self._items(2)):
+                    writer.write(i, item)
+
+            item = FeaturesStore(path)[1]
+            self.assertIsInstance(item['input_features'].base, np.memmap)
+            # Writable views, which never modify the store
+            item['input_features'][:] = 0
+            self.assertNotEqual(0, np.abs(FeaturesStore(path)[1]['input_features']).sum())
+
+    def test_interrupted_writer_is_resumed(self):
+        items = self._items(4)
+        with tempfile.TemporaryDirectory() as path:
+            with FeaturesStoreWriter(path) as writer:
+                writer.write(0, items[0])
+            writer = FeaturesStoreWriter(path)
+            writer.write(1, items[1])
+            writer._files['input_features'].flush()
+            # Interrupted before its index is written: the item 1 is dropped
+
+            with FeaturesStoreWriter(path) as writer:
+                self.assertIn(0, writer)
+                self.assertNotIn(1, writer)
+                for i in range(1, 4):
+                    writer.write(i, items[i])
+
+            store = FeaturesStore(path)
+            self.assertEqual([0, 1, 2, 3], store.keys)
+            for i in range(4):
+                np.testing.assert_array_equal(items[i]['input_features'], store[i]['input_features'])
+
+    def test_memmap_dataset_matches_pickle_dataset(self):
+        items = self._items(3)
+        normalizer = {'train_mean': np.full(39, 0.5), 'train_std': np.full(39, 2.0)}
+        with tempfile.TemporaryDirectory() as path:
+            self._export_pickles(path + os.sep + 'features', 'train', items)
+            self.assertEqual(3, FeaturesStoreWriter.convert(path + os.sep + 'features' + os.sep + 'train',
+                VCTKFeaturesMemmapDataset.store_path(path, 'train')))
+
+            pickle_dataset = VCTKFeaturesDataset(path, 'train', normalizer)
+            memmap_dataset = VCTKFeaturesMemmapDataset(path, 'train', normalizer)
+            self.assertEqual(len(pickle_dataset), len(memmap_dataset))
+
+            pickle_batch = VCTKFeaturesStream.pad_collate([pickle_dataset[i] for i in range(3)])
+            memmap_batch = VCTKFeaturesStream.pad_collate([memmap_dataset[i] for i in range(3)])
+            self.assertEqual(set(pickle_batch.keys()), set(memmap_batch.keys()))
+            for key in ['preprocessed_audio', 'input_features', 'output_features', 'speaker_id', 'index']:
+                self.assertTrue(torch.equal(pickle_batch[key], memmap_batch[key]))
+            self.assertEqual(pickle_batch['wav_filename'], memmap_batch['wav_filename'])
+
+    def test_unrequested_fields_are_neither_read_nor_collated(self):
+        items = self._items(3)
+        fields = ['input_features', 'output_features', 'speaker_id']
+        with tempfile.TemporaryDirectory() as path:
+            self._export_pickles(path + os.sep + 'features', 'train', items)
+            FeaturesStoreWriter.convert(path + os.sep + 'features' + os.sep + 'train',
+                VCTKFeaturesMemmapDataset.store_path(path, 'train'))
+
+            for dataset in [VCTKFeaturesDataset(path, 'train'), VCTKFeaturesMemmapDataset(path, 'train')]:
+                dataset.fields = fields
+                batch = VCTKFeaturesStream.pad_collate([dataset[i] for i in range(3)])
+                self.assertEqual(set(fields + ['index', 'features_lengths']), set(batch.keys()))
+                np.testing.assert_array_equal(items[2]['input_features'], batch['input_features'][2].numpy())
+
+            # Only the requested field files are mapped
+            self.assertEqual(set(fields), set(dataset._store._arrays.keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from modules.codebook_search import CodebookSearch, InvertedFileCodebookSearch
+
+import unittest
+import torch
+
+
+class InvertedFileCodebookSearchTest(unittest.TestCase):
+
+    def _codebook(self, num_embeddings=1024, embedding_dim=16, num_frames=2048):
+        torch.manual_seed(1234)
+        weight = torch.randn(num_embeddings, embedding_dim)
+        # Frames around the codebook vectors
+        flat_input = weight[torch.randint(0, num_embeddings, (num_frames,))] + 0.1 * torch.randn(num_frames, embedding_dim)
+        return weight, flat_input
+
+    def test_recall_at_1(self):
+        weight, flat_input = self._codebook()
+        exact_indices, _ = CodebookSearch().search(flat_input, weight)
+
+        codebook_search = InvertedFileCodebookSearch(num_lists=32, num_probes=4)
+        approximate_indices, _ = codebook_search.search(flat_input, weight)
+        recall = codebook_search.recall_at_1(flat_input, weight)
+        self.assertEqual(recall, (approximate_indices == exact_indices).float().mean().item())
+        self.assertGreater(recall, 0.9)
+        self.assertLess(recall, 1.0)
+
+        # Probing all the lists is an exhaustive search
+        self.assertEqual(InvertedFileCodebookSearch(num_lists=32, num_probes=32).recall_at_1(flat_input, weight), 1.0)
+
+    def test_rebuild_after_codebook_modifications(self):
+        weight, flat_input = self._codebook()
+        codebook_search = InvertedFileCodebookSearch(num_lists=32, num_probes=4, rebuild_interval=2)
+        codebook_search.search(flat_input, weight)
+        centroids = codebook_search._centroids
+
+        # Searching again with the same codebook doesn't count as a modification
+        codebook_search.search(flat_input, weight)
+        weight.mul_(-1)
+        codebook_search.search(flat_input, weight)
+        self.assertIs(codebook_search._centroids, centroids)
+
+        # The partition is rebuilt after rebuild_interval in-place modifications (detected by the version counter)
+        weight.mul_(-1)
+        codebook_search.search(flat_input, weight)
+        self.assertIsNot(codebook_search._centroids, centroids)
+
+        # A modification through .data isn't detected without invalidate()
+        centroids = codebook_search._centroids
+        weight.data.mul_(-1)
+        weight.data.mul_(-1)
+        codebook_search.search(flat_input, weight)
+        self.assertIs(codebook_search._centroids, centroids)
+        codebook_search.invalidate()
+        codebook_search.search(flat_input, weight)
+        self.assertIsNot(codebook_search._centroids, centroids)
+
+        # A new codebook tensor is a modification too
+        codebook_search.search(flat_input, weight.clone())
+        self.assertEqual(codebook_search._modifications_since_rebuild, 1)
+
+    def test_from_configuration(self):
+        codebook_search = CodebookSearch.from_configuration({'codebook_search': 'inverted_file',
+            'codebook_search_num_lists': 16, 'codebook_search_num_probes': 2, 'codebook_search_rebuild_interval': 10})
+        self.assertIsInstance(codebook_search, InvertedFileCodebookSearch)
+        self.assertEqual((codebook_search.num_lists, codebook_search.num_probes), (16, 2))
+        self.assertEqual(codebook_search._rebuild_interval, 10)
+        self.assertNotIsInstance(CodebookSearch.from_configuration({}), InvertedFileCodebookSearch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from modules.jitter import Jitter
+
+import unittest
+import torch
+
+
+class JitterTest(unittest.TestCase):
+
+    def _replaced(self, inputs, outputs):
+        # (B, T) mask of the replaced latent vectors
+        return (outputs != inputs).any(dim=1)
+
+    def test_vectors_are_replaced_by_their_neighbors(self):
+        inputs = torch.randn(4, 8, 1000)
+        outputs = Jitter(0.12, generator=torch.Generator().manual_seed(1234))(inputs)
+
+        from_previous = (outputs[:, :, 1:] == inputs[:, :, :-1]).all(dim=1)
+        from_next = (outputs[:, :, :-1] == inputs[:, :, 1:]).all(dim=1)
+        unchanged = (outputs == inputs).all(dim=1)
+        self.assertTrue(unchanged[:, 0].logical_or(from_next[:, 0]).all())
+        self.assertTrue(unchanged[:, -1].logical_or(from_previous[:, -1]).all())
+        self.assertTrue(unchanged[:, 1:-1].logical_or(from_previous[:, :-1]).logical_or(from_next[:, 1:]).all())
+
+        replaced_rate = self._replaced(inputs, outputs).float().mean().item()
+        self.assertAlmostEqual(replaced_rate, 0.12, delta=0.02)
+
+    def test_masks_per_sample(self):
+        inputs = torch.randn(2, 8, 1000)
+        independent = self._replaced(inputs, Jitter(0.12, independent_per_sample=True)(inputs))
+        shared = self._replaced(inputs, Jitter(0.12, independent_per_sample=False)(inputs))
+        self.assertFalse(torch.equal(independent[0], independent[1]))
+        self.assertTrue(torch.equal(shared[0], shared[1]))
+
+    def test_generator_reproducibility(self):
+        inputs = torch.randn(2, 8, 100)
+        outputs = [Jitter(0.5, generator=torch.Generator().manual_seed(1234))(inputs) for _ in range(2)]
+        self.assertTrue(torch.equal(outputs[0], outputs[1]))
+
+    def test_padding_is_never_used(self):
+        lengths = torch.tensor([1000, 10, 1])
+        inputs = torch.randn(3, 8, 1000) * (torch.arange(1000) < lengths.view(-1, 1)).unsqueeze(1)
+        outputs = Jitter(0.5, generator=torch.Generator().manual_seed(1234))(inputs, lengths)
+        for b, length in enumerate(lengths.tolist()):
+            self.assertTrue((outputs[b, :, :length] != 0).all())
+        self.assertTrue(torch.equal(outputs[2, :, 0], inputs[2, :, 0]))
+
+    def test_masks_are_shared_by_default(self):
+        inputs = torch.randn(2, 8, 1000)
+        replaced = self._replaced(inputs, Jitter(0.12)(inputs))
+        self.assertTrue(replaced.any())
+        self.assertTrue(torch.equal(replaced[0], replaced[1]))
+
+    def test_replaced_vectors_have_no_gradient(self):
+        # As the copy of a detached clone: neither the replaced vector nor its neighbor get its gradient
+        inputs = torch.randn(2, 8, 100, requires_grad=True)
+        outputs = Jitter(0.5, independent_per_sample=True)(inputs)
+        outputs.sum().backward()
+
+        replaced = self._replaced(inputs, outputs).unsqueeze(1).expand_as(inputs)
+        self.assertTrue(replaced.any())
+        self.assertTrue(torch.equal(inputs.grad, (~replaced).float()))
+
+
+if __name__ == '__main__':
+    unittest.main()
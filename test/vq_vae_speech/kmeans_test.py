@@ -0,0 +1,107 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from experiments.convolutional_trainer import ConvolutionalTrainer
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from models.vector_quantizer_ema import VectorQuantizerEMA
+from modules.kmeans import KMeans
+
+import unittest
+import tempfile
+import torch
+import yaml
+
+
+class FakeDataStream(object):
+
+    def __init__(self, batches):
+        self.training_loader = batches
+        self.speaker_dic = dict()
+
+
+class KMeansTest(unittest.TestCase):
+
+    def _clusters(self, size):
+        # Well separated clusters, around the corners of a square
+        means = torch.tensor([[-10.0, -10.0], [-10.0, 10.0], [10.0, -10.0], [10.0, 10.0]])
+        samples = torch.cat([mean + 0.5 * torch.randn(size, 2) for mean in means])
+        return means, samples
+
+    def _nearest_means(self, centers, means):
+        return torch.argmin(torch.cdist(centers, means), dim=1)
+
+    def test_plus_plus_seeding(self):
+        torch.manual_seed(1234)
+        means, samples = self._clusters(250)
+        centers = KMeans.plus_plus_seeding(samples, 4)
+
+        # The centers are samples, one per cluster
+        self.assertEqual(centers.size(), (4, 2))
+        for center in centers:
+            self.assertTrue((samples == center).all(dim=1).any())
+        self.assertEqual(sorted(self._nearest_means(centers, means).tolist()), [0, 1, 2, 3])
+
+    def test_fit(self):
+        torch.manual_seed(1234)
+        means, samples = self._clusters(250)
+        centers, cluster_sizes = KMeans.fit(samples, 4, iterations=20, batch_size=256)
+
+        nearest_means = self._nearest_means(centers, means)
+        self.assertEqual(sorted(nearest_means.tolist()), [0, 1, 2, 3])
+        self.assertTrue(torch.allclose(centers, means[nearest_means], atol=0.2))
+        self.assertTrue(torch.equal(cluster_sizes, torch.full((4,), 250.0)))
+
+    def test_initialize_loads_the_ema_statistics(self):
+        with open('..' + os.sep + '..' + os.sep + 'configurations' + os.sep + 'vctk_features.yaml', 'r') as configuration_file:
+            configuration = yaml.safe_load(configuration_file)
+        configuration.update({'num_hiddens': 64, 'residual_channels': 32, 'embedding_dim': 16, 'use_kaiming_normal': True,
+            'decay': 0.99, 'codebook_initialization': 'kmeans', 'codebook_initialization_batches': 3,
+            'codebook_initialization_iterations': 10})
+
+        torch.manual_seed(1234)
+        model = ConvolutionalVQVAE(configuration, 'cpu')
+        vq = model.vq
+        self.assertIsInstance(vq, VectorQuantizerEMA)
+        batches = [{'input_features': torch.randn(2, 40, 39)} for _ in range(4)]
+        weight = vq.embedding.weight.clone()
+        with tempfile.TemporaryDirectory() as experiments_path:
+            ConvolutionalTrainer('cpu', FakeDataStream(batches), configuration, experiments_path, 'test',
+                model=model).initialize()
+
+        # The cluster sizes are the expected number of flattened frames per batch
+        with torch.no_grad():
+            z = model.pre_vq_conv(model.encoder(batches[0]['input_features'].permute(0, 2, 1).contiguous()))
+        self.assertAlmostEqual(vq._ema_cluster_size.sum().item(), z.numel() / 16, places=3)
+        self.assertFalse(torch.equal(vq.embedding.weight, weight))
+        self.assertTrue(torch.allclose(vq._ema_w, vq.embedding.weight * vq._ema_cluster_size.unsqueeze(1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
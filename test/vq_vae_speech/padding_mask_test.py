@@ -0,0 +1,157 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from models.vector_quantizer import VectorQuantizer
+from models.vector_quantizer_ema import VectorQuantizerEMA
+from modules.padding_mask import PaddingMask
+from dataset.vctk_features_stream import VCTKFeaturesStream
+
+import unittest
+import numpy as np
+import torch
+import yaml
+
+
+class PaddingMaskTest(unittest.TestCase):
+
+    def _configuration(self):
+        with open('..' + os.sep + '..' + os.sep + 'configurations' + os.sep + 'vctk_features.yaml', 'r') as configuration_file:
+            configuration = yaml.safe_load(configuration_file)
+        configuration.update({'num_hiddens': 64, 'residual_channels': 32, 'embedding_dim': 16,
+            'use_kaiming_normal': True, 'use_speaker_conditioning': True, 'vq_layout': 'channels_first'})
+        return configuration
+
+    def _model(self):
+        torch.manual_seed(1234)
+        return ConvolutionalVQVAE(self._configuration(), 'cpu').eval()
+
+    def test_padded_encoding_and_decoding_match_unpadded(self):
+        model = self._model()
+        lengths = torch.tensor([40, 27, 1])
+        inputs = torch.randn(3, model.encoder.features_filters, 40)
+        latents = torch.randn(3, 16, 21)
+        speaker_id = torch.tensor([[3], [7], [11]])
+
+        with torch.no_grad():
+            encoded = model.encoder(inputs, lengths)
+            decoded = model.decoder(latents, None, speaker_id, model.encoder.output_lengths(lengths))
+            for b, length in enumerate(lengths.tolist()):
+                latent_length = model.encoder.output_lengths(length)
+                expected = model.encoder(inputs[b:b + 1, :, :length])
+                self.assertTrue(torch.allclose(encoded[b:b + 1, :, :latent_length], expected, atol=1e-5))
+                self.assertEqual(0, torch.count_nonzero(encoded[b, :, latent_length:]).item())
+
+                output_length = model.decoder.output_lengths(latent_length)
+                expected = model.decoder(latents[b:b + 1, :, :latent_length], None, speaker_id[b:b + 1])
+                self.assertTrue(torch.allclose(decoded[b:b + 1, :, :output_length], expected, atol=1e-5))
+                self.assertEqual(0, torch.count_nonzero(decoded[b, :, output_length:]).item())
+
+    def test_model_reconstructs_inputs_length(self):
+        model = self._model()
+        lengths = torch.tensor([30, 17])
+        with torch.no_grad():
+            reconstructed, _ = model(torch.randn(2, 30, model.encoder.features_filters), None,
+                torch.tensor([[3], [7]]), lengths)
+
+        self.assertEqual(30, reconstructed.size(2))
+        self.assertEqual(0, torch.count_nonzero(reconstructed[1, :, 17:]).item())
+
+    def test_quantizers_ignore_padding(self):
+        # Rows of the flattened inputs are aligned on the length, so they're either valid or padding
+        for quantizer_class in [VectorQuantizer, VectorQuantizerEMA]:
+            torch.manual_seed(1234)
+            arguments = (32, 16, 0.25, 0.99, 'cpu') if quantizer_class == VectorQuantizerEMA else (32, 16, 0.25, 'cpu')
+            quantizer = quantizer_class(*arguments)
+            padded_quantizer = quantizer_class(*arguments)
+            padded_quantizer.load_state_dict(quantizer.state_dict())
+
+            inputs = torch.randn(1, 16, 32)
+            padded_inputs = torch.cat([inputs, 100 * torch.randn(1, 16, 32)], dim=2)
+            output = quantizer(inputs)
+            padded_output = padded_quantizer(padded_inputs, PaddingMask.from_lengths(torch.tensor([32]), 64))
+
+            self.assertTrue(torch.allclose(padded_output.vq_loss, output.vq_loss))
+            self.assertTrue(torch.allclose(padded_output.perplexity, output.perplexity))
+            self.assertTrue(torch.allclose(padded_output.quantized[:, :, :32], output.quantized))
+            self.assertEqual(0, torch.count_nonzero(padded_output.quantized[:, :, 32:]).item())
+            self.assertTrue(torch.equal(padded_quantizer.metrics._usage, quantizer.metrics._usage))
+            for name, buffer in quantizer.state_dict().items():
+                self.assertTrue(torch.allclose(padded_quantizer.state_dict()[name], buffer, atol=1e-6), name)
+
+    def test_channels_first_quantizers_ignore_padding_of_batches(self):
+        # Each row is a frame, so the padding is masked whatever the batch size and the lengths
+        for quantizer_class in [VectorQuantizer, VectorQuantizerEMA]:
+            torch.manual_seed(1234)
+            arguments = (32, 16, 0.25, 0.99, 'cpu') if quantizer_class == VectorQuantizerEMA else (32, 16, 0.25, 'cpu')
+            quantizer = quantizer_class(*arguments, channels_first=True)
+            padded_quantizer = quantizer_class(*arguments, channels_first=True)
+            padded_quantizer.load_state_dict(quantizer.state_dict())
+
+            lengths = torch.tensor([32, 19])
+            padded_inputs = torch.randn(2, 16, 32)
+            padded_inputs[1, :, 19:] = 100
+            inputs = torch.cat([padded_inputs[0], padded_inputs[1, :, :19]], dim=1).unsqueeze(0)
+            output = quantizer(inputs)
+            padded_output = padded_quantizer(padded_inputs, PaddingMask.from_lengths(lengths, 32))
+
+            self.assertTrue(torch.allclose(padded_output.vq_loss, output.vq_loss))
+            self.assertTrue(torch.allclose(padded_output.perplexity, output.perplexity))
+            self.assertTrue(torch.allclose(padded_output.quantized[0], output.quantized[0, :, :32]))
+            self.assertTrue(torch.allclose(padded_output.quantized[1, :, :19], output.quantized[0, :, 32:]))
+            self.assertEqual(0, torch.count_nonzero(padded_output.quantized[1, :, 19:]).item())
+            self.assertTrue(torch.equal(padded_quantizer.metrics._usage, quantizer.metrics._usage))
+            for name, buffer in quantizer.state_dict().items():
+                self.assertTrue(torch.allclose(padded_quantizer.state_dict()[name], buffer, atol=1e-6), name)
+
+    def test_legacy_layout_rejects_unaligned_padding(self):
+        quantizer = VectorQuantizer(32, 16, 0.25, 'cpu')
+        with self.assertRaises(ValueError):
+            quantizer(torch.randn(2, 16, 32), PaddingMask.from_lengths(torch.tensor([32, 19]), 32))
+
+        configuration = self._configuration()
+        configuration.update({'vq_layout': 'legacy', 'pad_variable_lengths': True})
+        with self.assertRaises(ValueError):
+            ConvolutionalVQVAE(configuration, 'cpu')
+
+    def test_pad_collate(self):
+        batch = [
+            {'input_features': np.ones((5, 3), dtype=np.float32), 'speaker_id': np.array(1), 'wav_filename': 'a.wav'},
+            {'input_features': np.ones((2, 3), dtype=np.float32), 'speaker_id': np.array(2), 'wav_filename': 'b.wav'}
+        ]
+        collated = VCTKFeaturesStream.pad_collate(batch)
+
+        self.assertEqual((2, 5, 3), tuple(collated['input_features'].shape))
+        self.assertEqual(6, collated['input_features'][1].sum().item())
+        self.assertEqual([5, 2], collated['features_lengths'].tolist())
+        self.assertEqual(['a.wav', 'b.wav'], collated['wav_filename'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from modules.pairwise_distances import PairwiseDistances
+
+import unittest
+import itertools
+import torch
+
+
+class PairwiseDistancesTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(1234)
+        self._vectors = torch.randn(10, 16)
+        self._other_vectors = torch.randn(6, 16)
+
+    def test_combinations_match_itertools(self):
+        expected = torch.stack([torch.dist(a, b, 2) for a, b in itertools.combinations(self._vectors, r=2)])
+        unchunked = PairwiseDistances.combinations(self._vectors)
+        self.assertTrue(torch.allclose(unchunked, expected, atol=1e-5))
+
+        # Chunks of a single row, chunk sizes not dividing N (or N - 1), and a chunk of all the rows
+        for chunk_size in [1, 3, 4, 9, 10]:
+            chunked = PairwiseDistances.combinations(self._vectors, chunk_size)
+            self.assertEqual(unchunked.size(), chunked.size(), 'chunk_size={}'.format(chunk_size))
+            self.assertTrue(torch.allclose(chunked, unchunked, atol=1e-5), 'chunk_size={}'.format(chunk_size))
+
+    def test_product_matches_itertools(self):
+        expected = torch.stack([torch.dist(a, b, 2) for a, b in itertools.product(self._vectors, self._other_vectors)])
+        unchunked = PairwiseDistances.product(self._vectors, self._other_vectors)
+        self.assertTrue(torch.allclose(unchunked.view(-1), expected, atol=1e-5))
+
+        for chunk_size in [1, 3, 4, 9, 10]:
+            chunked = PairwiseDistances.product(self._vectors, self._other_vectors, chunk_size)
+            self.assertEqual((10, 6), tuple(chunked.size()))
+            self.assertTrue(torch.allclose(chunked, unchunked, atol=1e-5), 'chunk_size={}'.format(chunk_size))
+
+    def test_less_than_two_vectors(self):
+        self.assertEqual(0, PairwiseDistances.combinations(self._vectors[:1]).numel())
+
+    def test_compute_shapes(self):
+        encoding_distances, embedding_distances, frames_vs_embedding_distances = PairwiseDistances.compute(
+            self._vectors, self._other_vectors, 5, 2, chunk_size=3)
+        self.assertEqual((5, 9), tuple(encoding_distances.size()))
+        self.assertEqual((15,), tuple(embedding_distances.size()))
+        self.assertEqual((5, 2, 6), tuple(frames_vs_embedding_distances.size()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from experiments.post_training_quantization import PostTrainingQuantization
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from modules.weight_norm_folding import WeightNormFolding
+
+import unittest
+import json
+import tempfile
+import torch
+import torch.nn as nn
+import yaml
+
+
+class FakeDataStream(object):
+
+    def __init__(self, batches):
+        self.validation_loader = batches
+        self.speaker_dic = dict()
+        self.fields = None
+
+    def select_fields(self, fields):
+        self.fields = fields
+
+
+class PostTrainingQuantizationTest(unittest.TestCase):
+
+    def setUp(self):
+        with open('..' + os.sep + '..' + os.sep + 'configurations' + os.sep + 'vctk_features.yaml', 'r') as configuration_file:
+            self._configuration = yaml.safe_load(configuration_file)
+        self._configuration.update({'num_hiddens': 128, 'residual_channels': 64, 'embedding_dim': 16, 'use_kaiming_normal': True})
+
+        torch.manual_seed(1234)
+        self._model = WeightNormFolding.folded_copy(ConvolutionalVQVAE(self._configuration, 'cpu')).eval()
+        self._batches = [{
+            'input_features': torch.randn(2, 160, self._model.encoder.features_filters),
+            'output_features': torch.randn(2, 160, self._model.encoder.features_filters),
+            'speaker_id': torch.zeros(2, 1, dtype=torch.long)
+        } for _ in range(4)]
+        self._quantized_model = PostTrainingQuantization.quantize(
+            WeightNormFolding.folded_copy(self._model).eval(), self._batches[:2], {})
+
+    def test_quantize(self):
+        float_convolutions = [module for module in self._quantized_model.modules() if type(module) in [nn.Conv1d, nn.ConvTranspose1d]]
+        self.assertEqual(len(float_convolutions), 2) # The pre VQ convolution and the output layer of the decoder
+
+        report = PostTrainingQuantization.compare(self._model, self._quantized_model, self._batches[2:], {})
+        self.assertGreater(report['code_index_agreement'], 0.8)
+        self.assertAlmostEqual(report['int8_reconstruction_mse'], report['float_reconstruction_mse'], delta=0.01)
+        self.assertLess(report['int8_size_mb'], report['float_size_mb'] / 2)
+
+    def test_run_compares_to_the_float_model(self):
+        configuration = dict(self._configuration, quantization_calibration_batches=2, quantization_evaluation_batches=2)
+        data_stream = FakeDataStream(self._batches)
+        float_convolutions = [module for module in self._model.modules() if type(module) == nn.Conv1d]
+        with tempfile.TemporaryDirectory() as results_path:
+            report = PostTrainingQuantization(self._model, data_stream, configuration, results_path, 'test').run()
+            with open(results_path + os.sep + 'test_quantization-report.json', 'r') as report_file:
+                self.assertEqual(json.load(report_file), report)
+            quantized_model = PostTrainingQuantization.load(results_path + os.sep + 'test_int8-model.pth', configuration)
+
+        self.assertEqual(data_stream.fields, PostTrainingQuantization.DATA_FIELDS)
+        self.assertNotEqual(report['int8_reconstruction_mse'], report['float_reconstruction_mse'])
+        self.assertLess(report['int8_size_mb'], report['float_size_mb'] / 2)
+        # The model of the experiment isn't quantized
+        self.assertEqual([module for module in self._model.modules() if type(module) == nn.Conv1d], float_convolutions)
+        self.assertEqual(len([module for module in quantized_model.modules() if type(module) == nn.Conv1d]), 1)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as results_path:
+            model_path = results_path + os.sep + 'int8-model.pth'
+            PostTrainingQuantization.save(self._quantized_model, model_path)
+            loaded_model = PostTrainingQuantization.load(model_path, self._configuration)
+
+        data = self._batches[3]
+        with torch.no_grad():
+            expected_x, expected_vq_output = self._quantized_model(data['input_features'], {}, data['speaker_id'])
+            loaded_x, loaded_vq_output = loaded_model(data['input_features'], {}, data['speaker_id'])
+        self.assertTrue(torch.equal(loaded_x, expected_x))
+        self.assertTrue(torch.equal(loaded_vq_output.encoding_indices, expected_vq_output.encoding_indices))
+
+    def test_streaming_encoding(self):
+        inputs = self._batches[3]['input_features'].permute(0, 2, 1).contiguous()
+        encoder = self._quantized_model.encoder
+        with torch.no_grad():
+            expected = encoder(inputs)
+            state = encoder.init_state()
+            outputs = list()
+            for start in range(0, inputs.size(2), 37):
+                output, state = encoder.step(inputs[:, :, start:start + 37], state)
+                outputs.append(output)
+            outputs.append(encoder.flush(state))
+        self.assertTrue(torch.allclose(torch.cat(outputs, dim=2), expected, atol=1e-5))
+
+    def test_padded_encoding_and_decoding_match_unpadded(self):
+        encoder, decoder = self._quantized_model.encoder, self._quantized_model.decoder
+        lengths = torch.tensor([160, 107])
+        inputs = self._batches[3]['input_features'].permute(0, 2, 1).contiguous()
+        latents = torch.randn(2, 16, 81)
+        speaker_id = self._batches[3]['speaker_id']
+
+        with torch.no_grad():
+            encoded = encoder(inputs, lengths)
+            decoded = decoder(latents, None, speaker_id, encoder.output_lengths(lengths))
+            for b, length in enumerate(lengths.tolist()):
+                latent_length = encoder.output_lengths(length)
+                expected = encoder(inputs[b:b + 1, :, :length])
+                self.assertTrue(torch.allclose(encoded[b:b + 1, :, :latent_length], expected, atol=1e-5))
+
+                output_length = decoder.output_lengths(latent_length)
+                expected = decoder(latents[b:b + 1, :, :latent_length], None, speaker_id[b:b + 1])
+                self.assertTrue(torch.allclose(decoded[b:b + 1, :, :output_length], expected, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
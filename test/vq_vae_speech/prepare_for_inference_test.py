@@ -0,0 +1,89 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from modules.weight_norm_folding import WeightNormFolding
+
+import unittest
+import torch
+import yaml
+
+
+class PrepareForInferenceTest(unittest.TestCase):
+
+    def _configuration(self, use_kaiming_normal, use_speaker_conditioning):
+        with open('..' + os.sep + '..' + os.sep + 'configurations' + os.sep + 'vctk_features.yaml', 'r') as configuration_file:
+            configuration = yaml.safe_load(configuration_file)
+        configuration.update({'num_hiddens': 64, 'residual_channels': 32, 'embedding_dim': 16,
+            'use_kaiming_normal': use_kaiming_normal, 'use_speaker_conditioning': use_speaker_conditioning})
+        return configuration
+
+    def test_prepared_model_matches_training_graph(self):
+        for use_kaiming_normal in [False, True]:
+            for use_speaker_conditioning in [False, True]:
+                torch.manual_seed(1234)
+                model = ConvolutionalVQVAE(self._configuration(use_kaiming_normal, use_speaker_conditioning), 'cpu').eval()
+                inputs = torch.randn(2, 160, model.encoder.features_filters)
+                speaker_id = torch.tensor([[3], [7]])
+                with torch.no_grad():
+                    expected, expected_vq_output = model(inputs, None, speaker_id)
+
+                model.prepare_for_inference()
+                self.assertFalse(any(hasattr(module, 'weight_g') for module in model.modules()))
+                self.assertFalse(any(parameter.requires_grad for parameter in model.parameters()))
+
+                reconstructed, vq_output = model(inputs, None, speaker_id)
+                self.assertTrue(reconstructed.is_inference())
+                self.assertTrue(torch.allclose(reconstructed, expected, atol=1e-5))
+                self.assertTrue(torch.equal(vq_output.encoding_indices, expected_vq_output.encoding_indices))
+
+    def test_folded_copy_leaves_the_source_untouched(self):
+        torch.manual_seed(1234)
+        model = ConvolutionalVQVAE(self._configuration(True, False), 'cpu').eval()
+        inputs = torch.randn(2, 160, model.encoder.features_filters)
+        speaker_id = torch.tensor([[3], [7]])
+        with torch.no_grad():
+            expected, _ = model(inputs, None, speaker_id)
+        weights = {name: module.weight for name, module in model.named_modules() if hasattr(module, 'weight_g')}
+
+        folded_model = WeightNormFolding.folded_copy(model)
+        self.assertFalse(any(hasattr(module, 'weight_g') for module in folded_model.modules()))
+        for name, module in model.named_modules():
+            if name in weights:
+                self.assertIs(weights[name], module.weight)
+                self.assertIsNotNone(module.weight.grad_fn)
+
+        with torch.no_grad():
+            reconstructed, _ = folded_model(inputs, None, speaker_id)
+        self.assertTrue(torch.allclose(reconstructed, expected, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.deconvolutional_decoder import DeconvolutionalDecoder
+from modules.speaker_conditioning import SpeakerConditioning
+from modules.conv1d_builder import Conv1DBuilder
+
+import unittest
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class SpeakerConditioningTest(unittest.TestCase):
+
+    def test_folded_bias_matches_concatenated_embeddings(self):
+        torch.manual_seed(1234)
+        conv = nn.Conv1d(16, 32, kernel_size=3, padding=1)
+        speaker_conditioning = SpeakerConditioning(10, 40, 32)
+        speaker_id = torch.tensor([[3], [7]])
+
+        for length in [1, 2, 3, 4, 50]:
+            inputs = torch.randn(2, 16, length)
+            embedding = speaker_conditioning.embedding(speaker_id.view(-1)).unsqueeze(2).expand(-1, -1, length)
+            weight = torch.cat([conv.weight, speaker_conditioning._conv.weight], dim=1)
+            expected = F.conv1d(torch.cat([inputs, embedding], dim=1), weight, conv.bias, padding=1)
+
+            conditioned = speaker_conditioning(conv(inputs), speaker_id)
+            self.assertTrue(torch.allclose(conditioned, expected, atol=1e-6), 'length={}'.format(length))
+
+    def test_embeddings_are_learned(self):
+        torch.manual_seed(1234)
+        decoder = DeconvolutionalDecoder(16, 13, 32, 2, 16, False, False, 0.12, True, 'cpu', num_speakers=10)
+        self.assertIn('_speaker_conditioning._embedding.weight', dict(decoder.named_parameters()))
+
+        inputs = torch.randn(2, 16, 20)
+        speaker_id = torch.tensor([[3], [7]])
+        outputs = decoder(inputs, None, speaker_id)
+        self.assertTrue(torch.equal(outputs, decoder(inputs, None, speaker_id)))
+
+        outputs.sum().backward()
+        gradient = decoder._speaker_conditioning.embedding.weight.grad
+        self.assertTrue(gradient[[3, 7]].abs().sum() > 0)
+        self.assertEqual(gradient[[0, 1, 2, 4, 5, 6, 8, 9]].abs().sum().item(), 0)
+
+    def test_chunked_decoding_with_speaker_conditioning(self):
+        torch.manual_seed(1234)
+        decoder = DeconvolutionalDecoder(16, 13, 32, 2, 16, False, False, 0.12, True, 'cpu', num_speakers=10).eval()
+        inputs = torch.randn(2, 16, 50)
+        speaker_id = torch.tensor([[3], [7]])
+        with torch.no_grad():
+            expected = decoder(inputs, None, speaker_id)
+            decoded = decoder.decode_chunked(inputs, None, speaker_id, 8, windows_per_batch=3)
+        self.assertTrue(torch.allclose(decoded, expected, atol=1e-6))
+
+    def test_speaker_dic_must_match_the_embeddings(self):
+        decoder = DeconvolutionalDecoder(16, 13, 32, 2, 16, False, False, 0.12, True, 'cpu', num_speakers=10).eval()
+        inputs = torch.randn(2, 16, 20)
+        speaker_id = torch.tensor([[3], [7]])
+        with torch.no_grad():
+            decoder(inputs, {'p{}'.format(225 + i): i for i in range(10)}, speaker_id)
+            with self.assertRaises(ValueError):
+                decoder(inputs, {'p{}'.format(225 + i): i for i in range(109)}, speaker_id)
+            with self.assertRaises(ValueError):
+                decoder.decode_chunked(inputs, {'p225': 0}, speaker_id, 8)
+
+
+    def test_load_the_concatenated_speaker_channels(self):
+        inputs = torch.randn(2, 16, 20)
+        speaker_id = torch.tensor([[3], [7]])
+        for use_kaiming_normal in [False, True]:
+            torch.manual_seed(1234)
+            decoder = DeconvolutionalDecoder(16, 13, 32, 2, 16, use_kaiming_normal, False, 0.12, True, 'cpu', num_speakers=10)
+            embedding_weight = decoder._speaker_conditioning.embedding.weight.detach().clone()
+
+            # State dict of a decoder whose _conv_1 had 40 extra input channels, for the speaker embeddings
+            conv_1 = Conv1DBuilder.build(16 + 40, 32, kernel_size=3, padding=1, use_kaiming_normal=use_kaiming_normal)
+            state_dict = {name: value for name, value in decoder.state_dict().items()
+                if not name.startswith('_speaker_conditioning.') and not name.startswith('_conv_1.')}
+            state_dict.update({'_conv_1.' + name: value for name, value in conv_1.state_dict().items()})
+            decoder.load_state_dict(state_dict)
+
+            embedding = decoder._speaker_conditioning.embedding(speaker_id.view(-1)).unsqueeze(2).expand(-1, -1, 20)
+            with torch.no_grad():
+                expected = conv_1(torch.cat([inputs, embedding], dim=1))
+                conditioned = decoder._speaker_conditioning(decoder._conv_1(inputs), speaker_id)
+            self.assertTrue(torch.allclose(conditioned, expected, atol=1e-5), 'use_kaiming_normal={}'.format(use_kaiming_normal))
+            self.assertTrue(torch.equal(decoder._speaker_conditioning.embedding.weight, embedding_weight))
+
+            # The current state dicts are loaded as is
+            decoder.load_state_dict(decoder.state_dict())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from speech_utils.torch_speech_features import TorchSpeechFeatures
+from speech_utils.speech_features import SpeechFeatures
+
+from python_speech_features import delta
+import unittest
+import numpy as np
+import torch
+
+
+class TorchSpeechFeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        self._signals = np.random.RandomState(1234).randn(3, 7681)
+
+    def test_batched_features_match_python_speech_features(self):
+        # Including signals shorter than a frame, and than two frames
+        for length in [7681, 7000, 401, 300]:
+            signals = self._signals[:, :length]
+            for name in ['mfcc', 'logfbank']:
+                expected = np.stack([SpeechFeatures.features_from_name(name, signal, 16000, 13) for signal in signals])
+                features = getattr(TorchSpeechFeatures, name)(torch.from_numpy(signals), 16000, 13)
+                self.assertEqual(torch.float64, features.dtype)
+                self.assertEqual(expected.shape, tuple(features.shape))
+                np.testing.assert_allclose(expected, features.numpy(), rtol=1e-9, atol=1e-9)
+
+    def test_float32_features(self):
+        expected = np.stack([SpeechFeatures.mfcc(signal, 16000, 13) for signal in self._signals])
+        features = TorchSpeechFeatures.mfcc(torch.from_numpy(self._signals).float(), 16000, 13)
+        self.assertEqual(torch.float32, features.dtype)
+        np.testing.assert_allclose(expected, features.numpy(), rtol=1e-4, atol=1e-3)
+
+    def test_delta_matches_python_speech_features(self):
+        features = np.random.RandomState(1234).randn(2, 47, 13)
+        expected = np.stack([delta(feature, 2) for feature in features])
+        np.testing.assert_allclose(expected, TorchSpeechFeatures.delta(torch.from_numpy(features), 2).numpy())
+
+    def test_features_from_name_match_python_speech_features(self):
+        # A 1-D signal, and a (1, 1, T, 1) tensor as in the features export
+        for signal in [self._signals[0], torch.from_numpy(self._signals[:1]).view(1, 1, -1, 1)]:
+            for name in ['mfcc', 'logfbank']:
+                np.testing.assert_allclose(SpeechFeatures.features_from_name(name, signal, 16000, 13),
+                    SpeechFeatures.features_from_name('torch_' + name, signal, 16000, 13), rtol=1e-9, atol=1e-9)
+
+
+    def test_batch_features_from_name(self):
+        # Signals of different lengths, computed in a batch per length
+        signals = [self._signals[0], self._signals[1, :7000], self._signals[2]]
+        for name in ['mfcc', 'logfbank']:
+            features = SpeechFeatures.batch_features_from_name('torch_' + name, signals, 16000, 13)
+            for signal, signal_features in zip(signals, features):
+                np.testing.assert_allclose(SpeechFeatures.features_from_name(name, signal, 16000, 13),
+                    signal_features, rtol=1e-9, atol=1e-9)
+
+    def test_frames_longer_than_the_fft_size(self):
+        # Frames of 1200 samples at 48 kHz
+        with self.assertRaises(ValueError):
+            TorchSpeechFeatures.power_spectrum(torch.from_numpy(self._signals), 48000)
+
+if __name__ == '__main__':
+    unittest.main()
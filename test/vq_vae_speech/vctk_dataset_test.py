@@ -0,0 +1,65 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from dataset.vctk_dataset import VCTKDataset
+
+import unittest
+import numpy as np
+import random
+import soundfile
+import tempfile
+
+
+class VCTKDatasetTest(unittest.TestCase):
+
+    def _dataset(self, path, length):
+        os.makedirs(os.path.join(path, 'VCTK-Corpus', 'wav48', 'p225'))
+        wav_filename = os.path.join(path, 'VCTK-Corpus', 'wav48', 'p225', 'p225_001.wav')
+        soundfile.write(wav_filename, 0.5 * np.sin(np.arange(48000) * 0.05), 48000)
+        configuration = {'sampling_rate': 16000, 'res_type': 'soxr_hq', 'top_db': 20, 'length': length,
+            'quantize': 256, 'metadata_index_path': None}
+        return VCTKDataset([wav_filename], {'p225': 0}, dict(), configuration)
+
+    def test_preprocessed_length(self):
+        for length in [7680, 20000, None]:
+            with tempfile.TemporaryDirectory() as path:
+                random.seed(1234)
+                audio, one_hot, _, quantized, _, _, _, _, preprocessed_length, _ = self._dataset(path, length)[0]
+
+            # The whole utterance is kept without length
+            expected_length = 16000 - 1 if length is None else length
+            self.assertEqual(expected_length, preprocessed_length)
+            self.assertEqual((1, expected_length + 1, 1), audio.shape)
+            self.assertEqual((256, expected_length, 1), one_hot.shape)
+            self.assertEqual((expected_length, 1), quantized.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
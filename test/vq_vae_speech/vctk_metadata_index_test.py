@@ -0,0 +1,122 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from dataset.vctk_metadata_index import VCTKMetadataIndex
+from dataset.vctk_dataset import VCTKDataset
+
+import unittest
+import librosa
+import numpy as np
+import random
+import soundfile
+import tempfile
+import textgrid
+
+
+class VCTKMetadataIndexTest(unittest.TestCase):
+
+    def _make_corpus(self, path):
+        """
+        A corpus of two utterances of 1 second at 48 kHz, with leading silences,
+        the first one with a phonemes alignment.
+        """
+
+        rng = np.random.RandomState(1234)
+        wav_filenames = list()
+        for utterance_key in ['p225_001', 'p226_001']:
+            speaker = utterance_key.split('_')[0]
+            os.makedirs(os.path.join(path, 'VCTK-Corpus', 'wav48', speaker), exist_ok=True)
+            audio = np.concatenate([1e-4 * rng.randn(12000), 0.5 * np.sin(np.arange(36000) * 0.05)])
+            wav_filename = os.path.join(path, 'VCTK-Corpus', 'wav48', speaker, utterance_key + '.wav')
+            soundfile.write(wav_filename, audio, 48000)
+            wav_filenames.append(wav_filename)
+
+        os.makedirs(os.path.join(path, 'VCTK-Corpus', 'phonemes', 'p225'))
+        tg = textgrid.TextGrid(maxTime=1.0)
+        for name in ['words', 'phones']:
+            tier = textgrid.IntervalTier(name, maxTime=1.0)
+            tier.add(0.0, 0.15, 'sil')
+            tier.add(0.15, 0.25, 'sil')
+            tier.add(0.25, 0.6, 'AH0')
+            tier.add(0.6, 1.0, 'B')
+            tg.append(tier)
+        tg.write(os.path.join(path, 'VCTK-Corpus', 'phonemes', 'p225', 'p225_001.TextGrid'))
+
+        return wav_filenames
+
+    def _configuration(self, metadata_index_path=None):
+        return {'sampling_rate': 16000, 'res_type': 'soxr_hq', 'top_db': 20, 'length': 7680, 'quantize': 256,
+            'metadata_index_path': metadata_index_path}
+
+    def test_index_matches_the_parsed_metadata(self):
+        with tempfile.TemporaryDirectory() as path:
+            wav_filenames = self._make_corpus(path)
+            index = VCTKMetadataIndex.build(wav_filenames, {'p225': 0, 'p226': 1}, 16000, 'soxr_hq', [20, 40],
+                workers_number=1)
+            index.save(path + os.sep + 'index.pickle')
+            index = VCTKMetadataIndex.load(path + os.sep + 'index.pickle')
+            self.assertIs(index, VCTKMetadataIndex.load(path + os.sep + 'index.pickle'))
+
+            self.assertEqual(2, len(index))
+            metadata = index.get(wav_filenames[0])
+            self.assertEqual((0, 48000, 16000), (metadata['speaker_id'], metadata['raw_length'], metadata['resampled_length']))
+            audio, _ = librosa.load(wav_filenames[0], sr=16000, res_type='soxr_hq')
+            for top_db in [20, 40]:
+                self.assertEqual(tuple(librosa.effects.trim(audio, top_db=top_db)[1]),
+                    index.trimming_indices(wav_filenames[0], top_db, 16000, 'soxr_hq'))
+            self.assertIsNone(index.trimming_indices(wav_filenames[0], 30, 16000, 'soxr_hq'))
+            self.assertIsNone(index.trimming_indices(wav_filenames[0], 20, 22050, 'soxr_hq'))
+
+            self.assertAlmostEqual(0.25, index.leading_silence(wav_filenames[0]))
+            self.assertEqual(['sil', 'sil', 'AH0', 'B'], [interval.mark for interval in index.phonemes_intervals(wav_filenames[0])])
+            self.assertEqual(1, index.get(wav_filenames[1])['speaker_id'])
+            self.assertIsNone(index.leading_silence(wav_filenames[1]))
+            self.assertIsNone(index.phonemes_intervals(wav_filenames[1]))
+
+    def test_indexed_dataset_items_match_parsed_ones(self):
+        with tempfile.TemporaryDirectory() as path:
+            wav_filenames = self._make_corpus(path)
+            VCTKMetadataIndex.build(wav_filenames, {'p225': 0, 'p226': 1}, 16000, 'soxr_hq', [20],
+                workers_number=1).save(path + os.sep + 'index.pickle')
+
+            dataset = VCTKDataset(wav_filenames, {'p225': 0, 'p226': 1}, dict(), self._configuration())
+            indexed_dataset = VCTKDataset(wav_filenames, {'p225': 0, 'p226': 1}, dict(),
+                self._configuration(path + os.sep + 'index.pickle'))
+            for i in range(len(wav_filenames)):
+                random.seed(i)
+                item = dataset[i]
+                random.seed(i)
+                indexed_item = indexed_dataset[i]
+                for value, indexed_value in zip(item, indexed_item):
+                    np.testing.assert_array_equal(value, indexed_value)
+
+
+if __name__ == '__main__':
+    unittest.main()
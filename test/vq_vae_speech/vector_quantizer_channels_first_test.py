@@ -0,0 +1,123 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from models.vector_quantizer import VectorQuantizer
+from models.vector_quantizer_ema import VectorQuantizerEMA
+from models.vector_quantizer_grouped import VectorQuantizerGrouped
+from models.vq_tokenizer import VQTokenizer
+from modules.codebook_search import CodebookSearch
+from modules.padding_mask import PaddingMask
+
+import unittest
+import torch
+import yaml
+
+
+class VectorQuantizerChannelsFirstTest(unittest.TestCase):
+
+    def _frames(self, inputs):
+        # One row per frame, in batch major order
+        return inputs.transpose(1, 2).reshape(-1, inputs.size(1))
+
+    def test_frames_are_quantized_in_place(self):
+        torch.manual_seed(1234)
+        quantizer = VectorQuantizer(64, 16, 0.25, 'cpu', channels_first=True)
+        inputs = torch.randn(3, 16, 50, requires_grad=True)
+        output = quantizer(inputs)
+
+        frames = self._frames(inputs.detach())
+        expected_indices = torch.argmin(torch.cdist(frames, quantizer.embedding.weight.detach()), dim=1)
+        expected_quantized = quantizer.embedding.weight.detach()[expected_indices].view(3, 50, 16).transpose(1, 2)
+        self.assertTrue(torch.equal(output.encoding_indices.view(-1), expected_indices))
+        self.assertTrue(torch.allclose(output.quantized, expected_quantized, atol=1e-6))
+        self.assertTrue(torch.allclose(output.vq_loss, 1.25 * torch.mean((expected_quantized - inputs.detach())**2)))
+        self.assertEqual((3, 50, 64), tuple(output.distances.shape))
+        self.assertTrue(torch.equal(output.concatenated_quantized, self._frames(output.quantized.detach())))
+
+        output.vq_loss.backward()
+        self.assertIsNotNone(inputs.grad)
+        self.assertIsNotNone(quantizer.embedding.weight.grad)
+
+    def test_ema_statistics(self):
+        torch.manual_seed(1234)
+        quantizer = VectorQuantizerEMA(64, 16, 0.25, 0.99, 'cpu', channels_first=True)
+        expected_quantizer = VectorQuantizerEMA(64, 16, 0.25, 0.99, 'cpu')
+        expected_quantizer.load_state_dict(quantizer.state_dict())
+
+        inputs = torch.randn(3, 16, 50)
+        lengths = torch.tensor([50, 31, 7])
+        mask = PaddingMask.from_lengths(lengths, 50)
+        output = quantizer(inputs, mask)
+
+        valid_frames = self._frames(inputs)[mask.view(-1).bool()]
+        valid_indices = output.encoding_indices.view(-1)[mask.view(-1).bool()]
+        expected_quantizer._update_ema(valid_frames, valid_indices, torch.bincount(valid_indices, minlength=64))
+        for name, buffer in expected_quantizer.state_dict().items():
+            self.assertTrue(torch.allclose(quantizer.state_dict()[name], buffer, atol=1e-6), name)
+        self.assertEqual(0, torch.count_nonzero(output.quantized[2, :, 7:]).item())
+
+    def test_tiled_search(self):
+        torch.manual_seed(1234)
+        inputs = torch.randn(4, 16, 100)
+        weight = torch.randn(256, 16)
+        expected = CodebookSearch().search_channels_first(inputs, weight)
+        self.assertTrue(torch.equal(CodebookSearch(tile_size=64).search_channels_first(inputs, weight), expected))
+        flat_indices, _ = CodebookSearch().search(self._frames(inputs), weight)
+        self.assertTrue(torch.equal(expected.view(-1), flat_indices))
+
+    def test_grouped(self):
+        torch.manual_seed(1234)
+        quantizer = VectorQuantizerGrouped(16, 16, 0.25, 2, 'cpu', channels_first=True)
+        inputs = torch.randn(2, 16, 30)
+        output = quantizer(inputs)
+        group_indices = quantizer.split_indices(output.encoding_indices)
+        for group, group_quantizer in enumerate(quantizer.quantizers):
+            frames = self._frames(inputs[:, group * 8:(group + 1) * 8])
+            expected = torch.argmin(torch.cdist(frames, group_quantizer.embedding.weight.detach()), dim=1)
+            self.assertTrue(torch.equal(group_indices[:, group], expected))
+
+    def test_model_and_tokenizer(self):
+        with open('..' + os.sep + '..' + os.sep + 'configurations' + os.sep + 'vctk_features.yaml', 'r') as configuration_file:
+            configuration = yaml.safe_load(configuration_file)
+        configuration.update({'num_hiddens': 64, 'residual_channels': 32, 'embedding_dim': 16,
+            'vq_layout': 'channels_first'})
+        torch.manual_seed(1234)
+        model = ConvolutionalVQVAE(configuration, 'cpu').eval()
+        features = torch.randn(2, 40, model.encoder.features_filters)
+        with torch.no_grad():
+            reconstructed_x, vq_output = model(features, None, torch.tensor([[3], [7]]))
+            encoding_indices = VQTokenizer.from_model(model)(features)
+
+        self.assertEqual(40, reconstructed_x.size(2))
+        self.assertTrue(torch.equal(encoding_indices, vq_output.encoding_indices.view(2, -1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
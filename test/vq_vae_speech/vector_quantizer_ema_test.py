@@ -0,0 +1,91 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.vector_quantizer_ema import VectorQuantizerEMA
+
+import unittest
+import torch
+
+
+class VectorQuantizerEMATest(unittest.TestCase):
+
+    def _reference_update(self, ema_cluster_size, ema_w, flat_input, encoding_indices, decay, epsilon):
+        # Out of place EMA update, as previously computed in VectorQuantizerEMA.forward()
+        num_embeddings = ema_w.size(0)
+        encodings = torch.zeros(flat_input.size(0), num_embeddings)
+        encodings.scatter_(1, encoding_indices.unsqueeze(1), 1)
+
+        ema_cluster_size = ema_cluster_size * decay + (1 - decay) * torch.sum(encodings, 0)
+        n = torch.sum(ema_cluster_size)
+        ema_cluster_size = (ema_cluster_size + epsilon) / (n + num_embeddings * epsilon) * n
+
+        dw = torch.matmul(encodings.t(), flat_input)
+        ema_w = ema_w * decay + (1 - decay) * dw
+
+        return ema_cluster_size, ema_w, ema_w / ema_cluster_size.unsqueeze(1)
+
+    def test_ema_update(self):
+        torch.manual_seed(1234)
+        num_embeddings, embedding_dim, decay, epsilon = 44, 64, 0.99, 1e-5
+        vq = VectorQuantizerEMA(num_embeddings, embedding_dim, 0.25, decay, 'cpu', epsilon=epsilon)
+        vq.train()
+
+        ema_cluster_size = vq._ema_cluster_size.clone()
+        ema_w = vq._ema_w.clone()
+        buffers = [vq._ema_cluster_size.data_ptr(), vq._ema_w.data_ptr(), vq.embedding.weight.data_ptr()]
+
+        for _ in range(3):
+            inputs = torch.randn(2, embedding_dim, 32)
+            flat_input = inputs.permute(1, 2, 0).contiguous().view(-1, embedding_dim)
+            encoding_indices = vq(inputs).encoding_indices.view(-1)
+
+            ema_cluster_size, ema_w, weight = self._reference_update(ema_cluster_size, ema_w,
+                flat_input, encoding_indices, decay, epsilon)
+
+            self.assertTrue(torch.allclose(vq._ema_cluster_size, ema_cluster_size, rtol=1e-5, atol=1e-6))
+            self.assertTrue(torch.allclose(vq._ema_w, ema_w, rtol=1e-5, atol=1e-6))
+            self.assertTrue(torch.allclose(vq.embedding.weight, weight, rtol=1e-5, atol=1e-5))
+
+        # The update is in-place, and the codebook isn't exposed to the optimizer
+        self.assertEqual(buffers, [vq._ema_cluster_size.data_ptr(), vq._ema_w.data_ptr(), vq.embedding.weight.data_ptr()])
+        self.assertEqual(len(list(vq.parameters())), 0)
+        self.assertEqual(set(vq.state_dict().keys()), {'_ema_cluster_size', '_ema_w', '_embedding.weight'})
+
+    def test_no_update_in_eval(self):
+        torch.manual_seed(1234)
+        vq = VectorQuantizerEMA(29, 64, 0.25, 0.99, 'cpu')
+        vq.eval()
+        weight = vq.embedding.weight.clone()
+        vq(torch.randn(1, 64, 16))
+        self.assertTrue(torch.equal(vq.embedding.weight, weight))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from models.vector_quantizer_ema import VectorQuantizerEMA
+from models.vector_quantizer_grouped import VectorQuantizerGrouped
+
+import unittest
+import collections
+import math
+import torch
+import yaml
+
+
+class VectorQuantizerGroupedTest(unittest.TestCase):
+
+    def _perplexity(self, indices):
+        counts = collections.Counter(indices)
+        total = sum(counts.values())
+        return math.exp(-sum(count / total * math.log(count / total) for count in counts.values()))
+
+    def _inputs(self, vq, group_indices):
+        """
+        Inputs whose flattened rows are the codebook vectors of group_indices
+        (N, num_groups), in the legacy layout of the groups.
+        """
+
+        group_inputs = list()
+        for group, quantizer in enumerate(vq.quantizers):
+            rows = quantizer.embedding.weight.detach()[group_indices[:, group]]
+            group_dim = rows.size(1)
+            # Inverse of the permute(1, 2, 0) flattening of a batch of one sequence
+            group_inputs.append(rows.reshape(group_dim, -1, 1).permute(2, 0, 1))
+        return torch.cat(group_inputs, dim=1)
+
+    def test_join_and_split_indices(self):
+        vq = VectorQuantizerGrouped(5, 12, 0.25, 3, 'cpu')
+        group_indices = torch.randint(0, 5, (100, 3))
+        joint_indices = vq.join_indices(group_indices)
+
+        # Mixed radix, the first group being the most significant digit
+        self.assertEqual((100, 1), tuple(joint_indices.shape))
+        self.assertTrue(torch.equal(joint_indices.view(-1), group_indices[:, 0] * 25 + group_indices[:, 1] * 5 + group_indices[:, 2]))
+        self.assertTrue(torch.equal(vq.split_indices(joint_indices), group_indices))
+        all_indices = torch.arange(125).view(-1, 1)
+        self.assertTrue(torch.equal(vq.join_indices(vq.split_indices(all_indices)), all_indices))
+
+    def test_perplexities(self):
+        torch.manual_seed(1234)
+        vq = VectorQuantizerGrouped(8, 8, 0.25, 2, 'cpu').eval()
+        group_indices = torch.stack([torch.randint(0, 3, (64,)), torch.randint(0, 8, (64,))], dim=1)
+        expected_joint = self._perplexity((group_indices[:, 0] * 8 + group_indices[:, 1]).tolist())
+
+        # With the histogram of the joint codes, and with the counts of the sorted joint indices
+        for max_joint_histogram_size in [VectorQuantizerGrouped.max_joint_histogram_size, 0]:
+            vq.max_joint_histogram_size = max_joint_histogram_size
+            output = vq(self._inputs(vq, group_indices))
+            self.assertTrue(torch.equal(vq.split_indices(output.encoding_indices), group_indices))
+            self.assertAlmostEqual(expected_joint, output.perplexity.item(), places=4)
+            for group in range(2):
+                self.assertAlmostEqual(self._perplexity(group_indices[:, group].tolist()),
+                    float(output.losses['perplexity_group_{}'.format(group)]), places=4)
+
+    def test_embedding_is_copied_once_per_codebook_update(self):
+        torch.manual_seed(1234)
+        vq = VectorQuantizerGrouped(8, 8, 0.25, 2, 'cpu')
+        embedding = vq.embedding
+        self.assertEqual((16, 4), tuple(embedding.weight.shape))
+        self.assertIs(embedding, vq.embedding)
+        self.assertNotIn('_embedding_cache', ''.join(vq.state_dict().keys()))
+
+        with torch.no_grad():
+            vq.quantizers[1].embedding.weight.add_(1)
+        self.assertIsNot(embedding, vq.embedding)
+        self.assertTrue(torch.equal(vq.embedding.weight[8:], vq.quantizers[1].embedding.weight))
+
+    def test_model_selects_the_grouped_quantizer(self):
+        with open('..' + os.sep + '..' + os.sep + 'configurations' + os.sep + 'vctk_features.yaml', 'r') as configuration_file:
+            configuration = yaml.safe_load(configuration_file)
+        configuration.update({'num_hiddens': 64, 'residual_channels': 32, 'embedding_dim': 16, 'decay': 0.99})
+
+        self.assertIsInstance(ConvolutionalVQVAE(dict(configuration, num_groups=1), 'cpu').vq, VectorQuantizerEMA)
+        vq = ConvolutionalVQVAE(dict(configuration, num_groups=4), 'cpu').vq
+        self.assertIsInstance(vq, VectorQuantizerGrouped)
+        self.assertEqual(4, vq.num_groups)
+        self.assertTrue(all(isinstance(quantizer, VectorQuantizerEMA) for quantizer in vq.quantizers))
+
+
+if __name__ == '__main__':
+    unittest.main()
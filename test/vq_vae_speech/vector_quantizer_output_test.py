@@ -0,0 +1,68 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.vector_quantizer import VectorQuantizer
+from models.vector_quantizer_grouped import VectorQuantizerGrouped
+
+import unittest
+import torch
+
+
+class VectorQuantizerOutputTest(unittest.TestCase):
+
+    def test_diagnostics_are_lazy(self):
+        torch.manual_seed(1234)
+        vq = VectorQuantizer(32, 8, 0.25, 'cpu').eval()
+        vq_output = vq(torch.randn(2, 8, 10))
+        self.assertEqual(len(vq_output._values), 0)
+
+        encodings = vq_output.encodings
+        self.assertEqual(encodings.shape, (2, 10, 32))
+        self.assertTrue(torch.equal(encodings.view(-1, 32).argmax(dim=1), vq_output.encoding_indices.view(-1)))
+        self.assertIs(vq_output.encodings, encodings)
+        self.assertEqual(list(vq_output._values.keys()), ['encodings'])
+
+        self.assertTrue(torch.equal(vq_output.distances.view(-1, 32).argmin(dim=1), vq_output.encoding_indices.view(-1)))
+        self.assertEqual(vq_output.concatenated_quantized.shape, (20, 8))
+
+    def test_grouped_diagnostics_are_concatenated(self):
+        torch.manual_seed(1234)
+        vq = VectorQuantizerGrouped(16, 8, 0.25, 2, 'cpu').eval()
+        vq_output = vq(torch.randn(2, 8, 10))
+
+        self.assertEqual(vq_output.quantized.shape, (2, 8, 10))
+        self.assertEqual(vq_output.encodings.shape, (2, 10, 32))
+        self.assertEqual(vq_output.distances.shape, (2, 10, 32))
+        self.assertEqual(vq_output.concatenated_quantized.shape, (20, 8))
+        self.assertEqual(vq_output.encoding_indices.shape, (20, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+ #####################################################################################
+ # MIT License                                                                       #
+ #                                                                                   #
+ # Copyright (C) 2019 Charly Lamothe                                                 #
+ #                                                                                   #
+ # This file is part of VQ-VAE-Speech.                                               #
+ #                                                                                   #
+ #   Permission is hereby granted, free of charge, to any person obtaining a copy    #
+ #   of this software and associated documentation files (the "Software"), to deal   #
+ #   in the Software without restriction, including without limitation the rights    #
+ #   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+ #   copies of the Software, and to permit persons to whom the Software is           #
+ #   furnished to do so, subject to the following conditions:                        #
+ #                                                                                   #
+ #   The above copyright notice and this permission notice shall be included in all  #
+ #   copies or substantial portions of the Software.                                 #
+ #                                                                                   #
+ #   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+ #   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+ #   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+ #   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+ #   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+ #   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+ #   SOFTWARE.                                                                       #
+ #####################################################################################
+
+import os
+import sys
+sys.path.append('..' + os.sep + '..' + os.sep + 'src')
+
+from models.convolutional_vq_vae import ConvolutionalVQVAE
+from models.vq_tokenizer import VQTokenizer
+
+import unittest
+import tempfile
+import torch
+import yaml
+
+
+class VQTokenizerTest(unittest.TestCase):
+
+    def _model(self, **kwargs):
+        with open('..' + os.sep + '..' + os.sep + 'configurations' + os.sep + 'vctk_features.yaml', 'r') as configuration_file:
+            configuration = yaml.safe_load(configuration_file)
+        configuration.update({'num_hiddens': 64, 'residual_channels': 32, 'embedding_dim': 16}, **kwargs)
+        torch.manual_seed(1234)
+        return ConvolutionalVQVAE(configuration, 'cpu').eval()
+
+    def test_export_and_load(self):
+        for num_groups in [1, 2]:
+            model = self._model(num_groups=num_groups)
+            features = torch.randn(2, 40, model.encoder.features_filters)
+            with tempfile.TemporaryDirectory() as path:
+                tokenizer_path = path + os.sep + 'vq-tokenizer.pt'
+                VQTokenizer.export(model, tokenizer_path)
+                tokenizer, configuration = VQTokenizer.load(tokenizer_path)
+
+            with torch.no_grad():
+                _, vq_output = model(features, None, torch.tensor([[3], [7]]))
+                # The traced tokenizer isn't specialized to the length of the example
+                encoding_indices = tokenizer(features)
+
+            self.assertTrue(torch.equal(encoding_indices, vq_output.encoding_indices.view(2, -1)), 'num_groups={}'.format(num_groups))
+            self.assertEqual(configuration, {
+                'num_embeddings': 29,
+                'num_groups': num_groups,
+                'embedding_dim': 16,
+                'vq_layout': 'legacy',
+                'features_filters': model.encoder.features_filters
+            })
+
+
+if __name__ == '__main__':
+    unittest.main()